@@ -0,0 +1,106 @@
+"""
+Database profiles for settings.DATABASES, picked with DB_PROFILE
+(environment or .env):
+
+- "sqlite" (default): the development database file, as before.
+- "sqlite-wal": SQLite in write-ahead-log mode for single-node
+  deployments. Readers no longer wait for writers, and transactions take
+  the write lock when they begin (BEGIN IMMEDIATE), so concurrent writers
+  queue on the busy timeout instead of failing to upgrade a read lock.
+- "postgres": PostgreSQL through psycopg. Connections are kept open for
+  DB_CONN_MAX_AGE seconds and checked before reuse. With DB_POOL=True,
+  Django's connection pool (psycopg_pool) is used instead of persistent
+  connections.
+
+DB_REPLICAS adds read replicas of the chosen database as the aliases
+replica1, replica2, ... (see core/routers.py for what reads from them).
+"""
+
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
+
+
+def sqlite(base_dir, wal=False):
+    database = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": config("DB_NAME", default=str(base_dir / "db.sqlite3")),
+    }
+    if wal:
+        database["OPTIONS"] = {
+            # Seconds a writer waits for the lock before "database is locked".
+            "timeout": config("DB_TIMEOUT", default=20, cast=int),
+            "transaction_mode": "IMMEDIATE",
+            # In WAL mode NORMAL survives application crashes; a power loss
+            # can drop the last transactions but not corrupt the file.
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+        }
+    return database
+
+
+def postgres(base_dir):
+    database = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": config("DB_NAME", default="mini_leave"),
+        "USER": config("DB_USER", default="postgres"),
+        "PASSWORD": config("DB_PASSWORD", default=""),
+        "HOST": config("DB_HOST", default="localhost"),
+        "PORT": config("DB_PORT", default="5432"),
+        "CONN_MAX_AGE": config("DB_CONN_MAX_AGE", default=60, cast=int),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "connect_timeout": config("DB_CONNECT_TIMEOUT", default=5, cast=int),
+        },
+    }
+    if config("DB_POOL", default=False, cast=bool):
+        # The pool replaces persistent connections (Django refuses both).
+        database["CONN_MAX_AGE"] = 0
+        database["OPTIONS"]["pool"] = {
+            "min_size": config("DB_POOL_MIN_SIZE", default=2, cast=int),
+            "max_size": config("DB_POOL_MAX_SIZE", default=10, cast=int),
+            # Seconds a request waits for a free connection.
+            "timeout": config("DB_POOL_TIMEOUT", default=10, cast=int),
+        }
+    return database
+
+
+PROFILES = {
+    "sqlite": sqlite,
+    "sqlite-wal": lambda base_dir: sqlite(base_dir, wal=True),
+    "postgres": postgres,
+}
+
+
+def default_database(base_dir):
+    profile = config("DB_PROFILE", default="sqlite")
+    try:
+        build = PROFILES[profile]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Unknown DB_PROFILE {profile!r}; use one of: {', '.join(PROFILES)}"
+        )
+    return build(base_dir)
+
+
+def replica_databases(primary):
+    """
+    Aliases for DB_REPLICAS: a comma-separated list of SQLite files, or of
+    PostgreSQL "host" / "host:port" entries, holding copies of `primary`.
+    Each replica otherwise uses the primary's settings, and stands for the
+    primary in tests (TEST MIRROR) rather than getting a database of its own.
+    """
+    databases = {}
+    locations = config("DB_REPLICAS", default="", cast=Csv())
+    for number, location in enumerate(locations, start=1):
+        replica = {
+            **primary,
+            "OPTIONS": dict(primary.get("OPTIONS", {})),
+            "TEST": {"MIRROR": "default"},
+        }
+        if primary["ENGINE"] == "django.db.backends.sqlite3":
+            replica["NAME"] = location
+        else:
+            host, _, port = location.partition(":")
+            replica["HOST"] = host
+            replica["PORT"] = port or primary["PORT"]
+        databases[f"replica{number}"] = replica
+    return databases
@@ -11,6 +11,10 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+
+from decouple import config
+
+from .databases import default_database, replica_databases
  
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,10 +49,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.RouteMetricsMiddleware",
+    "core.middleware.RequestMetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.ReplicaStickinessMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -71,16 +78,34 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "MiniLeaveBackend.wsgi.application"
+ASGI_APPLICATION = "MiniLeaveBackend.asgi.application"
+
+# Serve the hot leave endpoints (apply, list, approve, balance) from the
+# async views in core/async_views.py. Only useful under an ASGI server.
+LEAVE_API_ASYNC = config("LEAVE_API_ASYNC", default=False, cast=bool)
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DB_PROFILE picks "sqlite" (default), "sqlite-wal" or "postgres"; see
+# MiniLeaveBackend/databases.py for the DB_* variables each one reads.
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": default_database(BASE_DIR),
+}
+# DB_REPLICAS adds read replicas as replica1, replica2, ...
+DATABASES.update(replica_databases(DATABASES["default"]))
+
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+
+# Reads of the listing and reporting endpoints go to a replica (see
+# core/routers.py), except for users who wrote something in the last
+# STICKY_SECONDS; keep it above the replication lag. With several worker
+# processes CACHE_ALIAS must be a shared cache.
+READ_REPLICAS = {
+    "ALIASES": [alias for alias in DATABASES if alias != "default"],
+    "STICKY_SECONDS": config("DB_REPLICA_STICKY_SECONDS", default=5, cast=int),
+    "CACHE_ALIAS": "default",
 }
 
 
@@ -128,7 +153,59 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "core.User"
 
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication"
-    ],
+    "DEFAULT_AUTHENTICATION_CLASSES": ["core.authentication.CachedTokenAuthentication"],
+}
+
+# Cache in front of auth token lookups (see core/authentication.py).
+# BACKEND "local" is a per-process LRU; "django" uses CACHE_ALIAS so that
+# logout/delete invalidations are seen by every worker immediately.
+TOKEN_AUTH_CACHE = {
+    "BACKEND": "local",
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": 60,
+    "MAX_ENTRIES": 10_000,
+}
+
+# Per-request query/timing instrumentation (see core/instrumentation.py).
+# Requests running more than QUERY_BUDGET queries get an
+# X-Query-Budget-Exceeded header and a warning in the "core.middleware" log.
+REQUEST_METRICS = {
+    "ENABLED": config("REQUEST_METRICS", default=True, cast=bool),
+    "QUERY_BUDGET": config("QUERY_BUDGET", default=10, cast=int),
+    "SERVER_TIMING": True,
+}
+
+# Prometheus metrics at /api/metrics/ (see core/metrics.py). With several
+# worker processes set METRICS_DIR to a directory they all can write to;
+# each keeps a snapshot file there and a scrape sums them all.
+METRICS = {
+    "DIR": config("METRICS_DIR", default=None),
+    "FLUSH_INTERVAL": 1.0,
+}
+
+# Working-day calendar (see core/workdays.py): leave is charged for the
+# WORK_WEEK days (0 = Monday) that are not Holiday rows. Holiday edits
+# reach other worker processes within CACHE_TIMEOUT seconds.
+LEAVE_CALENDAR = {
+    "WORK_WEEK": [0, 1, 2, 3, 4],
+    "CACHE_TIMEOUT": 300,
+}
+
+# Background jobs (see core/tasks.py), run by `manage.py run_worker`.
+# With EAGER the side effects run inline instead, for setups without a
+# worker.
+BACKGROUND_TASKS = {
+    "EAGER": config("TASKS_EAGER", default=False, cast=bool),
+    "MAX_ATTEMPTS": 5,
+    "RETRY_BACKOFF": 5,
+}
+
+# Server-sent events stream at /api/leave/events/ (see core/events.py).
+# The default broker is per process: with several ASGI workers, point
+# BROKER at an implementation backed by a shared channel.
+LEAVE_EVENTS = {
+    "BROKER": config("LEAVE_EVENTS_BROKER", default="core.events.InProcessBroker"),
+    "HEARTBEAT": 15,
+    "QUEUE_SIZE": 256,
+    "HISTORY": 1000,
 }
@@ -0,0 +1,160 @@
+"""
+Monthly leave accrual.
+
+Each AccrualPolicy grants days_per_year to employees who have served at
+least min_tenure_months. Employees have a single leave_balance, so every
+policy must be of the same leave type: policies of two types would each
+credit the one balance. For a month, the policies are turned into a
+schedule of tenure bands, one per policy. Employees are then credited with
+set-based UPDATEs, one per chunk of employee ids: a CASE over the bands
+on joining_date computes every new balance in the database.
+
+Each chunk runs in its own transaction, together with the advance of
+the AccrualRun cursor, so a run can be interrupted and resumed, and
+running it again for the same month does nothing.
+"""
+
+from calendar import monthrange
+
+from django.db import transaction
+from django.db.models import Case, Count, F, PositiveIntegerField, Sum, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import AccrualPolicy, AccrualRun, EmployeeProfile
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return day.replace(
+        year=year, month=month, day=min(day.day, monthrange(year, month)[1])
+    )
+
+
+def month_end(period):
+    return period.replace(day=monthrange(period.year, period.month)[1])
+
+
+class AccrualPolicyError(ValueError):
+    """The accrual policies cannot be turned into a schedule."""
+
+
+def monthly_credit(days_per_year, month):
+    """Whole days for `month` (1-12), spread so a year adds up exactly."""
+    return days_per_year * month // 12 - days_per_year * (month - 1) // 12
+
+
+def build_schedule(period, policies=None):
+    """
+    Tenure bands for the month starting at `period`, longest tenure first:
+    [{"min_tenure_months", "days", "max_balance"}, ...]. Raises
+    AccrualPolicyError when the policies cover more than one leave type.
+
+    Bands that credit nothing this month are kept, so that their employees
+    do not fall through to a shorter-tenure band; the schedule is empty
+    only when no band credits anything.
+    """
+    policies = list(AccrualPolicy.objects.all() if policies is None else policies)
+    leave_types = sorted({policy.leave_type for policy in policies})
+    if len(leave_types) > 1:
+        raise AccrualPolicyError(
+            "Accrual policies must all be of one leave type, found: "
+            + ", ".join(leave_types)
+        )
+
+    schedule = [
+        {
+            "min_tenure_months": policy.min_tenure_months,
+            "days": monthly_credit(policy.days_per_year, period.month),
+            "max_balance": policy.max_balance,
+        }
+        for policy in sorted(
+            policies, key=lambda policy: policy.min_tenure_months, reverse=True
+        )
+    ]
+    return schedule if any(band["days"] for band in schedule) else []
+
+
+def _joined_by(period, band):
+    """Latest joining date with the band's tenure by the end of the month."""
+    return add_months(month_end(period), -band["min_tenure_months"])
+
+
+def balance_expression(period, schedule):
+    """The credited leave_balance of an employee row, as a CASE."""
+    whens = []
+    for band in schedule:
+        if not band["days"]:
+            credited = F("leave_balance")
+        elif band["max_balance"] is None:
+            credited = F("leave_balance") + band["days"]
+        else:
+            # Never lower a balance that is already above the cap.
+            credited = Greatest(
+                F("leave_balance"),
+                Least(F("leave_balance") + band["days"], Value(band["max_balance"])),
+            )
+        whens.append(When(joining_date__lte=_joined_by(period, band), then=credited))
+    return Case(*whens, default=F("leave_balance"), output_field=PositiveIntegerField())
+
+
+def _credit_chunk(run_pk, period, chunk_size):
+    """Credit the next chunk of employees; returns False when none are left."""
+    with transaction.atomic():
+        # The row lock keeps concurrent runners of one month from crediting
+        # the same chunk twice.
+        run = AccrualRun.objects.select_for_update().get(pk=run_pk)
+        if run.status == AccrualRun.StatusChoices.COMPLETED or not run.schedule:
+            return False
+        eligible = EmployeeProfile.objects.filter(
+            joining_date__lte=_joined_by(period, run.schedule[-1])
+        )
+        ids = list(
+            eligible.filter(id__gt=run.last_employee_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return False
+
+        new_balance = balance_expression(period, run.schedule)
+        chunk = (
+            eligible.filter(id__gt=run.last_employee_id, id__lte=ids[-1])
+            .annotate(new_balance=new_balance)
+            .filter(new_balance__gt=F("leave_balance"))
+        )
+        totals = chunk.aggregate(
+            employees=Count("id"),
+            days=Sum(F("new_balance") - F("leave_balance")),
+        )
+        chunk.update(leave_balance=new_balance, updated_at=timezone.now())
+
+        run.last_employee_id = ids[-1]
+        run.employees_credited += totals["employees"]
+        run.days_credited += totals["days"] or 0
+        run.save(
+            update_fields=["last_employee_id", "employees_credited", "days_credited"]
+        )
+    return True
+
+
+def run_accrual(period, chunk_size=5000, progress=None):
+    """
+    Credit the accrual of the month starting at `period` to every eligible
+    employee, resuming an interrupted run. Returns the AccrualRun.
+    `progress(run)` is called after each chunk.
+    """
+    run, _ = AccrualRun.objects.get_or_create(
+        period=period, defaults={"schedule": build_schedule(period)}
+    )
+    while _credit_chunk(run.pk, period, chunk_size):
+        if progress is not None:
+            run.refresh_from_db()
+            progress(run)
+    AccrualRun.objects.filter(
+        pk=run.pk, status=AccrualRun.StatusChoices.RUNNING
+    ).update(status=AccrualRun.StatusChoices.COMPLETED, finished_at=timezone.now())
+    run.refresh_from_db()
+    return run
@@ -7,4 +7,8 @@ admin.site.register(User)
 admin.site.register(EmployeeProfile)
 admin.site.register(HrProfile)
 admin.site.register(Application)
+admin.site.register(Holiday)
+admin.site.register(AccrualPolicy)
+admin.site.register(AccrualRun)
+admin.site.register(BackgroundJob)
 # admin.site.register(Leave)
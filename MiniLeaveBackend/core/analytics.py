@@ -0,0 +1,310 @@
+"""
+Leave analytics: applications and days per department, leave type and
+month, split by status.
+
+Reports are read from LeaveRollup, a pre-aggregated table with one row per
+(month, department, leave type, status) bucket. The receivers in
+core.signals compute the delta of every status change, edit and
+department move inside the writing transaction and queue it as a
+background job (core.tasks), so a report over years of applications
+aggregates a few thousand rollup rows instead of every application.
+Deltas are additive, so jobs may run in any order. live_report()
+computes the same figures from Application directly; it is the
+reference rebuild_rollups() and the tests compare against.
+"""
+
+from datetime import date, timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import Application, BackgroundJob, EmployeeProfile, LeaveRollup
+from .tasks import cancel, enqueue, task
+
+GROUPS = ("department", "leave_type", "month")
+STATUSES = Application.StatusChoices.values
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+# ---------------------- INCREMENTAL UPDATES ----------------------
+
+
+def rollup_entry(application, department, status=None):
+    """The bucket an application counts in (as if in `status`) and its days."""
+    key = (
+        month_start(application.start_date),
+        department,
+        application.leave_type,
+        status or application.status,
+    )
+    return key, application.days
+
+
+def _add(deltas, key, count, days):
+    current = deltas.get(key, (0, 0))
+    deltas[key] = (current[0] + count, current[1] + days)
+
+
+def accumulate_rollup_deltas(deltas, entry, sign):
+    key, days = entry
+    _add(deltas, key, sign, sign * days)
+    return deltas
+
+
+def adjust_rollups(deltas):
+    """Add (possibly negative) application and day deltas to rollup rows."""
+    now = timezone.now()
+    for (month, department, leave_type, status), (count, days) in deltas.items():
+        if not count and not days:
+            continue
+        lookup = {
+            "month": month,
+            "department": department,
+            "leave_type": leave_type,
+            "status": status,
+        }
+        changes = {
+            "applications": F("applications") + count,
+            "days": F("days") + days,
+            "updated_at": now,
+        }
+        if LeaveRollup.objects.filter(**lookup).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                LeaveRollup.objects.create(**lookup, applications=count, days=days)
+        except IntegrityError:
+            # Another transaction created the bucket first.
+            LeaveRollup.objects.filter(**lookup).update(**changes)
+
+
+@task("analytics.adjust_rollups")
+def adjust_rollups_task(deltas):
+    adjust_rollups(
+        {
+            (date.fromisoformat(month), department, leave_type, status): (count, days)
+            for month, department, leave_type, status, count, days in deltas
+        }
+    )
+
+
+def queue_rollup_deltas(deltas):
+    """Apply the deltas in a background job, after the caller commits."""
+    rows = [
+        [month.isoformat(), department, leave_type, status, count, days]
+        for (month, department, leave_type, status), (count, days) in deltas.items()
+        if count or days
+    ]
+    if rows:
+        enqueue("analytics.adjust_rollups", {"deltas": rows})
+
+
+def departments_of(applications):
+    """{employee_id: department}, reading only employees not already loaded."""
+    departments, missing = {}, set()
+    for application in applications:
+        if Application.employee.is_cached(application):
+            departments[application.employee_id] = application.employee.department
+        else:
+            missing.add(application.employee_id)
+    missing -= departments.keys()
+    if missing:
+        departments.update(
+            EmployeeProfile.objects.filter(id__in=missing).values_list(
+                "id", "department"
+            )
+        )
+    return departments
+
+
+def record_status_changes(changes):
+    """Move applications between status buckets for (app, old, new) tuples."""
+    departments = departments_of(application for application, _, _ in changes)
+    deltas = {}
+    for application, old_status, new_status in changes:
+        department = departments[application.employee_id]
+        if old_status is not None:
+            entry = rollup_entry(application, department, old_status)
+            accumulate_rollup_deltas(deltas, entry, -1)
+        accumulate_rollup_deltas(
+            deltas, rollup_entry(application, department, new_status), 1
+        )
+    queue_rollup_deltas(deltas)
+
+
+def record_edit(application, before, status):
+    """
+    Move an edited application to the bucket of its new start month,
+    leave type and length. `before` is rollup_entry(application, None)
+    taken before the edit, in `status`, the status it had then.
+    """
+    after = rollup_entry(application, None, status)
+    if after == before:
+        return
+    department = departments_of([application])[application.employee_id]
+    deltas = {}
+    for ((month, _, leave_type, counted), days), sign in ((before, -1), (after, 1)):
+        _add(deltas, (month, department, leave_type, counted), sign, sign * days)
+    queue_rollup_deltas(deltas)
+
+
+def employee_buckets(employee_id):
+    """(month, leave_type, status, applications, days) of one employee."""
+    return (
+        Application.objects.filter(employee_id=employee_id)
+        .annotate(month=TruncMonth("start_date"))
+        .values_list("month", "leave_type", "status")
+        .annotate(applications=Count("id"), leave_days=Sum("days"))
+        .order_by()
+    )
+
+
+def move_employee(employee_id, old_department, new_department):
+    """
+    Move an employee's applications from one department's buckets to
+    another's. new_department=None removes them (employee deleted).
+    """
+    deltas = {}
+    for month, leave_type, status, count, days in employee_buckets(employee_id):
+        for department, sign in ((old_department, -1), (new_department, 1)):
+            if department is not None:
+                key = (month, department, leave_type, status)
+                _add(deltas, key, sign * count, sign * days)
+    queue_rollup_deltas(deltas)
+
+
+# ---------------------- REBUILD ----------------------
+
+
+def live_buckets():
+    return (
+        Application.objects.annotate(month=TruncMonth("start_date"))
+        .values_list("month", "employee__department", "leave_type", "status")
+        .annotate(applications=Count("id"), leave_days=Sum("days"))
+        .order_by()
+    )
+
+
+@transaction.atomic
+def rebuild_rollups(batch_size=1000):
+    """
+    Recompute every rollup row from the applications; returns the count.
+    Queued delta jobs are already part of the recomputed totals and are
+    cancelled.
+    """
+    if connection.vendor == "postgresql":
+        # Rollups first: wait for delta jobs that already wrote to them.
+        # Then hold off new jobs, so every change committed before the
+        # recount has its job cancelled and every later one is queued.
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {LeaveRollup._meta.db_table} IN EXCLUSIVE MODE")
+            cursor.execute(
+                f"LOCK TABLE {BackgroundJob._meta.db_table} "
+                "IN SHARE ROW EXCLUSIVE MODE"
+            )
+    cancel("analytics.adjust_rollups", "Superseded by a rollup rebuild")
+    LeaveRollup.objects.all().delete()
+    rows = LeaveRollup.objects.bulk_create(
+        [
+            LeaveRollup(
+                month=month,
+                department=department,
+                leave_type=leave_type,
+                status=status,
+                applications=count,
+                days=days,
+            )
+            for month, department, leave_type, status, count, days in live_buckets()
+        ],
+        batch_size=batch_size,
+    )
+    return len(rows)
+
+
+# ---------------------- REPORTS ----------------------
+
+
+def _aggregates(count, days):
+    aggregates = {}
+    for status in STATUSES:
+        matches = Q(status=status)
+        aggregates[f"{status}_applications"] = Coalesce(count(matches), 0)
+        aggregates[f"{status}_days"] = Coalesce(Sum(days, filter=matches), 0)
+    return aggregates
+
+
+def _report(queryset, group_by, aggregates):
+    if not group_by:
+        rows = [queryset.aggregate(**aggregates)]
+    else:
+        rows = queryset.values(*group_by).annotate(**aggregates).order_by(*group_by)
+    results = []
+    for row in rows:
+        result = {group: row[group] for group in group_by}
+        if "month" in result:
+            result["month"] = result["month"].strftime("%Y-%m")
+        for status in STATUSES:
+            result[status] = {
+                "applications": row[f"{status}_applications"],
+                "days": row[f"{status}_days"],
+            }
+        results.append(result)
+    return results
+
+
+def rollup_report(group_by=GROUPS, **filters):
+    """
+    Report rows from the rollup table. `filters` may hold date_from /
+    date_to (months of the start date), department and leave_type.
+    """
+    # Buckets emptied by moves and deletes are kept; leave them out, as
+    # live_report() has no group for them.
+    queryset = LeaveRollup.objects.exclude(applications=0)
+    if "date_from" in filters:
+        queryset = queryset.filter(month__gte=month_start(filters["date_from"]))
+    if "date_to" in filters:
+        queryset = queryset.filter(month__lte=month_start(filters["date_to"]))
+    if "department" in filters:
+        queryset = queryset.filter(department=filters["department"])
+    if "leave_type" in filters:
+        queryset = queryset.filter(leave_type=filters["leave_type"])
+    aggregates = _aggregates(
+        lambda matches: Sum("applications", filter=matches), "days"
+    )
+    return _report(queryset, group_by, aggregates)
+
+
+def live_report(group_by=GROUPS, **filters):
+    """The same report aggregated from the applications themselves."""
+    queryset = Application.objects.annotate(
+        month=TruncMonth("start_date"), department=F("employee__department")
+    )
+    if "date_from" in filters:
+        queryset = queryset.filter(start_date__gte=month_start(filters["date_from"]))
+    if "date_to" in filters:
+        queryset = queryset.filter(start_date__lt=next_month(filters["date_to"]))
+    if "department" in filters:
+        queryset = queryset.filter(employee__department=filters["department"])
+    if "leave_type" in filters:
+        queryset = queryset.filter(leave_type=filters["leave_type"])
+    aggregates = _aggregates(lambda matches: Count("id", filter=matches), "days")
+    return _report(queryset, group_by, aggregates)
+
+
+def totals(results):
+    """Sum report rows into one {status: {applications, days}} dict."""
+    summed = {status: {"applications": 0, "days": 0} for status in STATUSES}
+    for row in results:
+        for status in STATUSES:
+            for field in ("applications", "days"):
+                summed[status][field] += row[status][field]
+    return summed
@@ -0,0 +1,283 @@
+"""
+Async (ASGI) versions of the hot leave endpoints.
+
+Enabled with LEAVE_API_ASYNC=True (see settings.py); core.urls then routes
+these paths here instead of to core.views. Responses have the same shape
+as the DRF views. Reads use the async ORM directly; writes go through the
+same transactional services as the sync views via sync_to_async, because
+transactions are not yet supported in async code.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+
+from . import conditional, reads
+from .authentication import CachedTokenAuthentication
+from .events import format_sse, get_broker, get_options as event_options
+from .fast_serializers import aapplication_rows
+from .models import Application, EmployeeProfile
+from .pagination import ApplicationCursorPagination
+from .renderers import dumps
+from .routers import areplica_allowed, read_from_replica
+from .serializers import (
+    ApplicationFilterSerializer,
+    ApplicationSerializer,
+    ApplyLeaveSerializer,
+    BalanceFilterSerializer,
+)
+from .services import (
+    LeaveApplicationError,
+    LeaveDecisionError,
+    approve_application,
+    submit_application,
+)
+
+
+def failed(message, code):
+    return JsonResponse({"status": "failed", "message": message}, status=code)
+
+
+def not_found(model):
+    # Same body DRF produces for get_object_or_404
+    message = f"No {model._meta.object_name} matches the given query."
+    return JsonResponse({"detail": message}, status=status.HTTP_404_NOT_FOUND)
+
+
+async def authenticate(request):
+    """Return the token user, or the 401 response DRF would have sent."""
+    authenticator = CachedTokenAuthentication()
+    try:
+        result = await authenticator.aauthenticate(request)
+    except exceptions.AuthenticationFailed as exc:
+        detail = str(exc.detail)
+    else:
+        if result is not None:
+            # As DRF does; ReplicaStickinessMiddleware pins writers by it.
+            request.user = result[0]
+            return result[0], None
+        detail = str(exceptions.NotAuthenticated.default_detail)
+    response = JsonResponse({"detail": detail}, status=status.HTTP_401_UNAUTHORIZED)
+    response["WWW-Authenticate"] = authenticator.authenticate_header(request)
+    return None, response
+
+
+def request_data(request):
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+    return request.POST.dict()
+
+
+# ---------------------- LEAVE ----------------------
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def apply_for_leave(request):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    if user.role != "employee":
+        return failed("Only employees can apply for leave", status.HTTP_403_FORBIDDEN)
+
+    serializer = ApplyLeaveSerializer(data=request_data(request))
+    if not serializer.is_valid():
+        return failed(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    @sync_to_async
+    def submit():
+        application = submit_application(
+            user.employee_profile.pk, serializer.validated_data
+        )
+        return ApplicationSerializer(application).data
+
+    try:
+        data = await submit()
+    except EmployeeProfile.DoesNotExist:
+        return failed("Employee profile not found", status.HTTP_404_NOT_FOUND)
+    except LeaveApplicationError as exc:
+        return failed({"non_field_errors": [exc.message]}, status.HTTP_400_BAD_REQUEST)
+    return JsonResponse(
+        {
+            "status": "success",
+            "message": "Leave applied successfully",
+            "data": data,
+        },
+        status=status.HTTP_201_CREATED,
+    )
+
+
+@require_http_methods(["GET"])
+async def view_all_applications(request):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    if user.role != "hr":
+        return failed("Only HR can view applications", status.HTTP_403_FORBIDDEN)
+
+    with read_from_replica(await areplica_allowed(user)):
+        drf_request = Request(request)
+        filters = ApplicationFilterSerializer(data=drf_request.query_params)
+        if not filters.is_valid():
+            return failed(filters.errors, status.HTTP_400_BAD_REQUEST)
+
+        paginator = ApplicationCursorPagination()
+        rows = await paginator.apaginate_queryset(
+            reads.application_page_columns(filters), drf_request
+        )
+        etag, last_modified = conditional.application_page_validators(rows, paginator)
+        unchanged = conditional.not_modified(request, etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+
+        page = await aapplication_rows(
+            Application.objects.all(), reads.application_page_ids(rows)
+        )
+        response = HttpResponse(
+            dumps(reads.application_page_body(paginator, page)),
+            content_type="application/json",
+            status=status.HTTP_200_OK,
+        )
+        return conditional.add_validators(response, etag, last_modified)
+
+
+@csrf_exempt
+@require_http_methods(["PATCH"])
+async def approve_leave(request, application_id):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    if user.role != "hr":
+        return failed("Only HR can approve leaves", status.HTTP_403_FORBIDDEN)
+
+    try:
+        application = await Application.objects.aget(id=application_id)
+    except Application.DoesNotExist:
+        return not_found(Application)
+    try:
+        await sync_to_async(approve_application)(application)
+    except LeaveDecisionError as exc:
+        return failed(exc.message, status.HTTP_400_BAD_REQUEST)
+    return JsonResponse(
+        {"status": "success", "message": "Leave approved"}, status=status.HTTP_200_OK
+    )
+
+
+@require_http_methods(["GET"])
+async def get_leave_balance(request, employee_id):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    if user.role not in ["hr", "employee"]:
+        return failed("Unauthorized", status.HTTP_403_FORBIDDEN)
+
+    with read_from_replica(await areplica_allowed(user)):
+        filters = BalanceFilterSerializer(data=request.GET)
+        if not filters.is_valid():
+            return failed(filters.errors, status.HTTP_400_BAD_REQUEST)
+        year = filters.validated_data["year"]
+
+        try:
+            employee = await reads.balance_employees().aget(id=employee_id)
+        except EmployeeProfile.DoesNotExist:
+            return not_found(EmployeeProfile)
+        entries = [entry async for entry in reads.balance_entries(employee, year)]
+        etag, last_modified = conditional.balance_validators(employee, year, entries)
+        unchanged = conditional.not_modified(request, etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+
+        response = JsonResponse(
+            reads.balance_body(employee, year, entries), status=status.HTTP_200_OK
+        )
+        return conditional.add_validators(response, etag, last_modified)
+
+
+# ---------------------- EVENTS ----------------------
+
+
+def _event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@require_http_methods(["GET"])
+async def leave_events(request):
+    """
+    Server-sent events for application status changes: all of them for HR
+    (optionally one employee's, with ?employee_id=), an employee's own for
+    employees. Clients reconnecting with Last-Event-ID get the events they
+    missed while they are still in the broker's history. Needs ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would be read to the end before sending:
+        # it never ends, so it would hold a worker and grow in memory.
+        return failed(
+            "The event stream needs an ASGI server", status.HTTP_501_NOT_IMPLEMENTED
+        )
+    user, error = await authenticate(request)
+    if error:
+        return error
+    if user.role == "hr":
+        employee_id = None
+        if "employee_id" in request.GET:
+            employee_id = _event_id(request.GET["employee_id"])
+            if employee_id is None:
+                return failed(
+                    {"employee_id": ["A valid integer is required."]},
+                    status.HTTP_400_BAD_REQUEST,
+                )
+    elif user.role == "employee":
+        try:
+            employee = await EmployeeProfile.objects.only("id").aget(user=user)
+        except EmployeeProfile.DoesNotExist:
+            return failed("Employee profile not found", status.HTTP_404_NOT_FOUND)
+        employee_id = employee.id
+    else:
+        return failed("Unauthorized", status.HTTP_403_FORBIDDEN)
+
+    def accepts(event):
+        return employee_id is None or event["employee_id"] == employee_id
+
+    last_event_id = _event_id(
+        request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    )
+    heartbeat = event_options()["HEARTBEAT"]
+
+    async def stream():
+        # Subscribing here (not in the view) ties the subscription's
+        # lifetime to the stream: it ends when the client disconnects.
+        subscription, missed = get_broker().subscribe(accepts, last_event_id)
+        try:
+            yield "retry: 3000\n: connected\n\n"
+            for event in missed:
+                yield format_sse(event)
+            while True:
+                try:
+                    event = await subscription.get(heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    return
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Ask nginx not to buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,255 @@
+"""
+Token authentication with a cache in front of the authtoken lookup.
+
+The default backend is an in-process LRU with a TTL. Set
+TOKEN_AUTH_CACHE["BACKEND"] to "django" to share entries between workers
+through a Django cache alias instead. Entries are dropped by the signal
+handlers in core.signals when a token, its user or the user's employee
+profile changes; with the local backend other worker processes notice
+only after TIMEOUT seconds.
+
+Entries hold field values, not model instances: every request gets its
+own Token/User/profile objects, and the password hash is never cached.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+DEFAULTS = {
+    "BACKEND": "local",
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": 60,
+    "MAX_ENTRIES": 10_000,
+}
+
+
+class _Counters:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class LocalTokenCache(_Counters):
+    """Thread-safe LRU cache whose entries expire after `timeout` seconds."""
+
+    def __init__(self, timeout, max_entries):
+        super().__init__()
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {**super().stats(), "size": len(self._entries)}
+
+
+class SharedTokenCache(_Counters):
+    """Stores entries in a Django cache so every worker sees invalidations."""
+
+    prefix = "auth-token:"
+
+    def __init__(self, alias, timeout):
+        super().__init__()
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        value = self._cache.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._cache.set(self.prefix + key, value, self.timeout)
+
+    def delete(self, key):
+        self._cache.delete(self.prefix + key)
+
+    def clear(self):
+        # Only our own keys would need clearing; entries expire on their own.
+        pass
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                options = {**DEFAULTS, **getattr(settings, "TOKEN_AUTH_CACHE", {})}
+                if options["BACKEND"] == "django":
+                    _token_cache = SharedTokenCache(
+                        options["CACHE_ALIAS"], options["TIMEOUT"]
+                    )
+                else:
+                    _token_cache = LocalTokenCache(
+                        options["TIMEOUT"], options["MAX_ENTRIES"]
+                    )
+    return _token_cache
+
+
+def reset_token_cache():
+    """
+    Drop the cache and its entries; the next get_token_cache() builds a
+    new one from TOKEN_AUTH_CACHE.
+    """
+    global _token_cache
+    with _token_cache_lock:
+        _token_cache = None
+
+
+# Loaded (and cached) with the token, so request.user.employee_profile
+# costs no query (for users without a profile it raises DoesNotExist,
+# also without a query). Balances change through UPDATEs that do not
+# refresh this copy: read them from the database, not from the cache.
+TOKEN_RELATED = ("user", "user__employee_profile")
+
+# Kept out of cache entries; loaded on access if a request needs it.
+UNCACHED_FIELDS = {"password"}
+
+
+def _values(instance):
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.attname not in UNCACHED_FIELDS
+    }
+
+
+def _instance(model, db, values):
+    return model.from_db(db, list(values), list(values.values()))
+
+
+def token_entry(token):
+    """The cache entry for a token loaded with TOKEN_RELATED."""
+    user = token.user
+    try:
+        profile = _values(user.employee_profile)
+    except ObjectDoesNotExist:
+        profile = None
+    return {
+        "db": token._state.db,
+        "token": _values(token),
+        "user": _values(user),
+        "profile": profile,
+    }
+
+
+def token_from_entry(model, entry):
+    """New Token, User and profile instances, related as select_related() would."""
+    User = get_user_model()
+    db = entry["db"]
+    token = _instance(model, db, entry["token"])
+    user = _instance(User, db, entry["user"])
+    model.user.field.set_cached_value(token, user)
+    profile_relation = User.employee_profile.related
+    if entry["profile"] is None:
+        profile_relation.set_cached_value(user, None)
+    else:
+        profile = _instance(profile_relation.related_model, db, entry["profile"])
+        profile_relation.set_cached_value(user, profile)
+        profile_relation.field.set_cached_value(profile, user)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        model = self.get_model()
+        entry = cache.get(key)
+        if entry is not None:
+            token = token_from_entry(model, entry)
+            return (token.user, token)
+        # Unknown keys / inactive users raise and are never cached.
+        try:
+            token = model.objects.select_related(*TOKEN_RELATED).get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        cache.set(key, token_entry(token))
+        return (token.user, token)
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of authenticate() for plain async Django views,
+        which DRF's request wrapper does not support.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+
+        cache = get_token_cache()
+        model = self.get_model()
+        entry = cache.get(key)
+        if entry is not None:
+            token = token_from_entry(model, entry)
+            return (token.user, token)
+        try:
+            token = await model.objects.select_related(*TOKEN_RELATED).aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed("Invalid token.")
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        cache.set(key, token_entry(token))
+        return (token.user, token)
@@ -0,0 +1,110 @@
+"""
+Team calendar: who is on (approved or pending) leave on each day of a
+date range.
+
+The applications overlapping the range are read in one query, ordered by
+start date. Org-wide, it walks the (end_date, start_date) index; for one
+department it probes that department's employees instead. A sweep over the
+sorted intervals then keeps the set of applications covering the current
+day: entries are added when the sweep reaches their start and expired
+from a min-heap of end dates, so every interval is touched twice instead
+of once per day of the range.
+"""
+
+import heapq
+from datetime import timedelta
+
+from django.db.models import F, OuterRef, Subquery
+
+from .models import Application, EmployeeProfile
+
+# The widest range one request may cover.
+MAX_DAYS = 92
+
+FIELDS = (
+    "id",
+    "employee_id",
+    "username",
+    "department",
+    "status",
+    "leave_type",
+    "start_date",
+    "end_date",
+)
+
+
+def overlapping(date_from, date_to, department=None, statuses=None):
+    """FIELDS tuples of the applications overlapping the range, by start."""
+    queryset = Application.objects.filter(
+        status__in=statuses
+        or [Application.StatusChoices.PENDING, Application.StatusChoices.APPROVED],
+        end_date__gte=date_from,
+        start_date__lte=date_to,
+    )
+    if department is None:
+        # Joined employee and user tables make the planner start from the
+        # employees and probe each one's applications, however few overlap
+        # the range. Looked up per row instead, they leave the range scan
+        # on app_dates_idx.
+        employee = EmployeeProfile.objects.filter(id=OuterRef("employee_id"))
+        queryset = queryset.annotate(
+            username=Subquery(employee.values("user__username")),
+            department=Subquery(employee.values("department")),
+        )
+    else:
+        queryset = queryset.filter(employee__department=department).annotate(
+            username=F("employee__user__username"),
+            department=F("employee__department"),
+        )
+    return queryset.order_by("start_date", "id").values_list(*FIELDS)
+
+
+def sweep(intervals, date_from, date_to):
+    """
+    Yield (day, active) for each day from date_from to date_to, where
+    `active` lists the intervals covering that day in start order.
+    `intervals` are (start, end, item) tuples sorted by start.
+    """
+    intervals = iter(intervals)
+    upcoming = next(intervals, None)
+    ends, active, order = [], {}, 0
+    day = date_from
+    while day <= date_to:
+        while upcoming is not None and upcoming[0] <= day:
+            start, end, item = upcoming
+            if end >= day:
+                heapq.heappush(ends, (end, order))
+                active[order] = item
+                order += 1
+            upcoming = next(intervals, None)
+        while ends and ends[0][0] < day:
+            del active[heapq.heappop(ends)[1]]
+        yield day, list(active.values())
+        day += timedelta(days=1)
+
+
+def calendar(date_from, date_to, department=None, statuses=None):
+    """
+    The calendar for the range: the employees and applications involved,
+    each listed once, and per day the ids of the employees on leave.
+    """
+    employees, applications, intervals = {}, [], []
+    for row in overlapping(date_from, date_to, department, statuses):
+        app_id, employee_id, username, dept, status, leave_type, start, end = row
+        employees.setdefault(employee_id, {"username": username, "department": dept})
+        applications.append(
+            {
+                "id": app_id,
+                "employee_id": employee_id,
+                "status": status,
+                "leave_type": leave_type,
+                "start_date": start,
+                "end_date": end,
+            }
+        )
+        intervals.append((start, end, employee_id))
+    days = [
+        {"date": day, "on_leave": len(active), "employee_ids": active}
+        for day, active in sweep(intervals, date_from, date_to)
+    ]
+    return {"employees": employees, "applications": applications, "days": days}
@@ -0,0 +1,237 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks never touch the configured database: they run against a
+throwaway copy created the same way the test runner creates its database.
+"""
+
+import asyncio
+import importlib
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import clear_url_caches
+
+from .models import Application, EmployeeProfile, User
+from .workdays import count_workdays
+
+DEPARTMENTS = ["engineering", "sales", "finance", "support", "operations"]
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """
+    Create a migrated scratch database, and the same environment the test
+    runner uses (so the test clients are accepted, and DEBUG is off as in
+    production), for the block.
+
+    SQLite scratch databases are file-backed rather than in-memory so that
+    concurrent writers lock and wait the way a deployed database does.
+    Read replicas (TEST MIRROR) point at the scratch database too.
+    """
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    if connection.vendor == "sqlite" and not old_test_name:
+        test_settings["NAME"] = os.path.join(
+            tempfile.gettempdir(), f"leave-bench-{os.getpid()}.sqlite3"
+        )
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    mirrors = {
+        replica: replica.settings_dict["NAME"]
+        for replica in connections.all()
+        if replica.settings_dict["TEST"].get("MIRROR") == connection.alias
+    }
+    for replica in mirrors:
+        replica.close()
+        replica.creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield connection
+    finally:
+        for replica, name in mirrors.items():
+            replica.close()
+            replica.settings_dict["NAME"] = name
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+        test_settings["NAME"] = old_test_name
+
+
+def seed(employees, applications, batch_size=10_000, rng=None, pending=2):
+    """
+    Bulk-insert `employees` employee users/profiles and `applications`
+    leave applications spread evenly across them.
+
+    Each employee's applications are laid out back to back without
+    overlaps; the most recent `pending` are left pending, the rest are
+    approved or rejected. Returns the list of employee profile ids.
+    """
+    rng = rng or random.Random(0)
+    users = [
+        User(
+            username=f"bench{i}",
+            email=f"bench{i}@example.com",
+            password="!",
+            role="employee",
+        )
+        for i in range(employees)
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size)
+    user_ids = User.objects.filter(username__startswith="bench").values_list(
+        "id", flat=True
+    )
+    EmployeeProfile.objects.bulk_create(
+        [
+            EmployeeProfile(
+                user_id=user_id,
+                phone_number="0000000000",
+                department=DEPARTMENTS[i % len(DEPARTMENTS)],
+                joining_date=date(2015, 1, 1),
+                leave_balance=rng.randint(5, 30),
+            )
+            for i, user_id in enumerate(user_ids)
+        ],
+        batch_size=batch_size,
+    )
+    employee_ids = list(EmployeeProfile.objects.values_list("id", flat=True))
+    if not employee_ids:
+        return employee_ids
+
+    per_employee = max(1, applications // len(employee_ids))
+    leave_types = [choice for choice, _ in Application.LeaveType.choices]
+    batch = []
+    created = 0
+    for employee_id in employee_ids:
+        start = date(2016, 1, 1)
+        for n in range(per_employee):
+            if created >= applications:
+                break
+            length = rng.randint(0, 3)
+            end = start + timedelta(days=length)
+            if n >= per_employee - pending:
+                app_status = Application.StatusChoices.PENDING
+            elif rng.random() < 0.85:
+                app_status = Application.StatusChoices.APPROVED
+            else:
+                app_status = Application.StatusChoices.REJECTED
+            batch.append(
+                Application(
+                    employee_id=employee_id,
+                    status=app_status,
+                    leave_type=rng.choice(leave_types),
+                    start_date=start,
+                    end_date=end,
+                    days=count_workdays(start, end),
+                )
+            )
+            start += timedelta(days=length + rng.randint(2, 20))
+            created += 1
+            if len(batch) >= batch_size:
+                Application.objects.bulk_create(batch)
+                batch = []
+    if batch:
+        Application.objects.bulk_create(batch)
+    return employee_ids
+
+
+def time_calls(func, iterations):
+    """Call `func` repeatedly and return the timings in milliseconds."""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(timings):
+    return {
+        "count": len(timings),
+        "mean_ms": round(statistics.fmean(timings), 3) if timings else 0.0,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+    }
+
+
+def run_threaded(call, jobs, concurrency):
+    """
+    Run `call(job)` for every job on `concurrency` threads, like a WSGI
+    server's worker threads.
+
+    Returns (per-call ms timings, per-call return values, wall seconds).
+    """
+
+    def timed(job):
+        started = time.perf_counter()
+        result = call(job)
+        return (time.perf_counter() - started) * 1000, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, jobs))
+    wall = time.perf_counter() - started
+    return [ms for ms, _ in outcomes], [result for _, result in outcomes], wall
+
+
+def run_async(call, jobs, concurrency):
+    """
+    Await `call(job)` for every job with at most `concurrency` in flight on
+    one event loop, like an ASGI server.
+
+    Returns (per-call ms timings, per-call return values, wall seconds).
+    """
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(job):
+            async with semaphore:
+                started = time.perf_counter()
+                result = await call(job)
+                return (time.perf_counter() - started) * 1000, result
+
+        return await asyncio.gather(*(timed(job) for job in jobs))
+
+    started = time.perf_counter()
+    outcomes = asyncio.run(main())
+    wall = time.perf_counter() - started
+    return [ms for ms, _ in outcomes], [result for _, result in outcomes], wall
+
+
+@contextmanager
+def leave_api_async(enabled):
+    """Re-route the leave URLs to the sync or async views for the block."""
+    import core.urls
+    import MiniLeaveBackend.urls
+
+    def reload():
+        importlib.reload(core.urls)
+        importlib.reload(MiniLeaveBackend.urls)
+        clear_url_caches()
+
+    try:
+        with override_settings(LEAVE_API_ASYNC=enabled):
+            reload()
+            yield
+    finally:
+        reload()
@@ -0,0 +1,86 @@
+"""
+ETag (and, where it only moves forward, Last-Modified) validators for the
+polled read endpoints.
+
+Validators are computed from a few cheap columns (ids, updated_at and the
+values the response is built from), before any serializer runs, so an
+unchanged response costs one small query and a 304 instead of a full
+serialization. Responses depend on the caller's token, hence
+`Vary: Authorization` and `Cache-Control: private`.
+"""
+
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+# Columns of each listed application (and its employee) that the
+# serialized page depends on. The ordering fields (created_at, id) must be
+# included for the cursor paginator.
+APPLICATION_PAGE_FIELDS = ("id", "created_at", "updated_at", "employee__updated_at")
+
+
+def _etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def _timestamp(*values):
+    values = [value for value in values if value is not None]
+    return int(max(values).timestamp()) if values else None
+
+
+def application_page_validators(rows, paginator):
+    """
+    Validators for one page of applications, given its
+    APPLICATION_PAGE_FIELDS rows. The page links are part of the body, so
+    they are part of the ETag.
+
+    There is no Last-Modified: the newest updated_at on the page goes back
+    in time when a row leaves it (deleted, or no longer matching a status
+    filter), and If-Modified-Since would then answer 304 for a changed page.
+    """
+    etag = _etag(
+        paginator.get_next_link(),
+        paginator.get_previous_link(),
+        [(row["id"], row["updated_at"], row["employee__updated_at"]) for row in rows],
+    )
+    return etag, None
+
+
+def balance_validators(employee, year, entries):
+    """Validators for one employee's balance and ledger entries in `year`."""
+    etag = _etag(
+        employee.id,
+        employee.leave_balance,
+        year,
+        sorted(
+            (entry.leave_type, entry.pending_days, entry.approved_days)
+            for entry in entries
+        ),
+    )
+    last_modified = _timestamp(
+        employee.updated_at, *(entry.updated_at for entry in entries)
+    )
+    return etag, last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """
+    The 304 (or 412) response for a request whose validators match, else
+    None. `request` may be a Django or DRF request.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        add_validators(response, etag, last_modified)
+    return response
+
+
+def add_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Revalidate on every poll; never share between users.
+    response["Cache-Control"] = "private, no-cache"
+    patch_vary_headers(response, ["Authorization"])
+    return response
@@ -0,0 +1,174 @@
+"""
+Publish/subscribe of leave status changes for the server-sent events
+stream (core.async_views.leave_events).
+
+core.signals publishes an event after each committed status change. The
+broker delivers it to the subscribers whose filter accepts it. The broker
+class is set by LEAVE_EVENTS["BROKER"]. The default InProcessBroker only
+reaches clients connected to the same worker process, so with several
+workers plug in a broker backed by a shared channel (e.g. Redis pub/sub)
+that implements publish() / subscribe() the same way.
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+DEFAULTS = {
+    "BROKER": "core.events.InProcessBroker",
+    # Seconds of silence after which a comment is sent to keep proxies
+    # from closing the connection.
+    "HEARTBEAT": 15,
+    # Events buffered per client; a client that falls further behind is
+    # disconnected and catches up from the history when it reconnects.
+    "QUEUE_SIZE": 256,
+    # Recent events kept for clients resuming with Last-Event-ID.
+    "HISTORY": 1000,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "LEAVE_EVENTS", {})}
+
+
+def application_event(application, old_status, new_status):
+    event_type = "created" if old_status is None else new_status
+    return {
+        "type": f"application.{event_type}",
+        "application_id": application.pk,
+        "employee_id": application.employee_id,
+        "old_status": old_status,
+        "status": new_status,
+        "leave_type": application.leave_type,
+        "start_date": application.start_date.isoformat(),
+        "end_date": application.end_date.isoformat(),
+        "days": application.days,
+        "timestamp": timezone.now().isoformat(),
+    }
+
+
+def format_sse(event):
+    """One event in the text/event-stream wire format."""
+    data = json.dumps(event, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """
+    One client's queue on the event loop that serves it. deliver() may be
+    called from any thread.
+    """
+
+    def __init__(self, broker, accepts, queue_size):
+        self.broker = broker
+        self.accepts = accepts
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def deliver(self, event):
+        if self.closed or not self.accepts(event):
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The client's event loop has shut down.
+            self.close()
+
+    def _put(self, event):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow: end the stream (None) instead of silently dropping
+            # events; the client resumes from the history via Last-Event-ID.
+            self.close()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        """The next event, None if the stream must end; raises TimeoutError."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, queue_size=256, history=1000):
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+
+    def publish(self, event):
+        """Assign the event an id, remember it and hand it to subscribers."""
+        with self._lock:
+            event = {"id": next(self._ids), **event}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, accepts, last_event_id=None):
+        """
+        Register a subscriber (from inside its event loop). Returns the
+        subscription and the accepted events published after
+        `last_event_id` that are still in the history.
+        """
+        subscription = Subscription(self, accepts, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            missed = []
+            if last_event_id is not None:
+                missed = [
+                    event
+                    for event in self._history
+                    if event["id"] > last_event_id and accepts(event)
+                ]
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                options = get_options()
+                _broker = import_string(options["BROKER"])(
+                    queue_size=options["QUEUE_SIZE"], history=options["HISTORY"]
+                )
+    return _broker
+
+
+def reset_broker():
+    """
+    Drop the broker, with its history and subscriptions; the next
+    get_broker() builds a new one from the current options.
+    """
+    global _broker
+    with _broker_lock:
+        _broker = None
@@ -0,0 +1,173 @@
+"""
+Read-only fast path for the large list endpoints.
+
+A RowSerializer renders QuerySet.values() rows instead of model
+instances. Its schema is fixed when the module is imported: each output
+key maps to a values() lookup, optionally through a converter, and the
+whole mapping is compiled into a single function that builds the output
+dict in one expression. Rendering a row is then one dict display per
+object, with no per-field method calls, model instances or nested
+serializer. The output is identical to the DRF serializers it stands in
+for (see `manage.py benchmark_serializers`, which checks this and
+compares the per-row cost).
+"""
+
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework.fields import DateTimeField
+from rest_framework.settings import api_settings
+
+from .instrumentation import current_metrics
+
+
+def date_repr(value):
+    # DateField.to_representation with the default ISO 8601 format
+    return None if value is None else value.isoformat()
+
+
+def datetime_repr(value, tz):
+    # DateTimeField.to_representation with the default ISO 8601 format;
+    # `tz` is the current time zone, looked up once per batch of rows.
+    if value is None:
+        return None
+    if tz is not None and timezone.is_aware(value):
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def current_timezone():
+    return timezone.get_current_timezone() if settings.USE_TZ else None
+
+
+class Column:
+    """
+    An output field read from the `lookup` column of a values() row,
+    through convert(value) if given, or convert(value, tz) for a
+    TimestampColumn.
+    """
+
+    uses_timezone = False
+
+    def __init__(self, lookup, convert=None):
+        self.lookup = lookup
+        self.convert = convert
+
+
+def _datetime_converter():
+    # A custom DATETIME_FORMAT setting falls back to the DRF field itself.
+    if api_settings.DATETIME_FORMAT == ISO_8601:
+        return datetime_repr
+    to_representation = DateTimeField().to_representation
+    return lambda value, tz: to_representation(value)
+
+
+class TimestampColumn(Column):
+    uses_timezone = True
+
+    def __init__(self, lookup):
+        super().__init__(lookup, _datetime_converter())
+
+
+class RowSerializer:
+    """
+    Compile `fields` ({output key: Column or nested dict}) into a
+    function of one values() row. `lookups` are the columns to ask
+    values() for.
+    """
+
+    def __init__(self, fields):
+        self.lookups = []
+        namespace = {}
+        body = self._compile(fields, namespace)
+        source = f"def serialize(row, tz):\n    return {body}\n"
+        exec(compile(source, f"<RowSerializer {id(self):x}>", "exec"), namespace)
+        self._serialize = namespace["serialize"]
+
+    def _compile(self, fields, namespace):
+        items = []
+        for key, field in fields.items():
+            if isinstance(field, dict):
+                value = self._compile(field, namespace)
+            else:
+                if field.lookup not in self.lookups:
+                    self.lookups.append(field.lookup)
+                value = f"row[{field.lookup!r}]"
+                if field.convert is not None:
+                    name = f"convert_{len(namespace)}"
+                    namespace[name] = field.convert
+                    tz = ", tz" if field.uses_timezone else ""
+                    value = f"{name}({value}{tz})"
+            items.append(f"{key!r}: {value}")
+        return "{" + ", ".join(items) + "}"
+
+    def serialize(self, row):
+        return self._serialize(row, current_timezone())
+
+    def many(self, rows):
+        # Timed like TimedSerializerMixin, for the request's serializer_ms.
+        started = time.perf_counter()
+        serialize, tz = self._serialize, current_timezone()
+        data = [serialize(row, tz) for row in rows]
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.serializer_ms += (time.perf_counter() - started) * 1000
+        return data
+
+
+# Same output as ApplicationSerializer (read side).
+APPLICATION_ROW = RowSerializer(
+    {
+        "id": Column("id"),
+        "employee_detail": {
+            "id": Column("employee_id"),
+            "department": Column("employee__department"),
+            "joining_date": Column("employee__joining_date", date_repr),
+            "leave_balance": Column("employee__leave_balance"),
+        },
+        "status": Column("status"),
+        "leave_type": Column("leave_type"),
+        "start_date": Column("start_date", date_repr),
+        "end_date": Column("end_date", date_repr),
+        "reason_description": Column("reason_description"),
+        "rejection_reason": Column("rejection_reason"),
+        "days": Column("days"),
+        "created_at": TimestampColumn("created_at"),
+        "updated_at": TimestampColumn("updated_at"),
+    }
+)
+
+# Rows of the HR balances list (see views.view_leave_balances); the same
+# output as the DRF serializer in the benchmark_serializers command.
+BALANCE_ROW = RowSerializer(
+    {
+        "id": Column("id"),
+        "department": Column("department"),
+        "leave_balance": Column("leave_balance"),
+        "pending_days": Column("pending_days"),
+        "approved_days": Column("approved_days"),
+    }
+)
+
+
+def application_rows(queryset, ids):
+    """values() rows of the applications `ids`, in that order (one query)."""
+    by_id = {
+        row["id"]: row
+        for row in queryset.filter(id__in=ids).values(*APPLICATION_ROW.lookups)
+    }
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
+async def aapplication_rows(queryset, ids):
+    """Async version of application_rows()."""
+    by_id = {
+        row["id"]: row
+        async for row in queryset.filter(id__in=ids).values(*APPLICATION_ROW.lookups)
+    }
+    return [by_id[pk] for pk in ids if pk in by_id]
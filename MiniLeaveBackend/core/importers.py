@@ -0,0 +1,343 @@
+"""
+Streaming bulk import of employees from CSV or JSON.
+
+Records are parsed one at a time from the input stream and processed in
+batches: each batch is validated, its passwords are hashed in a process
+pool (the web endpoint keeps one, see shared_pool()) and the users/profiles
+are inserted with bulk_create inside one transaction per batch. Invalid rows are reported and skipped. Input that
+cannot be parsed any further ends the import: batches before it stay
+committed and the report records the unreadable row.
+"""
+
+import csv
+import io
+import json
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import EmployeeProfile, User
+from .serializers import EmployeeImportSerializer
+
+FORMATS = ("csv", "json")
+
+# Batches with fewer passwords than this are hashed in-process: sending
+# them to worker processes costs more than the hashing itself.
+MIN_POOL_PASSWORDS = 16
+
+
+def detect_format(filename, default="csv"):
+    name = (filename or "").lower()
+    if name.endswith((".json", ".jsonl", ".ndjson")):
+        return "json"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def _text_stream(stream):
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+class RecordParseError(ValueError):
+    """The input cannot be parsed past this point."""
+
+
+def iter_csv(stream):
+    reader = csv.DictReader(_text_stream(stream))
+    try:
+        for record in reader:
+            # Blank cells are treated as missing values
+            yield {
+                key: value for key, value in record.items() if value not in ("", None)
+            }
+    except csv.Error as exc:
+        raise RecordParseError(f"Invalid CSV at line {reader.line_num}: {exc}")
+    except UnicodeDecodeError:
+        raise RecordParseError(
+            f"The file is not valid UTF-8 after line {reader.line_num}."
+        )
+
+
+def iter_json(stream, chunk_size=64 * 1024, max_record_size=64 * 1024):
+    """
+    Yield objects from a JSON array or from JSON Lines without loading the
+    whole document: objects are decoded one by one from a rolling buffer.
+    A record that still does not decode once max_record_size characters
+    are buffered is malformed (employee records are far smaller), so
+    reading stops there instead of at the end of the file.
+    """
+    text = _text_stream(stream)
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    started = False
+    # File position of buffer[0], for error messages
+    line, column = 1, 1
+
+    def consume(count):
+        nonlocal buffer, line, column
+        consumed, buffer = buffer[:count], buffer[count:]
+        newlines = consumed.count("\n")
+        if newlines:
+            line += newlines
+            column = len(consumed) - consumed.rfind("\n")
+        else:
+            column += len(consumed)
+
+    while True:
+        consume(len(buffer) - len(buffer.lstrip(" \t\r\n,")))
+        if not started and buffer:
+            started = True
+            if buffer[0] == "[":
+                consume(1)
+                continue
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError as exc:
+                if eof or len(buffer) >= max_record_size:
+                    consume(exc.pos)
+                    raise RecordParseError(
+                        f"Invalid JSON at line {line} column {column}: {exc.msg}"
+                    )
+            else:
+                consume(end)
+                yield record
+                continue
+        if eof:
+            return
+        try:
+            chunk = text.read(chunk_size)
+        except UnicodeDecodeError:
+            raise RecordParseError(f"The file is not valid UTF-8 after line {line}.")
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_records(stream, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+    return iter_csv(stream) if fmt == "csv" else iter_json(stream)
+
+
+def _init_worker():
+    django.setup()
+
+
+def _hash(password):
+    # None produces an unusable password without paying for a real hash.
+    return make_password(password)
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """
+    The hashing pool of this (web) process, created on first use and kept
+    for the next imports, so each request does not start and stop its own
+    worker processes.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ProcessPoolExecutor(initializer=_init_worker)
+        return _shared_pool
+
+
+def _discard_shared_pool(pool):
+    """Forget a broken shared pool; the next shared_pool() starts a new one."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is pool:
+            _shared_pool = None
+    pool.shutdown(wait=False)
+
+
+class EmployeeImporter:
+    def __init__(self, batch_size=500, workers=None, pool=None):
+        self.batch_size = batch_size
+        # workers=0 hashes in-process (useful for tests and tiny imports)
+        self.workers = workers
+        self.created = 0
+        self.errors = []
+        self._seen = set()
+        # A pool passed in (see shared_pool()) is used but not shut down
+        self._pool = pool
+        self._owns_pool = pool is None
+
+    def run(self, records):
+        try:
+            numbered = self._numbered(records)
+            while True:
+                batch = list(islice(numbered, self.batch_size))
+                if not batch:
+                    break
+                self._import_batch(batch)
+        finally:
+            if self._owns_pool and self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        return self.report()
+
+    @staticmethod
+    def _numbered(records):
+        """(row, record) pairs; an unreadable row ends them with its error."""
+        row = 0
+        try:
+            for row, record in enumerate(records, start=1):
+                yield row, record
+        except RecordParseError as exc:
+            yield row + 1, exc
+
+    def _hash_passwords(self, passwords):
+        if (
+            self.workers == 0
+            or sum(1 for password in passwords if password) < MIN_POOL_PASSWORDS
+        ):
+            # Nothing worth a worker process (unusable passwords are cheap)
+            return [_hash(password) for password in passwords]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker
+            )
+        try:
+            return list(self._pool.map(_hash, passwords, chunksize=16))
+        except BrokenExecutor:
+            if self._owns_pool:
+                raise
+            # A worker of the shared pool died: replace the pool for the
+            # next import and finish this one in-process.
+            _discard_shared_pool(self._pool)
+            self._pool = None
+            self.workers = 0
+            return [_hash(password) for password in passwords]
+
+    def report(self):
+        return {
+            "created": self.created,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+
+    def _fail(self, row, errors):
+        self.errors.append({"row": row, "errors": errors})
+
+    @staticmethod
+    def _unique_keys(email, username):
+        # Emails are unique whatever their case; usernames are not.
+        return {("email", email.lower()), ("username", username)}
+
+    def _validate(self, batch):
+        valid = []
+        for row, record in batch:
+            if isinstance(record, RecordParseError):
+                message = f"{record} Rows after it were not imported."
+                self._fail(row, {"non_field_errors": [message]})
+                continue
+            if not isinstance(record, dict):
+                self._fail(row, {"non_field_errors": ["Expected an object."]})
+                continue
+            serializer = EmployeeImportSerializer(data=record)
+            if not serializer.is_valid():
+                self._fail(row, serializer.errors)
+                continue
+            data = serializer.validated_data
+            keys = self._unique_keys(data["email"], data["username"])
+            if keys & self._seen:
+                self._fail(row, {"email": ["Duplicate email or username in import."]})
+                continue
+            self._seen |= keys
+            valid.append((row, data))
+        if not valid:
+            return valid
+
+        # One query per batch for conflicts with existing users
+        taken = set()
+        existing = (
+            User.objects.annotate(email_lower=Lower("email"))
+            .filter(
+                Q(email_lower__in=[data["email"].lower() for _, data in valid])
+                | Q(username__in=[data["username"] for _, data in valid])
+            )
+            .values_list("email", "username")
+        )
+        for email, username in existing:
+            taken |= self._unique_keys(email, username)
+        checked = []
+        for row, data in valid:
+            if self._unique_keys(data["email"], data["username"]) & taken:
+                message = "A user with this email or username already exists."
+                self._fail(row, {"email": [message]})
+            else:
+                checked.append((row, data))
+        return checked
+
+    def _import_batch(self, batch):
+        valid = self._validate(batch)
+        if not valid:
+            return
+        hashes = self._hash_passwords([data.get("password") for _, data in valid])
+
+        users = [
+            User(
+                email=data["email"],
+                username=data["username"],
+                password=hashed,
+                role="employee",
+            )
+            for (_, data), hashed in zip(valid, hashes)
+        ]
+        try:
+            with transaction.atomic():
+                self._insert(valid, users)
+        except IntegrityError:
+            # A concurrent insert took one of the emails; retry row by row
+            # so only the conflicting rows fail.
+            for (row, data), user in zip(valid, users):
+                user.pk = None
+                try:
+                    with transaction.atomic():
+                        self._insert([(row, data)], [user])
+                except IntegrityError as exc:
+                    self._fail(row, {"non_field_errors": [str(exc)]})
+
+    def _insert(self, valid, users):
+        User.objects.bulk_create(users)
+        if any(user.pk is None for user in users):
+            # Backends without RETURNING on bulk insert: look the ids up.
+            ids = dict(
+                User.objects.filter(email__in=[u.email for u in users]).values_list(
+                    "email", "id"
+                )
+            )
+            for user in users:
+                user.pk = ids[user.email]
+        EmployeeProfile.objects.bulk_create(
+            [self._profile(user, data) for (_, data), user in zip(valid, users)]
+        )
+        self.created += len(users)
+
+    @staticmethod
+    def _profile(user, data):
+        profile = EmployeeProfile(
+            user_id=user.pk,
+            phone_number=data["phone_number"],
+            department=data["department"],
+            joining_date=data["joining_date"],
+        )
+        if "leave_balance" in data:
+            profile.leave_balance = data["leave_balance"]
+        return profile
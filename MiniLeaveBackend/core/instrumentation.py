@@ -0,0 +1,166 @@
+"""
+Per-request query counting and timing.
+
+RequestMetricsMiddleware (core.middleware) opens a RequestMetrics for every
+request in a context variable. While it is set, every SQL query and every
+top-level serializer to_representation() call adds to it; context
+variables follow the request into sync_to_async threads, so async views
+are measured too. Finished requests are folded into per-endpoint totals
+kept in this process and served by the HR-only request metrics endpoint.
+
+Configured by the REQUEST_METRICS setting (see DEFAULTS).
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+DEFAULTS = {
+    "ENABLED": True,
+    # Requests issuing more queries than this are flagged; None disables.
+    "QUERY_BUDGET": 10,
+    "SERVER_TIMING": True,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "REQUEST_METRICS", {})}
+
+
+class RequestMetrics:
+    __slots__ = ("started", "queries", "sql_ms", "serializer_ms", "_serializing")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.serializer_ms = 0.0
+        self._serializing = 0
+
+    @property
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+current_metrics = ContextVar("current_metrics", default=None)
+
+
+# ---------------------- SQL ----------------------
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_ms += (time.perf_counter() - started) * 1000
+
+
+def install_query_hook(connection, **kwargs):
+    """
+    Add record_query to a connection's execute wrappers. Connected to
+    connection_created so every thread's connection is covered, including
+    the ones sync_to_async runs the ORM on under ASGI.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_hook)
+
+
+# ---------------------- SERIALIZERS ----------------------
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent in to_representation() to the current request.
+    Only the outermost call is timed, so nested serializers (and the items
+    of a many=True list) are not counted twice.
+    """
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics._serializing:
+            return super().to_representation(instance)
+        metrics._serializing += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics._serializing -= 1
+            metrics.serializer_ms += (time.perf_counter() - started) * 1000
+
+
+# ---------------------- AGGREGATES ----------------------
+
+
+class EndpointStats:
+    """Running totals per endpoint, shared by the threads of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, metrics, response_bytes, over_budget):
+        with self._lock:
+            totals = self._endpoints.setdefault(
+                endpoint,
+                {
+                    "requests": 0,
+                    "queries": 0,
+                    "queries_max": 0,
+                    "sql_ms": 0.0,
+                    "serializer_ms": 0.0,
+                    "duration_ms": 0.0,
+                    "duration_ms_max": 0.0,
+                    "response_bytes": 0,
+                    "over_budget": 0,
+                },
+            )
+            duration = metrics.elapsed_ms
+            totals["requests"] += 1
+            totals["queries"] += metrics.queries
+            totals["queries_max"] = max(totals["queries_max"], metrics.queries)
+            totals["sql_ms"] += metrics.sql_ms
+            totals["serializer_ms"] += metrics.serializer_ms
+            totals["duration_ms"] += duration
+            totals["duration_ms_max"] = max(totals["duration_ms_max"], duration)
+            totals["response_bytes"] += response_bytes
+            totals["over_budget"] += over_budget
+
+    def snapshot(self):
+        """Per-endpoint means and maxima, busiest endpoint first."""
+        with self._lock:
+            endpoints = {name: dict(totals) for name, totals in self._endpoints.items()}
+        report = {}
+        for name, totals in sorted(
+            endpoints.items(), key=lambda item: -item[1]["requests"]
+        ):
+            count = totals["requests"]
+            report[name] = {
+                "requests": count,
+                "queries_mean": round(totals["queries"] / count, 2),
+                "queries_max": totals["queries_max"],
+                "sql_ms_mean": round(totals["sql_ms"] / count, 3),
+                "serializer_ms_mean": round(totals["serializer_ms"] / count, 3),
+                "duration_ms_mean": round(totals["duration_ms"] / count, 3),
+                "duration_ms_max": round(totals["duration_ms_max"], 3),
+                "response_bytes_mean": round(totals["response_bytes"] / count),
+                "over_budget": totals["over_budget"],
+            }
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+endpoint_stats = EndpointStats()
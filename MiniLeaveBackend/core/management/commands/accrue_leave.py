@@ -0,0 +1,65 @@
+import time
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.accrual import AccrualPolicyError, run_accrual
+from core.models import AccrualPolicy, AccrualRun
+
+
+def parse_period(value):
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError(f"Invalid period {value!r}; expected YYYY-MM.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Credit one month of leave accrual (see AccrualPolicy) to every "
+        "eligible employee. Safe to re-run: an interrupted month resumes "
+        "where it stopped and a finished month is not credited again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--period", help="Month to accrue, YYYY-MM (default: the current month)."
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        period = (
+            parse_period(options["period"])
+            if options["period"]
+            else date.today().replace(day=1)
+        )
+        existing = AccrualRun.objects.filter(period=period).first()
+        if existing and existing.status == AccrualRun.StatusChoices.COMPLETED:
+            self.stdout.write(f"Accrual for {period:%Y-%m} already completed.")
+            return
+        if existing is None and not AccrualPolicy.objects.exists():
+            raise CommandError("No accrual policies are defined.")
+        if existing:
+            self.stdout.write(
+                f"Resuming {period:%Y-%m} after employee {existing.last_employee_id}"
+            )
+
+        started = time.perf_counter()
+        try:
+            run = run_accrual(
+                period,
+                chunk_size=options["chunk_size"],
+                progress=lambda run: self.stdout.write(
+                    f"  up to employee {run.last_employee_id}: "
+                    f"{run.employees_credited} employees credited"
+                ),
+            )
+        except AccrualPolicyError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Accrued {period:%Y-%m}: {run.days_credited} days to "
+                f"{run.employees_credited} employees in "
+                f"{time.perf_counter() - started:.1f}s"
+            )
+        )
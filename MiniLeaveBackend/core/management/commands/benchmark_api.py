@@ -0,0 +1,561 @@
+import json
+import logging
+import math
+import random
+import subprocess
+from collections import Counter
+from contextlib import ExitStack
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.analytics import rebuild_rollups
+from core.benchmarking import run_threaded, scratch_database, seed, summarize
+from core.models import Application, EmployeeProfile, HrProfile, User
+from core.services import ledger_state, sync_ledger
+
+PASSWORD = "bench-password"
+
+# Metrics compared by --compare; for all of them higher is worse except rps.
+COMPARED = ("p50_ms", "p95_ms", "p99_ms", "queries_mean", "requests_per_second")
+
+# Applications per bulk_decide_leaves request
+BULK_BATCH = 20
+
+
+class Fixtures:
+    """Seeded data the scenarios draw their requests from."""
+
+    def __init__(self, options, pending=2):
+        self.rng = random.Random(3)
+        self.employee_ids = seed(
+            options["employees"], options["applications"], pending=pending
+        )
+        for application in Application.objects.all().iterator():
+            sync_ledger(None, ledger_state(application))
+        rebuild_rollups()
+
+        self.hr = User.objects.create_user(
+            username="bench-hr",
+            email="bench-hr@example.com",
+            password=PASSWORD,
+            role="hr",
+            is_staff=True,
+        )
+        HrProfile.objects.create(user=self.hr)
+        self.hr_auth = self._auth(Token.objects.create(user=self.hr))
+
+        # Employees are handed out once each to scenarios that consume them
+        # (logging out, being deleted) so no request hits a stale fixture.
+        self._free_employees = list(self.employee_ids)
+        self.rng.shuffle(self._free_employees)
+        self._pending = list(
+            Application.objects.filter(status=Application.StatusChoices.PENDING)
+            .order_by("?")
+            .values_list("id", flat=True)
+        )
+
+    @staticmethod
+    def _auth(token):
+        return f"Token {token.key}"
+
+    def take_employees(self, count):
+        if count > len(self._free_employees):
+            raise CommandError(
+                f"Need {count} more employees than were seeded; raise --employees."
+            )
+        taken = self._free_employees[:count]
+        del self._free_employees[:count]
+        return taken
+
+    def take_pending(self, count):
+        if count > len(self._pending):
+            raise CommandError(
+                f"Need {count} pending applications, {len(self._pending)} left; "
+                "raise --employees or lower --requests."
+            )
+        taken = self._pending[:count]
+        del self._pending[:count]
+        return taken
+
+    def employee_tokens(self, employee_ids):
+        """
+        Tokens for the employees, created unless an earlier scenario did;
+        returns {employee_id: header}.
+        """
+        user_ids = dict(
+            EmployeeProfile.objects.filter(id__in=employee_ids).values_list(
+                "id", "user_id"
+            )
+        )
+        tokens = dict(
+            Token.objects.filter(user_id__in=user_ids.values()).values_list(
+                "user_id", "key"
+            )
+        )
+        created = Token.objects.bulk_create(
+            [
+                Token(key=Token.generate_key(), user_id=user_id)
+                for user_id in user_ids.values()
+                if user_id not in tokens
+            ]
+        )
+        tokens.update((token.user_id, token.key) for token in created)
+        return {
+            employee_id: f"Token {tokens[user_ids[employee_id]]}"
+            for employee_id in employee_ids
+        }
+
+
+def job(method, path, auth=None, data=None, files=None):
+    return {"method": method, "path": path, "auth": auth, "data": data, "files": files}
+
+
+# ---------------------- SCENARIOS ----------------------
+# One function per route name in core.urls: scenario(fixtures, n) returns the
+# n requests to send. They run in this order, so reads see the seeded data
+# and destructive ones go last.
+
+
+def login(fx, n):
+    data = {"email": fx.hr.email, "password": PASSWORD}
+    return [job("POST", reverse("login"), data=data) for _ in range(n)]
+
+
+def leave_balance(fx, n):
+    return [
+        job(
+            "GET",
+            reverse("leave_balance", args=[fx.rng.choice(fx.employee_ids)]),
+            fx.hr_auth,
+        )
+        for _ in range(n)
+    ]
+
+
+def leave_balances(fx, n):
+    path = reverse("leave_balances")
+    queries = ["", "?department=engineering", f"?year={timezone.now().year - 1}"]
+    return [job("GET", path + queries[i % len(queries)], fx.hr_auth) for i in range(n)]
+
+
+def view_all_applications(fx, n):
+    path = reverse("view_all_applications")
+    queries = [
+        "",
+        "?status=pending",
+        "?status=approved&department=sales",
+        "?date_from=2016-06-01&date_to=2016-12-31",
+    ]
+    return [job("GET", path + queries[i % len(queries)], fx.hr_auth) for i in range(n)]
+
+
+def request_metrics(fx, n):
+    return [job("GET", reverse("request_metrics"), fx.hr_auth) for _ in range(n)]
+
+
+def prometheus_metrics(fx, n):
+    return [job("GET", reverse("prometheus_metrics"), fx.hr_auth) for _ in range(n)]
+
+
+def export_applications(fx, n):
+    path = reverse("export_applications")
+    queries = ["?output=csv&year=2016", "?output=ndjson&department=finance"]
+    return [job("GET", path + queries[i % len(queries)], fx.hr_auth) for i in range(n)]
+
+
+def leave_analytics(fx, n):
+    path = reverse("leave_analytics")
+    queries = ["", "?group_by=department&date_from=2016-01-01", "?group_by=month"]
+    return [job("GET", path + queries[i % len(queries)], fx.hr_auth) for i in range(n)]
+
+
+def leave_calendar(fx, n):
+    # Month views over the seeded years, per department and org-wide.
+    path = reverse("leave_calendar")
+    jobs = []
+    for i in range(n):
+        month = date(2016 + i % 3, 1 + i % 12, 1)
+        query = f"?date_from={month}&date_to={month + timedelta(days=30)}"
+        if i % 2:
+            query += "&department=finance"
+        jobs.append(job("GET", path + query, fx.hr_auth))
+    return jobs
+
+
+def holidays(fx, n):
+    # Reads only: a new holiday clears every worker's working-day cache.
+    path = reverse("holidays")
+    return [job("GET", f"{path}?year={2016 + i % 3}", fx.hr_auth) for i in range(n)]
+
+
+def apply_leave(fx, n):
+    # Every request comes from a different employee when there are enough
+    # of them; repeat employees get later, non-overlapping weeks.
+    employees = fx.employee_ids[:n]
+    auths = fx.employee_tokens(employees)
+    path = reverse("apply_leave")
+    jobs = []
+    for i in range(n):
+        start = date(2030, 1, 7) + timedelta(weeks=i // len(employees))
+        data = {
+            "leave_type": Application.LeaveType.ANNUAL,
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=1)).isoformat(),
+            "reason": "Benchmark",
+        }
+        jobs.append(job("POST", path, auths[employees[i % len(employees)]], data))
+    return jobs
+
+
+def approve_leave(fx, n):
+    return [
+        job("PATCH", reverse("approve_leave", args=[pk]), fx.hr_auth)
+        for pk in fx.take_pending(n)
+    ]
+
+
+def reject_leave(fx, n):
+    return [
+        job(
+            "PATCH",
+            reverse("reject_leave", args=[pk]),
+            fx.hr_auth,
+            {"rejection_reason": "Benchmark"},
+        )
+        for pk in fx.take_pending(n)
+    ]
+
+
+def bulk_decide_leaves(fx, n, batch=BULK_BATCH):
+    path = reverse("bulk_decide_leaves")
+    jobs = []
+    for _ in range(n):
+        decisions = [
+            {"application_id": pk, "decision": fx.rng.choice(["approve", "reject"])}
+            for pk in fx.take_pending(batch)
+        ]
+        jobs.append(job("PATCH", path, fx.hr_auth, {"decisions": decisions}))
+    return jobs
+
+
+def add_hr(fx, n):
+    return [
+        job(
+            "POST",
+            reverse("add_hr"),
+            fx.hr_auth,
+            {
+                "email": f"bench-hr{i}@example.com",
+                "username": f"bench-hr{i}",
+                "password": PASSWORD,
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def add_employee(fx, n):
+    return [
+        job(
+            "POST",
+            reverse("add_employee"),
+            fx.hr_auth,
+            {
+                "email": f"bench-new{i}@example.com",
+                "username": f"bench-new{i}",
+                "password": PASSWORD,
+                "phone_number": "0300000000",
+                "department": "engineering",
+                "joining_date": "2024-01-01",
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def import_employees(fx, n, rows=50):
+    jobs = []
+    for i in range(n):
+        lines = ["email,phone_number,department,joining_date"]
+        lines += [
+            f"bench-import{i}-{row}@example.com,0300000000,support,2024-01-01"
+            for row in range(rows)
+        ]
+        upload = ("employees.csv", "\n".join(lines).encode())
+        jobs.append(job("POST", reverse("import_employees"), fx.hr_auth, files=upload))
+    return jobs
+
+
+def logout(fx, n):
+    auths = fx.employee_tokens(fx.take_employees(n))
+    return [job("POST", reverse("logout"), auth) for auth in auths.values()]
+
+
+def delete_employee(fx, n):
+    return [
+        job("DELETE", reverse("delete_employee"), fx.hr_auth, {"employee_id": pk})
+        for pk in fx.take_employees(n)
+    ]
+
+
+# Routes that are not request/response and so are not load tested here
+UNBENCHMARKED = {"leave_events": "long-lived server-sent events stream"}
+
+# Pending applications each request of these scenarios decides
+PENDING_PER_REQUEST = {
+    "approve_leave": 1,
+    "reject_leave": 1,
+    "bulk_decide_leaves": BULK_BATCH,
+}
+
+SCENARIOS = {
+    scenario.__name__: scenario
+    for scenario in [
+        login,
+        leave_balance,
+        leave_balances,
+        view_all_applications,
+        request_metrics,
+        prometheus_metrics,
+        export_applications,
+        leave_analytics,
+        leave_calendar,
+        holidays,
+        apply_leave,
+        approve_leave,
+        reject_leave,
+        bulk_decide_leaves,
+        add_hr,
+        add_employee,
+        import_employees,
+        logout,
+        delete_employee,
+    ]
+}
+
+
+def send(request):
+    """Send one request; returns (ms, status code, query count)."""
+    client = Client(raise_request_exception=False)
+    headers = {"Authorization": request["auth"]} if request["auth"] else {}
+    try:
+        # Every alias, so that reads sent to replicas are counted too
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(alias))
+                for alias in connections.all()
+            ]
+            if request["files"]:
+                name, content = request["files"]
+                response = client.post(
+                    request["path"],
+                    {"file": SimpleUploadedFile(name, content)},
+                    headers=headers,
+                )
+            else:
+                response = client.generic(
+                    request["method"],
+                    request["path"],
+                    json.dumps(request["data"]) if request["data"] else "",
+                    content_type="application/json",
+                    headers=headers,
+                )
+            if response.streaming:
+                # Streamed bodies do their work while being read
+                b"".join(response.streaming_content)
+        return response.status_code, sum(len(queries) for queries in captured)
+    finally:
+        # Like the request_finished handler with CONN_MAX_AGE=0
+        connections.close_all()
+
+
+def route_names():
+    from core.urls import urlpatterns
+
+    return [pattern.name for pattern in urlpatterns if pattern.name]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database and drive every API route with concurrent "
+        "clients; report latency percentiles, throughput and query counts per "
+        "endpoint, optionally saving them as JSON and comparing with an "
+        "earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--employees", type=int, default=1_000)
+        parser.add_argument("--applications", type=int, default=20_000)
+        parser.add_argument(
+            "--requests", type=int, default=100, help="Requests per endpoint."
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--only", nargs="+", metavar="ROUTE", help="Benchmark only these routes."
+        )
+        parser.add_argument("--skip", nargs="+", metavar="ROUTE", default=[])
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="Compare with results saved earlier by --output."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=10.0,
+            help="Percent change counted as a regression in --compare.",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error when --compare finds a regression.",
+        )
+
+    def handle(self, *args, **options):
+        routes = route_names()
+        missing = [
+            name
+            for name in routes
+            if name not in SCENARIOS and name not in UNBENCHMARKED
+        ]
+        for name in missing:
+            self.stderr.write(self.style.WARNING(f"No benchmark scenario for {name}"))
+        selected = [
+            name
+            for name in SCENARIOS
+            if name in routes
+            and (not options["only"] or name in options["only"])
+            and name not in options["skip"]
+        ]
+        unknown = set(options["only"] or []) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+
+        previous = None
+        if options["compare"]:
+            with open(options["compare"]) as fh:
+                previous = json.load(fh)
+
+        self.stdout.write(
+            f"Seeding {options['employees']} employees / "
+            f"{options['applications']} applications ..."
+        )
+        endpoints = {}
+        # Failed requests are counted in the report; rendering their
+        # tracebacks would add noise and queries to the measurements.
+        request_logger = logging.getLogger("django.request")
+        request_logger.disabled = True
+        with scratch_database() as conn:
+            vendor = conn.vendor
+            fixtures = Fixtures(options, self._pending_per_employee(selected, options))
+            for name in selected:
+                try:
+                    requests = SCENARIOS[name](fixtures, options["requests"])
+                except Exception as exc:
+                    # Keep the other endpoints' results
+                    endpoints[name] = {"error": f"{type(exc).__name__}: {exc}"}
+                    self.stderr.write(self.style.ERROR(f"{name}: {exc}"))
+                    continue
+                timings, outcomes, wall = run_threaded(
+                    send, requests, options["concurrency"]
+                )
+                endpoints[name] = self._report(timings, outcomes, wall)
+                self.stdout.write(f"{name}: {endpoints[name]}")
+        request_logger.disabled = False
+
+        results = {
+            "meta": {
+                "revision": git_revision(),
+                "created_at": timezone.now().isoformat(),
+                "database": vendor,
+                "employees": options["employees"],
+                "applications": options["applications"],
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+            },
+            "endpoints": endpoints,
+            "missing_scenarios": missing,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['output']}")
+            )
+
+        if previous is not None:
+            regressions = self._compare(previous, results, options["threshold"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(
+                    f"{len(regressions)} regressions: {', '.join(regressions)}"
+                )
+
+    @staticmethod
+    def _pending_per_employee(selected, options):
+        """Pending applications to seed per employee for the decisions."""
+        needed = sum(
+            PENDING_PER_REQUEST.get(name, 0) * options["requests"] for name in selected
+        )
+        employees = max(1, options["employees"])
+        return max(2, math.ceil(needed / employees))
+
+    @staticmethod
+    def _report(timings, outcomes, wall):
+        statuses = Counter(str(code) for code, _ in outcomes)
+        queries = [count for _, count in outcomes]
+        return {
+            **summarize(timings),
+            "requests_per_second": round(len(timings) / wall, 1) if wall else 0.0,
+            "queries_mean": round(sum(queries) / len(queries), 2) if queries else 0.0,
+            "queries_max": max(queries, default=0),
+            "statuses": dict(sorted(statuses.items())),
+        }
+
+    def _compare(self, previous, current, threshold):
+        """Print per-endpoint changes; returns the regressed metrics."""
+        before_rev = previous.get("meta", {}).get("revision")
+        self.stdout.write(f"\nCompared with {before_rev or 'previous run'}:")
+        regressions = []
+        for name, after in current["endpoints"].items():
+            before = previous.get("endpoints", {}).get(name)
+            if "error" in after or (before is not None and "error" in before):
+                self.stdout.write(f"  {name}: not compared (failed run)")
+                continue
+            if before is None:
+                self.stdout.write(f"  {name}: new endpoint")
+                continue
+            changes = []
+            for metric in COMPARED:
+                old, new = before.get(metric), after.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old * 100
+                worse = -change if metric == "requests_per_second" else change
+                text = f"{metric} {old} -> {new} ({change:+.1f}%)"
+                if worse > threshold:
+                    regressions.append(f"{name}.{metric}")
+                    text = self.style.ERROR(text)
+                changes.append(text)
+            self.stdout.write(f"  {name}: " + ", ".join(changes))
+        return regressions
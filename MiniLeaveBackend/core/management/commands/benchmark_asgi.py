@@ -0,0 +1,89 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from rest_framework.authtoken.models import Token
+
+from core.benchmarking import (
+    leave_api_async,
+    run_async,
+    run_threaded,
+    scratch_database,
+    seed,
+    summarize,
+)
+from core.models import Application, User
+from core.services import ledger_state, sync_ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request throughput of the sync (WSGI, thread per request) and "
+        "async (ASGI, event loop) implementations of the leave read endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--employees", type=int, default=1_000)
+        parser.add_argument("--applications", type=int, default=20_000)
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            employee_ids = seed(options["employees"], options["applications"])
+            for application in Application.objects.all().iterator():
+                sync_ledger(None, ledger_state(application))
+            hr = User.objects.create_user(
+                username="bench-hr", email="bench-hr@example.com", role="hr"
+            )
+            auth = f"Token {Token.objects.create(user=hr).key}"
+
+            rng = random.Random(2)
+            paths = []
+            for n in range(options["requests"]):
+                if n % 2:
+                    paths.append(f"/api/leave/balance/{rng.choice(employee_ids)}/")
+                else:
+                    paths.append("/api/leave/applications/?status=pending")
+
+            results = {}
+            with leave_api_async(False):
+                client = Client(headers={"Authorization": auth})
+                timings, _, wall = run_threaded(
+                    lambda path: self._check(client.get(path)),
+                    paths,
+                    options["concurrency"],
+                )
+                results["sync_wsgi"] = self._report(timings, wall)
+
+            with leave_api_async(True):
+                async_client = AsyncClient()
+
+                async def call(path):
+                    response = await async_client.get(
+                        path, headers={"Authorization": auth}
+                    )
+                    self._check(response)
+
+                timings, _, wall = run_async(call, paths, options["concurrency"])
+                results["async_asgi"] = self._report(timings, wall)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for label, report in results.items():
+            self.stdout.write(self.style.SUCCESS(f"{label}: {report}"))
+
+    @staticmethod
+    def _check(response):
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code}: {response.content[:200]!r}")
+
+    @staticmethod
+    def _report(timings, wall):
+        return {
+            **summarize(timings),
+            "requests_per_second": round(len(timings) / wall, 1),
+        }
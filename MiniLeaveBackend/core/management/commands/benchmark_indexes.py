@@ -0,0 +1,134 @@
+import json
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import availability
+from core.benchmarking import scratch_database, seed, summarize, time_calls
+from core.models import Application
+from core.services import (
+    OVERLAP_VENDORS,
+    LeaveApplicationError,
+    _applicant_query,
+    submit_application,
+)
+
+
+def _submit_and_roll_back(employee_id, data):
+    """submit_application() as a request runs it, leaving no trace."""
+    try:
+        with transaction.atomic():
+            submit_application(employee_id, data)
+            transaction.set_rollback(True)
+    except LeaveApplicationError:
+        # Over the balance: the checks ran, the INSERT was rolled back
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database and compare query plans and timings of "
+        "leave applications (services.submit_application: insert, overlap "
+        "and balance checks), the HR listing and the team calendar with and "
+        "without the composite indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--employees", type=int, default=10_000)
+        parser.add_argument("--applications", type=int, default=1_000_000)
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.stdout.write(
+                f"Seeding {options['employees']} employees / "
+                f"{options['applications']} applications ..."
+            )
+            employee_ids = seed(options["employees"], options["applications"])
+            if connection.vendor in ("postgresql", "sqlite"):
+                # Refresh planner statistics after the bulk load.
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+
+            results = {"with_indexes": self._measure(employee_ids, options)}
+            indexes = Application._meta.indexes
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(Application, index)
+            results["without_indexes"] = self._measure(employee_ids, options)
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Application, index)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for label, measurements in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {label} =="))
+            for name, data in measurements.items():
+                self.stdout.write(self.style.SUCCESS(f"{name}: {data['timings']}"))
+                self.stdout.write(data["plan"])
+
+    def _measure(self, employee_ids, options):
+        rng = random.Random(1)
+        sample = [rng.choice(employee_ids) for _ in range(options["iterations"])]
+        employees = iter(sample * 2)
+        start = Application.objects.order_by("-start_date").values_list(
+            "start_date", flat=True
+        )[0]
+        # A Monday-to-Wednesday application after everyone's history
+        apply_from = start + timedelta(days=28 - start.weekday())
+        application = {
+            "leave_type": Application.LeaveType.ANNUAL,
+            "start_date": apply_from,
+            "end_date": apply_from + timedelta(days=2),
+            "reason_description": "Benchmark",
+        }
+
+        # The employee read with the balance (and, where the database does
+        # not reject overlaps itself, overlap) checks
+        applicant_qs = _applicant_query(
+            Application(employee_id=sample[0], **application),
+            check_overlap=connection.vendor not in OVERLAP_VENDORS,
+        )
+        listing_qs = Application.objects.filter(
+            status=Application.StatusChoices.PENDING
+        ).order_by("-created_at", "-id")[:50]
+
+        # An org-wide month view halfway through the seeded history.
+        first = Application.objects.order_by("start_date").values_list(
+            "start_date", flat=True
+        )[0]
+        month_from = first + (start - first) / 2
+        month_to = month_from + timedelta(days=30)
+        calendar_qs = availability.overlapping(month_from, month_to)
+
+        iterations = options["iterations"]
+        return {
+            "apply": {
+                "plan": applicant_qs.explain(),
+                "timings": summarize(
+                    time_calls(
+                        lambda: _submit_and_roll_back(next(employees), application),
+                        iterations,
+                    )
+                ),
+            },
+            "hr_listing": {
+                "plan": listing_qs.explain(),
+                "timings": summarize(
+                    time_calls(lambda: list(listing_qs.all()), iterations)
+                ),
+            },
+            "calendar": {
+                "plan": calendar_qs.explain(),
+                "timings": summarize(
+                    time_calls(
+                        lambda: availability.calendar(month_from, month_to), iterations
+                    )
+                ),
+            },
+        }
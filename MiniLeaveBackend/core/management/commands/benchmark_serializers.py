@@ -0,0 +1,129 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from core.benchmarking import scratch_database, seed
+from core.fast_serializers import APPLICATION_ROW, BALANCE_ROW
+from core.models import Application, EmployeeProfile
+from core.renderers import dumps, orjson
+from core.serializers import ApplicationSerializer
+
+
+class LeaveBalanceSerializer(serializers.ModelSerializer):
+    """The DRF serializer the balances list used before BALANCE_ROW."""
+
+    # Annotated by the balances query (sums over the year's ledger rows)
+    pending_days = serializers.IntegerField(read_only=True)
+    approved_days = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = EmployeeProfile
+        fields = ["id", "department", "leave_balance", "pending_days", "approved_days"]
+
+
+def _best_of(func, repeat):
+    """Lowest wall time of `repeat` calls in milliseconds, and the last result."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database and compare the per-row cost of the DRF "
+        "serializers with the values() fast path used by the application "
+        "and balance list endpoints (fetch, serialize and render to JSON)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--employees", type=int, default=2_000)
+        parser.add_argument("--applications", type=int, default=20_000)
+        parser.add_argument("--rows", type=int, default=5_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with scratch_database():
+            if not options["json"]:
+                self.stdout.write(
+                    f"Seeding {options['employees']} employees / "
+                    f"{options['applications']} applications ..."
+                )
+            seed(options["employees"], options["applications"])
+            applications = Application.objects.order_by("-created_at", "-id")[:rows]
+            in_year = Q(ledger_entries__year=2025)
+            employees = EmployeeProfile.objects.annotate(
+                pending_days=Coalesce(
+                    Sum("ledger_entries__pending_days", filter=in_year), 0
+                ),
+                approved_days=Coalesce(
+                    Sum("ledger_entries__approved_days", filter=in_year), 0
+                ),
+            ).order_by("id")[:rows]
+
+            results = {
+                "applications": self._compare(
+                    lambda: list(applications.select_related("employee")),
+                    lambda page: ApplicationSerializer(page, many=True).data,
+                    lambda: list(applications.values(*APPLICATION_ROW.lookups)),
+                    APPLICATION_ROW.many,
+                    options["repeat"],
+                ),
+                "balances": self._compare(
+                    lambda: list(employees.all()),
+                    lambda page: LeaveBalanceSerializer(page, many=True).data,
+                    lambda: list(employees.values(*BALANCE_ROW.lookups)),
+                    BALANCE_ROW.many,
+                    options["repeat"],
+                ),
+            }
+        results["renderer"] = "orjson" if orjson is not None else "json"
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"JSON renderer: {results['renderer']}")
+        for name in ("applications", "balances"):
+            result = results[name]
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(f"\n== {name} ({result['rows']} rows) ==")
+            )
+            for stage in ("fetch", "serialize", "render", "total"):
+                drf = result["drf"][f"{stage}_us_per_row"]
+                fast = result["fast"][f"{stage}_us_per_row"]
+                self.stdout.write(
+                    f"{stage:>10}: drf {drf:8.2f} us/row   "
+                    f"fast {fast:8.2f} us/row   x{drf / fast if fast else 0:.1f}"
+                )
+
+    def _compare(self, fetch, serialize, fetch_rows, serialize_rows, repeat):
+        drf, drf_body = self._measure(fetch, serialize, JSONRenderer().render, repeat)
+        fast, fast_body = self._measure(fetch_rows, serialize_rows, dumps, repeat)
+        if json.loads(drf_body) != json.loads(fast_body):
+            raise CommandError("The fast path output differs from the serializer's.")
+        return {"rows": drf.pop("rows"), "drf": drf, "fast": fast}
+
+    def _measure(self, fetch, serialize, render, repeat):
+        fetch_ms, page = _best_of(fetch, repeat)
+        serialize_ms, data = _best_of(lambda: serialize(page), repeat)
+        render_ms, body = _best_of(lambda: render(data), repeat)
+        count = max(len(page), 1)
+        timings = {"rows": len(page)}
+        for stage, ms in (
+            ("fetch", fetch_ms),
+            ("serialize", serialize_ms),
+            ("render", render_ms),
+            ("total", fetch_ms + serialize_ms + render_ms),
+        ):
+            timings[f"{stage}_us_per_row"] = round(ms * 1000 / count, 3)
+        return timings, body
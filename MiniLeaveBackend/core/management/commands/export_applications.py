@@ -0,0 +1,65 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import FORMATS, blocks, export_rows, render
+from core.models import Application
+from core.serializers import ExportFilterSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream leave applications (with employee department and days) to a "
+        "CSV or NDJSON file in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", default="-", help="Output file, or '-' for stdout."
+        )
+        parser.add_argument("--format", choices=FORMATS, default="csv", dest="output")
+        parser.add_argument("--year", type=int)
+        parser.add_argument("--date-from", help="YYYY-MM-DD")
+        parser.add_argument("--date-to", help="YYYY-MM-DD")
+        parser.add_argument("--department")
+        parser.add_argument("--status", choices=Application.StatusChoices.values)
+        parser.add_argument("--leave-type", choices=Application.LeaveType.values)
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        filters = ExportFilterSerializer(
+            data={
+                key: options[key]
+                for key in (
+                    "output",
+                    "year",
+                    "date_from",
+                    "date_to",
+                    "department",
+                    "status",
+                    "leave_type",
+                )
+                if options[key] is not None
+            }
+        )
+        if not filters.is_valid():
+            raise CommandError(json.dumps(filters.errors))
+
+        rows = export_rows(
+            filters.filter_queryset(Application.objects.all()),
+            chunk_size=options["chunk_size"],
+        )
+        content = blocks(render(rows, filters.validated_data["output"]))
+        if options["path"] == "-":
+            for block in content:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
+            return
+        try:
+            with open(options["path"], "wb") as fh:
+                for block in content:
+                    fh.write(block)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        self.stderr.write(self.style.SUCCESS(f"Exported to {options['path']}"))
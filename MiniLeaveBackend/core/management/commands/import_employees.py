@@ -0,0 +1,44 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importers import FORMATS, EmployeeImporter, detect_format, iter_records
+
+
+class Command(BaseCommand):
+    help = "Bulk import employees from a CSV or JSON (array or JSON Lines) file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or '-' for stdin.")
+        parser.add_argument("--format", choices=FORMATS, dest="file_format")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Password hashing processes (default: CPU count, 0 = in-process).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["file_format"] or detect_format(path)
+        importer = EmployeeImporter(
+            batch_size=options["batch_size"], workers=options["workers"]
+        )
+        try:
+            if path == "-":
+                report = importer.run(iter_records(sys.stdin.buffer, file_format))
+            else:
+                with open(path, "rb") as stream:
+                    report = importer.run(iter_records(stream, file_format))
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report['created']} employees imported, {report['failed']} rows failed"
+            )
+        )
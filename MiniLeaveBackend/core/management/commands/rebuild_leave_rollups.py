@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the leave analytics rollup table from the applications. "
+        "Only needed after writes that bypass the application services "
+        "(raw SQL, fixtures, admin deletes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollup rows"))
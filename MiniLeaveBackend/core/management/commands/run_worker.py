@@ -0,0 +1,42 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (rollup updates and other side effects "
+        "of leave decisions) on a pool of threads until stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls while the queue is empty.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once no job is due."
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options["concurrency"], poll_interval=options["poll_interval"]
+        )
+        # Finish the jobs in hand, then exit.
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: worker.stop())
+
+        self.stdout.write(
+            f"Worker {worker.name} running with {worker.concurrency} threads"
+        )
+        worker.run(once=options["once"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stopped: {worker.succeeded} jobs succeeded, {worker.failed} failed"
+            )
+        )
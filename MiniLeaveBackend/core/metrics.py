@@ -0,0 +1,275 @@
+"""
+Counters and latency histograms in the Prometheus text format.
+
+Values are kept in memory per process. With METRICS["DIR"] set, each
+process also writes a snapshot of its values to its own JSON file in that
+directory (FLUSH_INTERVAL seconds after a change at the latest, and at
+exit), and the exposition endpoint adds up the snapshots of every process, so a scrape
+of any worker reports totals for the whole deployment. Without a
+directory each worker only reports its own values.
+
+Files of stopped processes are kept, like prometheus_client's
+multiprocess mode, so counters never go backwards; clear the directory
+when the deployment restarts.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+DEFAULTS = {
+    "DIR": None,
+    "FLUSH_INTERVAL": 1.0,
+}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "METRICS", {})}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, values):
+        for key, value in values.items():
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    """Observation counts per bucket (not cumulative), then sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0, 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+        self.registry.changed()
+
+    def merge(self, total, value):
+        if len(value) != len(self.buckets) + 3:
+            return total  # written with other buckets; cannot be combined
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, values):
+        for key, state in values.items():
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", labels + [("le", le)], cumulative
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+
+def _escape(value):
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._last_flush = 0.0
+        self._path = None
+        self._pid = None
+        self._flush_lock = threading.Lock()
+        self._timer_lock = threading.Lock()
+        self._timer = None
+        self._timer_pid = None
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    # ---- Multiprocess store ----
+    @property
+    def directory(self):
+        directory = get_options()["DIR"]
+        return Path(directory) if directory else None
+
+    def _own_file(self, directory):
+        pid = os.getpid()
+        # Re-derived after a fork so preloaded workers get their own file;
+        # the start time keeps a recycled pid from overwriting the totals of
+        # the dead process it belonged to.
+        if self._path is None or self._pid != pid or self._path.parent != directory:
+            self._pid = pid
+            self._path = directory / f"metrics-{pid}-{time.time_ns()}.json"
+        return self._path
+
+    def changed(self):
+        """
+        Flush now if the last flush is FLUSH_INTERVAL old, else make sure a
+        timer flushes once it is, so the last changes of a worker that goes
+        idle are written too.
+        """
+        options = get_options()
+        if not options["DIR"]:
+            return
+        wait = self._last_flush + options["FLUSH_INTERVAL"] - time.monotonic()
+        if wait <= 0:
+            self.flush()
+            return
+        pid = os.getpid()
+        with self._timer_lock:
+            # A timer of the parent does not run in a forked child.
+            if self._timer is not None and self._timer_pid == pid:
+                return
+            self._timer = timer = threading.Timer(wait, self._flush_pending)
+            self._timer_pid = pid
+        timer.daemon = True
+        timer.start()
+
+    def _flush_pending(self):
+        # Cleared first: a change made during the flush schedules a new one.
+        with self._timer_lock:
+            self._timer = None
+        self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: [[list(key), value] for key, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self):
+        directory = self.directory
+        if directory is None:
+            return
+        # One at a time, so an older snapshot never replaces a newer one
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            directory.mkdir(parents=True, exist_ok=True)
+            path = self._own_file(directory)
+            # Write then rename, so readers never see a half-written file
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+            with os.fdopen(fd, "w") as fh:
+                json.dump(self.snapshot(), fh)
+            os.replace(tmp, path)
+
+    def collect(self):
+        """Values of every metric, summed over all processes' snapshots."""
+        totals = {name: {} for name in self.metrics}
+        snapshots = [self.snapshot()]
+        directory = self.directory
+        if directory is not None and directory.is_dir():
+            own = self._own_file(directory)
+            for path in directory.glob("metrics-*.json"):
+                if path == own:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue  # removed or replaced while we were reading
+        for snapshot in snapshots:
+            for name, entries in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in entries:
+                    key = tuple(key)
+                    totals[name][key] = metric.merge(totals[name].get(key), value)
+        return totals
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample, labels, value in metric.samples(values):
+                if labels:
+                    text = ",".join(f'{label}="{_escape(v)}"' for label, v in labels)
+                    sample = f"{sample}{{{text}}}"
+                lines.append(f"{sample} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+# ---------------------- METRICS ----------------------
+
+http_requests = registry.counter(
+    "leave_http_requests_total",
+    "HTTP requests handled, by route, method and response status.",
+    ["route", "method", "status"],
+)
+http_request_duration = registry.histogram(
+    "leave_http_request_duration_seconds",
+    "Time to handle an HTTP request, by route and method.",
+    ["route", "method"],
+)
+application_transitions = registry.counter(
+    "leave_application_transitions_total",
+    "Committed leave application status changes (from_status is none for "
+    "new applications).",
+    ["from_status", "to_status"],
+)
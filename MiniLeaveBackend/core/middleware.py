@@ -0,0 +1,176 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+from .instrumentation import (
+    RequestMetrics,
+    current_metrics,
+    endpoint_stats,
+    get_options,
+    install_query_hook,
+)
+from .metrics import http_request_duration, http_requests
+from .routers import apin_to_primary, get_options as replica_options, pin_to_primary
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Count the queries, SQL time, serializer time and response size of each
+    request; report them in a Server-Timing header, flag requests over the
+    query budget and add them to the per-endpoint totals.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = get_options()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.options["ENABLED"]:
+            return self.get_response(request)
+        # Connections opened before the middleware loaded missed the signal
+        install_query_hook(connection)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.options["ENABLED"]:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        match = getattr(request, "resolver_match", None)
+        endpoint = (match.view_name if match else None) or "<unresolved>"
+        response_bytes = 0 if response.streaming else len(response.content)
+
+        budget = self.options["QUERY_BUDGET"]
+        over_budget = budget is not None and metrics.queries > budget
+        if over_budget:
+            response["X-Query-Budget-Exceeded"] = f"{metrics.queries}/{budget}"
+            logger.warning(
+                "%s %s (%s) ran %d queries, over the budget of %d",
+                request.method,
+                request.path,
+                endpoint,
+                metrics.queries,
+                budget,
+            )
+
+        if self.options["SERVER_TIMING"]:
+            response["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={metrics.sql_ms:.2f};desc="{metrics.queries} queries"',
+                    f"serialize;dur={metrics.serializer_ms:.2f}",
+                    f"total;dur={metrics.elapsed_ms:.2f}",
+                ]
+            )
+
+        endpoint_stats.record(endpoint, metrics, response_bytes, over_budget)
+        return response
+
+
+class RouteMetricsMiddleware:
+    """Count requests and observe their latency per route for /api/metrics/."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, seconds):
+        # The route name, not the path, keeps label cardinality bounded.
+        match = getattr(request, "resolver_match", None)
+        route = (match.view_name if match else None) or "<unresolved>"
+        http_requests.inc(
+            route=route, method=request.method, status=response.status_code
+        )
+        http_request_duration.observe(seconds, route=route, method=request.method)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pin the user of each successful write request (POST/PUT/PATCH/DELETE)
+    to the primary database for READ_REPLICAS["STICKY_SECONDS"], so their
+    next reads do not come from a replica that has not caught up yet.
+    """
+
+    sync_capable = True
+    async_capable = True
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = bool(replica_options()["ALIASES"])
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        user = self.writer(request, response)
+        if user is not None:
+            pin_to_primary(user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        user = self.writer(request, response)
+        if user is not None:
+            await apin_to_primary(user)
+        return response
+
+    def writer(self, request, response):
+        if (
+            not self.enabled
+            or request.method in self.SAFE_METHODS
+            or response.status_code >= 400
+        ):
+            return None
+        # Token users are set on the request by DRF (or async_views).
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            return None
+        return user
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="application",
+            index=models.Index(
+                fields=["employee", "status", "start_date", "end_date"],
+                name="app_emp_status_dates_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="application",
+            index=models.Index(
+                fields=["status", "-created_at", "-id"], name="app_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="application",
+            index=models.Index(fields=["-created_at", "-id"], name="app_created_idx"),
+        ),
+    ]
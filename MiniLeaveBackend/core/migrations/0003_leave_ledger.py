@@ -0,0 +1,110 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_ledger(apps, schema_editor):
+    Application = apps.get_model("core", "Application")
+    LeaveLedger = apps.get_model("core", "LeaveLedger")
+    totals = {}
+    rows = Application.objects.filter(status__in=["pending", "approved"]).values_list(
+        "employee_id", "leave_type", "status", "start_date", "end_date"
+    )
+    for employee_id, leave_type, status, start, end in rows.iterator():
+        entry = totals.setdefault(
+            (employee_id, start.year, leave_type), {"pending": 0, "approved": 0}
+        )
+        entry[status] += (end - start).days + 1
+    LeaveLedger.objects.bulk_create(
+        [
+            LeaveLedger(
+                employee_id=employee_id,
+                year=year,
+                leave_type=leave_type,
+                pending_days=entry["pending"],
+                approved_days=entry["approved"],
+            )
+            for (employee_id, year, leave_type), entry in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+    # Approval now deducts leave_balance; until now the balance endpoint
+    # subtracted approved leave when read. Deduct the leave approved so far
+    # once, so it is not given back.
+    EmployeeProfile = apps.get_model("core", "EmployeeProfile")
+    approved = {}
+    for (employee_id, _year, _leave_type), entry in totals.items():
+        approved[employee_id] = approved.get(employee_id, 0) + entry["approved"]
+    for employee_id, days in approved.items():
+        if days:
+            EmployeeProfile.objects.filter(pk=employee_id).update(
+                leave_balance=models.Case(
+                    models.When(
+                        leave_balance__gt=days,
+                        then=models.F("leave_balance") - days,
+                    ),
+                    default=0,
+                )
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_application_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaveLedger",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField()),
+                (
+                    "leave_type",
+                    models.CharField(
+                        choices=[
+                            ("sick", "Sick Leave"),
+                            ("emergency", "Emergency Leave"),
+                            ("annual", "Annual Leave"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("pending_days", models.PositiveIntegerField(default=0)),
+                ("approved_days", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "employee",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ledger_entries",
+                        to="core.employeeprofile",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["year", "employee"], name="ledger_year_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("employee", "year", "leave_type"),
+                        name="ledger_unique_employee_year_type",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
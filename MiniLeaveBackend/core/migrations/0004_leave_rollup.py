@@ -0,0 +1,84 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    Application = apps.get_model("core", "Application")
+    LeaveRollup = apps.get_model("core", "LeaveRollup")
+    totals = {}
+    rows = Application.objects.values_list(
+        "employee__department", "leave_type", "status", "start_date", "end_date"
+    )
+    for department, leave_type, status, start, end in rows.iterator():
+        key = (start.replace(day=1), department, leave_type, status)
+        count, days = totals.get(key, (0, 0))
+        totals[key] = (count + 1, days + (end - start).days + 1)
+    fields = ("month", "department", "leave_type", "status")
+    LeaveRollup.objects.bulk_create(
+        [
+            LeaveRollup(**dict(zip(fields, key)), applications=count, days=days)
+            for key, (count, days) in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_leave_ledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaveRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField()),
+                ("department", models.CharField(max_length=30)),
+                (
+                    "leave_type",
+                    models.CharField(
+                        choices=[
+                            ("sick", "Sick Leave"),
+                            ("emergency", "Emergency Leave"),
+                            ("annual", "Annual Leave"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("approved", "Approved"),
+                            ("rejected", "Rejected"),
+                        ],
+                        max_length=18,
+                    ),
+                ),
+                ("applications", models.IntegerField(default=0)),
+                ("days", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("month", "department", "leave_type", "status"),
+                        name="rollup_unique_bucket",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_leave_rollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="application",
+            index=models.Index(fields=["end_date", "start_date"], name="app_dates_idx"),
+        ),
+    ]
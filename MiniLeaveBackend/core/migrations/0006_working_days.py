@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+# Inclusive number of calendar days between start_date and end_date.
+# PostgreSQL and Oracle return a whole number for date - date.
+CALENDAR_DAYS = {
+    "sqlite": "CAST(julianday(end_date) - julianday(start_date) AS INTEGER) + 1",
+    "mysql": "DATEDIFF(end_date, start_date) + 1",
+}
+DEFAULT_CALENDAR_DAYS = "end_date - start_date + 1"
+
+
+def backfill_days(apps, schema_editor):
+    # Existing applications keep the calendar days they were charged, so
+    # balances, ledger and rollup totals stay consistent with them.
+    Application = apps.get_model("core", "Application")
+    connection = schema_editor.connection
+    days = CALENDAR_DAYS.get(connection.vendor, DEFAULT_CALENDAR_DAYS)
+    table = connection.ops.quote_name(Application._meta.db_table)
+    schema_editor.execute(f"UPDATE {table} SET days = {days}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_application_dates_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Holiday",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("name", models.CharField(max_length=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["date"],
+            },
+        ),
+        migrations.AddField(
+            model_name="application",
+            name="days",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_working_days"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccrualRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("period", models.DateField(unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("running", "Running"), ("completed", "Completed")],
+                        default="running",
+                        max_length=10,
+                    ),
+                ),
+                ("schedule", models.JSONField()),
+                ("last_employee_id", models.BigIntegerField(default=0)),
+                ("employees_credited", models.PositiveIntegerField(default=0)),
+                ("days_credited", models.PositiveIntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="AccrualPolicy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "leave_type",
+                    models.CharField(
+                        choices=[
+                            ("sick", "Sick Leave"),
+                            ("emergency", "Emergency Leave"),
+                            ("annual", "Annual Leave"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("min_tenure_months", models.PositiveSmallIntegerField(default=0)),
+                ("days_per_year", models.PositiveSmallIntegerField()),
+                ("max_balance", models.PositiveIntegerField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("leave_type", "min_tenure_months"),
+                        name="accrual_unique_type_tenure",
+                    )
+                ],
+            },
+        ),
+    ]
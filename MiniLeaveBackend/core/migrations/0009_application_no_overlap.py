@@ -0,0 +1,185 @@
+from itertools import groupby
+
+from django.db import migrations
+from django.db.models import F
+
+# Active (pending / approved) applications of one employee must not
+# overlap. PostgreSQL enforces it with an exclusion constraint over the
+# date range; SQLite with triggers that abort with the constraint name.
+# Both surface as IntegrityError mentioning "app_no_active_overlap".
+#
+# SQLite drops triggers when it rebuilds a table, so migrations that alter
+# core_application on SQLite must run CREATE_SQLITE_TRIGGERS again.
+#
+# Overlaps already in the table (check-then-insert races of earlier
+# versions) are resolved first, or the constraint could not be added:
+# a pending application overlapping an approved or an earlier pending one
+# is rejected. Overlapping approved applications are left to HR; the
+# migration stops with a list of them.
+
+ACTIVE = "('pending', 'approved')"
+
+CREATE_POSTGRES_CONSTRAINT = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist;",
+    f"""
+    ALTER TABLE core_application ADD CONSTRAINT app_no_active_overlap
+        EXCLUDE USING gist (
+            employee_id WITH =,
+            daterange(start_date, end_date, '[]') WITH &&
+        )
+        WHERE (status IN {ACTIVE});
+    """,
+]
+
+DROP_POSTGRES_CONSTRAINT = [
+    "ALTER TABLE core_application DROP CONSTRAINT IF EXISTS app_no_active_overlap;",
+]
+
+_SQLITE_CHECK = f"""
+    SELECT RAISE(ABORT, 'app_no_active_overlap')
+    WHERE EXISTS (
+        SELECT 1 FROM core_application
+        WHERE employee_id = NEW.employee_id
+          AND status IN {ACTIVE}
+          AND start_date <= NEW.end_date
+          AND end_date >= NEW.start_date
+          AND id IS NOT NEW.id
+    );
+"""
+
+CREATE_SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_no_active_overlap_insert
+    BEFORE INSERT ON core_application
+    WHEN NEW.status IN {ACTIVE}
+    BEGIN {_SQLITE_CHECK} END;
+    """,
+    # Only changes that can create an overlap are checked, so approvals
+    # (pending -> approved) do not pay for the lookup.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS app_no_active_overlap_update
+    BEFORE UPDATE OF employee_id, status, start_date, end_date ON core_application
+    WHEN NEW.status IN {ACTIVE} AND (
+        OLD.status NOT IN {ACTIVE}
+        OR NEW.employee_id != OLD.employee_id
+        OR NEW.start_date != OLD.start_date
+        OR NEW.end_date != OLD.end_date
+    )
+    BEGIN {_SQLITE_CHECK} END;
+    """,
+]
+
+DROP_SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS app_no_active_overlap_insert;",
+    "DROP TRIGGER IF EXISTS app_no_active_overlap_update;",
+]
+
+
+OVERLAP_REASON = "Overlapped application #{} (resolved by migration 0009)."
+
+
+def _overlapping(application, kept):
+    for other in kept:
+        if (
+            application.start_date <= other.end_date
+            and application.end_date >= other.start_date
+        ):
+            return other
+    return None
+
+
+def _reject(apps, application, kept_id):
+    Application = apps.get_model("core", "Application")
+    LeaveLedger = apps.get_model("core", "LeaveLedger")
+    LeaveRollup = apps.get_model("core", "LeaveRollup")
+    Application.objects.filter(pk=application.pk).update(
+        status="rejected", rejection_reason=OVERLAP_REASON.format(kept_id)
+    )
+    LeaveLedger.objects.filter(
+        employee_id=application.employee_id,
+        year=application.start_date.year,
+        leave_type=application.leave_type,
+        pending_days__gte=application.days,
+    ).update(pending_days=F("pending_days") - application.days)
+    bucket = {
+        "month": application.start_date.replace(day=1),
+        "department": application.employee.department,
+        "leave_type": application.leave_type,
+    }
+    LeaveRollup.objects.filter(**bucket, status="pending").update(
+        applications=F("applications") - 1, days=F("days") - application.days
+    )
+    rejected, _ = LeaveRollup.objects.get_or_create(**bucket, status="rejected")
+    LeaveRollup.objects.filter(pk=rejected.pk).update(
+        applications=F("applications") + 1, days=F("days") + application.days
+    )
+
+
+def resolve_overlaps(apps, schema_editor):
+    Application = apps.get_model("core", "Application")
+    active = (
+        Application.objects.filter(status__in=["pending", "approved"])
+        .select_related("employee")
+        .order_by("employee_id", "created_at", "id")
+    )
+    conflicts = []
+    for _, applications in groupby(active.iterator(), lambda app: app.employee_id):
+        applications = list(applications)
+        kept = []
+        # Approved leave is kept; pending requests yield to it, then to
+        # earlier pending ones.
+        for application in applications:
+            if application.status == "approved":
+                other = _overlapping(application, kept)
+                if other is not None:
+                    conflicts.append((other, application))
+                kept.append(application)
+        for application in applications:
+            if application.status == "pending":
+                other = _overlapping(application, kept)
+                if other is None:
+                    kept.append(application)
+                else:
+                    _reject(apps, application, other.pk)
+    if conflicts:
+        report = "\n".join(
+            f"  employee {first.employee_id}: #{first.pk} "
+            f"({first.start_date} - {first.end_date}) and #{second.pk} "
+            f"({second.start_date} - {second.end_date})"
+            for first, second in conflicts
+        )
+        raise RuntimeError(
+            "Approved leave applications overlap; reject or shorten one of "
+            f"each pair, then migrate again:\n{report}"
+        )
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def add_constraint(apps, schema_editor):
+    _run(
+        schema_editor,
+        {"postgresql": CREATE_POSTGRES_CONSTRAINT, "sqlite": CREATE_SQLITE_TRIGGERS},
+    )
+
+
+def remove_constraint(apps, schema_editor):
+    _run(
+        schema_editor,
+        {"postgresql": DROP_POSTGRES_CONSTRAINT, "sqlite": DROP_SQLITE_TRIGGERS},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_background_jobs"),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_overlaps, migrations.RunPython.noop),
+        migrations.RunPython(add_constraint, remove_constraint),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 # -----------------------
@@ -62,6 +65,24 @@ class HrProfile(models.Model):
 # -----------------------
 # Leave Application
 # -----------------------
+class ApplicationQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(status=Application.StatusChoices.PENDING)
+
+    def active(self):
+        # Applications that hold days: waiting for a decision or approved.
+        return self.filter(
+            status__in=[
+                Application.StatusChoices.PENDING,
+                Application.StatusChoices.APPROVED,
+            ]
+        )
+
+    def total_days(self):
+        """Sum of charged leave days over the queryset, in one query."""
+        return self.aggregate(total=Coalesce(models.Sum("days"), 0))["total"]
+
+
 class Application(models.Model):
     class StatusChoices(models.TextChoices):
         PENDING = "pending", "Pending"
@@ -84,11 +105,250 @@ class Application(models.Model):
     )
     start_date = models.DateField()
     end_date = models.DateField()
+    # Working days charged (see core.workdays), set on every save.
+    days = models.PositiveIntegerField(default=0, editable=False)
     reason_description = models.TextField(blank=True, null=True)
     rejection_reason = models.TextField(blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ApplicationQuerySet.as_manager()
+
+    class Meta:
+        # Active applications of one employee never overlap: enforced in the
+        # database by migration 0009 (see core.services.OVERLAP_CONSTRAINT).
+        indexes = [
+            # Overlap check (employee =, status IN, start_date <=) and
+            # pending-days lookups (employee =, status =) share this prefix.
+            models.Index(
+                fields=["employee", "status", "start_date", "end_date"],
+                name="app_emp_status_dates_idx",
+            ),
+            # HR listing: filter by status, newest first.
+            models.Index(
+                fields=["status", "-created_at", "-id"], name="app_status_created_idx"
+            ),
+            models.Index(fields=["-created_at", "-id"], name="app_created_idx"),
+            # Team calendar: applications overlapping a date range
+            # (end_date >= from AND start_date <= to). Leading with end_date
+            # keeps scans for current and upcoming ranges clear of history.
+            models.Index(fields=["end_date", "start_date"], name="app_dates_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Imported here: core.workdays reads the Holiday model.
+        from .workdays import count_workdays
+
+        self.days = count_workdays(self.start_date, self.end_date)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "days"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.employee.user.username} - {self.leave_type} ({self.status})"
+
+
+# -----------------------
+# Holidays
+# -----------------------
+class Holiday(models.Model):
+    """A public holiday: no leave is charged for it (see core.workdays)."""
+
+    date = models.DateField(unique=True)
+    name = models.CharField(max_length=100)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["date"]
+
+    def __str__(self):
+        return f"{self.date} {self.name}"
+
+
+# -----------------------
+# Leave Ledger
+# -----------------------
+class LeaveLedger(models.Model):
+    """
+    Running totals of pending and approved leave days per employee, leave
+    type and year (by start date). Kept in step with Application changes
+    by core.services so balance reads never scan application history.
+    """
+
+    employee = models.ForeignKey(
+        EmployeeProfile, on_delete=models.CASCADE, related_name="ledger_entries"
+    )
+    year = models.PositiveSmallIntegerField()
+    leave_type = models.CharField(max_length=20, choices=Application.LeaveType.choices)
+    pending_days = models.PositiveIntegerField(default=0)
+    approved_days = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["employee", "year", "leave_type"],
+                name="ledger_unique_employee_year_type",
+            )
+        ]
+        indexes = [models.Index(fields=["year", "employee"], name="ledger_year_idx")]
+
+    def __str__(self):
+        return f"{self.employee_id} {self.year} {self.leave_type}"
+
+
+# -----------------------
+# Leave Rollup
+# -----------------------
+class LeaveRollup(models.Model):
+    """
+    Number of applications and leave days per department, leave type,
+    month (of the start date) and status. Adjusted by core.analytics on
+    every status change so analytics reads never scan application history;
+    `manage.py rebuild_leave_rollups` recomputes it from scratch.
+    """
+
+    month = models.DateField()  # first day of the month
+    department = models.CharField(max_length=30)
+    leave_type = models.CharField(max_length=20, choices=Application.LeaveType.choices)
+    status = models.CharField(max_length=18, choices=Application.StatusChoices.choices)
+    # Signed: a delta is never rejected, drift is repaired by a rebuild.
+    applications = models.IntegerField(default=0)
+    days = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Month first: the index also serves month-range filters.
+            models.UniqueConstraint(
+                fields=["month", "department", "leave_type", "status"],
+                name="rollup_unique_bucket",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.department} {self.leave_type} {self.status}"
+
+
+# -----------------------
+# Leave Accrual
+# -----------------------
+class AccrualPolicy(models.Model):
+    """
+    Days earned per year by employees with at least `min_tenure_months` of
+    service; the policy with the highest threshold an employee reaches
+    applies. Credited monthly by core.accrual to the single leave_balance,
+    so all policies must share one leave type.
+    """
+
+    leave_type = models.CharField(max_length=20, choices=Application.LeaveType.choices)
+    min_tenure_months = models.PositiveSmallIntegerField(default=0)
+    days_per_year = models.PositiveSmallIntegerField()
+    # Accrual stops once the balance reaches this many days.
+    max_balance = models.PositiveIntegerField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["leave_type", "min_tenure_months"],
+                name="accrual_unique_type_tenure",
+            )
+        ]
+
+    def clean(self):
+        other = AccrualPolicy.objects.exclude(leave_type=self.leave_type).first()
+        if other is not None:
+            raise ValidationError(
+                {
+                    "leave_type": (
+                        f"Accrual policies are of type {other.leave_type}; "
+                        "all policies must share one leave type."
+                    )
+                }
+            )
+
+    def __str__(self):
+        return (
+            f"{self.leave_type}: {self.days_per_year}/year "
+            f"after {self.min_tenure_months} months"
+        )
+
+
+class AccrualRun(models.Model):
+    """
+    Progress of crediting one month's accrual. Employees are processed in
+    id order, and `last_employee_id` is committed with each chunk, so an
+    interrupted run resumes where it stopped and a finished one is never
+    applied twice.
+    """
+
+    class StatusChoices(models.TextChoices):
+        RUNNING = "running", "Running"
+        COMPLETED = "completed", "Completed"
+
+    period = models.DateField(unique=True)  # first day of the month
+    status = models.CharField(
+        max_length=10, choices=StatusChoices.choices, default=StatusChoices.RUNNING
+    )
+    # Credit per tenure band, fixed when the run starts (see core.accrual).
+    schedule = models.JSONField()
+    last_employee_id = models.BigIntegerField(default=0)
+    employees_credited = models.PositiveIntegerField(default=0)
+    days_credited = models.PositiveIntegerField(default=0)
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Accrual {self.period:%Y-%m} ({self.status})"
+
+
+# -----------------------
+# Background Jobs
+# -----------------------
+class BackgroundJob(models.Model):
+    """
+    A queued call of a task registered in core.tasks, run by
+    `manage.py run_worker` after the transaction that queued it commits.
+    """
+
+    class StatusChoices(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10, choices=StatusChoices.choices, default=StatusChoices.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for due jobs: status = queued AND run_after <= now.
+            models.Index(fields=["status", "run_after"], name="job_status_due_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
@@ -0,0 +1,63 @@
+"""
+Read paths of the application list and the leave balance, shared by the
+DRF views (core.views) and their async versions (core.async_views), so
+both return the same rows, validators and bodies.
+
+Each view evaluates the querysets itself, with the sync or the async ORM.
+"""
+
+from . import conditional
+from .fast_serializers import APPLICATION_ROW
+from .models import Application, EmployeeProfile, LeaveLedger
+from .serializers import LeaveLedgerSerializer
+
+# ---------------------- APPLICATION LIST ----------------------
+
+
+def application_page_columns(filters):
+    """
+    The filtered applications, as the validator columns the paginator
+    pages through first: a poll of an unchanged page is answered with a
+    304 from these, without loading or serializing the rows.
+    """
+    applications = filters.filter_queryset(Application.objects.all())
+    return applications.values(*conditional.APPLICATION_PAGE_FIELDS)
+
+
+def application_page_ids(rows):
+    return [row["id"] for row in rows]
+
+
+def application_page_body(paginator, page):
+    """The response body for `page`, rows of fast_serializers.application_rows()."""
+    return {
+        "status": "success",
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+        "data": APPLICATION_ROW.many(page),
+    }
+
+
+# ---------------------- BALANCE ----------------------
+
+
+def balance_employees():
+    # leave_balance is the remaining balance (deducted on approval); the
+    # ledger holds the year's pending/approved totals per leave type.
+    return EmployeeProfile.objects.only("id", "leave_balance", "updated_at")
+
+
+def balance_entries(employee, year):
+    return LeaveLedger.objects.filter(employee_id=employee.id, year=year)
+
+
+def balance_body(employee, year, entries):
+    ledger = LeaveLedgerSerializer(entries, many=True).data
+    return {
+        "status": "success",
+        "leave_balance": employee.leave_balance,
+        "year": year,
+        "pending_days": sum(entry["pending_days"] for entry in ledger),
+        "approved_days": sum(entry["approved_days"] for entry in ledger),
+        "by_leave_type": ledger,
+    }
@@ -0,0 +1,56 @@
+"""
+JSON rendering through orjson, when it is installed.
+
+orjson encodes the plain dicts, lists, strings and numbers of a list
+response several times faster than json.dumps with DRF's encoder. Types
+it does not encode the same way (dates and datetimes, Decimal, lazy
+strings, ...) are handed to DRF's JSONEncoder, so the bytes are the same
+as JSONRenderer's. Without orjson, or when indented output is requested,
+the stock JSONRenderer is used.
+"""
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+
+def _options():
+    return (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_NON_STR_KEYS
+    )
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes of `data`, as JSONRenderer renders it."""
+    if orjson is None:
+        return JSONRenderer().render(data)
+    content = orjson.dumps(data, default=_encoder.default, option=_options())
+    # JSONRenderer escapes these so the output is also valid JavaScript.
+    if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+        content = content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (
+            orjson is None
+            or indent is not None
+            or self.ensure_ascii
+            or not self.compact
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -0,0 +1,141 @@
+"""
+Read-replica routing.
+
+Every query goes to the primary ("default") except the reads of views
+decorated with @use_replica (or run in a read_from_replica() block), which
+go to one of READ_REPLICAS["ALIASES"]. Writes always go to the primary.
+
+Replicas lag behind the primary, so a user would not see their own write
+on one straight away. core.middleware.ReplicaStickinessMiddleware pins a
+user to the primary for STICKY_SECONDS after each successful write request;
+keep it above the replication lag. Pins are kept in CACHE_ALIAS, which must
+be shared by all workers (not locmem) when there are several.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULTS = {
+    "ALIASES": [],
+    "STICKY_SECONDS": 5,
+    "CACHE_ALIAS": "default",
+    # Read from the primary even on replica endpoints: these rows are
+    # cached per process (working-day calendar, auth tokens), and a stale
+    # copy from a lagging replica would outlive the lag.
+    "PRIMARY_MODELS": ["core.holiday", "authtoken.token"],
+}
+
+_reading_from_replica = ContextVar("reading_from_replica", default=False)
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "READ_REPLICAS", {})}
+
+
+# ---------------------- STICKINESS ----------------------
+
+
+def _pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def _pins(options):
+    return caches[options["CACHE_ALIAS"]]
+
+
+def _sticky(options):
+    return bool(options["ALIASES"]) and options["STICKY_SECONDS"] > 0
+
+
+def pin_to_primary(user):
+    """Serve `user`'s reads from the primary for the next STICKY_SECONDS."""
+    options = get_options()
+    if _sticky(options):
+        _pins(options).set(_pin_key(user.pk), True, options["STICKY_SECONDS"])
+
+
+async def apin_to_primary(user):
+    options = get_options()
+    if _sticky(options):
+        await _pins(options).aset(_pin_key(user.pk), True, options["STICKY_SECONDS"])
+
+
+def replica_allowed(user):
+    """Whether `user`'s reads may go to a replica (one is set up, no pin)."""
+    options = get_options()
+    if not options["ALIASES"]:
+        return False
+    return not (_sticky(options) and _pins(options).get(_pin_key(user.pk)))
+
+
+async def areplica_allowed(user):
+    options = get_options()
+    if not options["ALIASES"]:
+        return False
+    return not (_sticky(options) and await _pins(options).aget(_pin_key(user.pk)))
+
+
+# ---------------------- READS ----------------------
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    token = _reading_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _reading_from_replica.reset(token)
+
+
+def use_replica(view):
+    """
+    Send the reads of a read-only view to a replica unless its user is
+    pinned to the primary. Put it below @api_view, so that request.user is
+    the authenticated user.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with read_from_replica(replica_allowed(request.user)):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def bind(queryset):
+    """
+    Fix the database of a queryset evaluated after the view returns (a
+    streamed response) to the one chosen now.
+    """
+    return queryset.using(queryset.db)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _reading_from_replica.get():
+            return None
+        options = get_options()
+        if (
+            not options["ALIASES"]
+            or model._meta.label_lower in options["PRIMARY_MODELS"]
+        ):
+            return None
+        return random.choice(options["ALIASES"])
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary through replication.
+        if db in get_options()["ALIASES"]:
+            return False
+        return None
@@ -1,15 +1,36 @@
-from datetime import date
+from contextlib import contextmanager
+from datetime import date, timedelta
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Application, EmployeeProfile, HrProfile, User
+from .analytics import GROUPS, record_edit, rollup_entry
+from .availability import MAX_DAYS as MAX_CALENDAR_DAYS
+from .instrumentation import TimedSerializerMixin
+from .models import (
+    Application,
+    EmployeeProfile,
+    Holiday,
+    HrProfile,
+    LeaveLedger,
+    User,
+)
+from .services import (
+    OVERLAP_MESSAGE,
+    is_overlap_violation,
+    ledger_state,
+    status_changed,
+    sync_ledger,
+)
+from .workdays import MAX_LEAVE_DAYS, count_workdays
 
 
 # -----------------------
 # User
 # -----------------------
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6)
 
     class Meta:
@@ -46,13 +67,13 @@ class UserSerializer(serializers.ModelSerializer):
 # -----------------------
 # Employee
 # -----------------------
-class EmployeeLiteSerializer(serializers.ModelSerializer):
+class EmployeeLiteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = EmployeeProfile
         fields = ["id", "department", "joining_date", "leave_balance"]
 
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # Only allow users with role="employee"
     user = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.filter(role="employee")
@@ -103,10 +124,43 @@ class EmployeeSerializer(serializers.ModelSerializer):
         return data
 
 
+class EmployeeImportSerializer(serializers.Serializer):
+    """One row of a bulk employee import (user and profile fields)."""
+
+    email = serializers.EmailField()
+    username = serializers.CharField(max_length=150, required=False)
+    # Rows without a password get an unusable one (set later via reset)
+    password = serializers.CharField(min_length=6, required=False)
+    phone_number = serializers.CharField(max_length=12)
+    department = serializers.CharField(max_length=30)
+    joining_date = serializers.DateField()
+    leave_balance = serializers.IntegerField(min_value=0, required=False)
+
+    def validate_phone_number(self, value):
+        if not value.isdigit():
+            raise serializers.ValidationError("Phone number must contain only digits.")
+        return value
+
+    def validate(self, data):
+        # The email doubles as the username unless one is given
+        username = data.setdefault("username", data["email"])
+        max_length = User._meta.get_field("username").max_length
+        if len(username) > max_length:
+            raise serializers.ValidationError(
+                {
+                    "email": [
+                        f"Emails longer than {max_length} characters need a "
+                        "separate username."
+                    ]
+                }
+            )
+        return data
+
+
 # -----------------------
 # HR
 # -----------------------
-class HrSerializer(serializers.ModelSerializer):
+class HrSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role="hr"))
 
     class Meta:
@@ -132,13 +186,32 @@ class HrSerializer(serializers.ModelSerializer):
 # -----------------------
 # Application (Leave)
 # -----------------------
-class ApplicationSerializer(serializers.ModelSerializer):
+def validate_leave_span(start, end):
+    # Before any count_workdays() call, which loads every year spanned.
+    if (end - start).days + 1 > MAX_LEAVE_DAYS:
+        raise serializers.ValidationError(
+            f"Leave cannot span more than {MAX_LEAVE_DAYS} days."
+        )
+
+
+@contextmanager
+def overlap_as_validation_error():
+    # The database rejects overlaps that slip past validate() (a concurrent
+    # request saved one in between).
+    try:
+        yield
+    except IntegrityError as exc:
+        if is_overlap_violation(exc):
+            raise serializers.ValidationError(OVERLAP_MESSAGE) from exc
+        raise
+
+
+class ApplicationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # Write: supply employee id. Read: also get compact nested info.
     employee = serializers.PrimaryKeyRelatedField(
         queryset=EmployeeProfile.objects.all(), write_only=True
     )
     employee_detail = EmployeeLiteSerializer(source="employee", read_only=True)
-    days = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Application
@@ -156,10 +229,7 @@ class ApplicationSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["id", "created_at", "updated_at"]
-
-    def get_days(self, obj):
-        return (obj.end_date - obj.start_date).days + 1
+        read_only_fields = ["id", "days", "created_at", "updated_at"]
 
     # ---- Core validations (apply & edit) ----
     def _validate_dates(self, employee, start, end):
@@ -169,35 +239,32 @@ class ApplicationSerializer(serializers.ModelSerializer):
             )
         if start > end:
             raise serializers.ValidationError("Start date cannot be after end date.")
+        validate_leave_span(start, end)
         if start < employee.joining_date:
             raise serializers.ValidationError(
                 "Cannot apply for leave before the joining date."
             )
 
     def _overlap_exists(self, employee, start, end, exclude_pk=None):
-        qs = Application.objects.filter(
-            employee=employee,
-            status__in=[
-                Application.StatusChoices.PENDING,
-                Application.StatusChoices.APPROVED,
-            ],
-            start_date__lte=end,
-            end_date__gte=start,
+        qs = Application.objects.active().filter(
+            employee=employee, start_date__lte=end, end_date__gte=start
         )
         if exclude_pk:
             qs = qs.exclude(pk=exclude_pk)
         return qs.exists()
 
     def _pending_days_other_than(self, employee, exclude_pk=None):
-        qs = Application.objects.filter(
-            employee=employee, status=Application.StatusChoices.PENDING
-        )
-        if exclude_pk:
-            qs = qs.exclude(pk=exclude_pk)
-        total = 0
-        for app in qs:
-            total += (app.end_date - app.start_date).days + 1
-        return total
+        # Cached so validate() and update() share one aggregate query.
+        if not hasattr(self, "_pending_days_cache"):
+            self._pending_days_cache = {}
+        cache = self._pending_days_cache
+        key = (employee.pk, exclude_pk)
+        if key not in cache:
+            qs = Application.objects.filter(employee=employee).pending()
+            if exclude_pk:
+                qs = qs.exclude(pk=exclude_pk)
+            cache[key] = qs.total_days()
+        return cache[key]
 
     def validate(self, data):
         # Resolve fields whether creating or updating
@@ -219,12 +286,14 @@ class ApplicationSerializer(serializers.ModelSerializer):
         if self._overlap_exists(
             employee, start, end, exclude_pk=getattr(instance, "pk", None)
         ):
-            raise serializers.ValidationError(
-                "Overlapping leave request exists for this employee."
-            )
+            raise serializers.ValidationError(OVERLAP_MESSAGE)
 
         # Balance check (requested + other pending must not exceed available)
-        requested_days = (end - start).days + 1
+        requested_days = count_workdays(start, end)
+        if not requested_days:
+            raise serializers.ValidationError(
+                "The selected dates contain no working days."
+            )
         pending_others = self._pending_days_other_than(
             employee, exclude_pk=getattr(instance, "pk", None)
         )
@@ -271,19 +340,47 @@ class ApplicationSerializer(serializers.ModelSerializer):
         return data
 
     # ---- Create & Update hooks ----
+    @transaction.atomic
     def create(self, validated_data):
         # always create as PENDING
         validated_data["status"] = Application.StatusChoices.PENDING
-        return super().create(validated_data)
+        with overlap_as_validation_error():
+            application = super().create(validated_data)
+        sync_ledger(None, ledger_state(application))
+        status_changed([(application, None, application.status)])
+        return application
 
     @transaction.atomic
     def update(self, instance, validated_data):
         # Never allow changing the owner
         validated_data.pop("employee", None)
+        before = ledger_state(instance)
+        rollup_before = rollup_entry(instance, None)
 
         old_status = instance.status
         new_status = validated_data.get("status", old_status)
 
+        # Prevent changing away from APPROVED/REJECTED once processed
+        if (
+            old_status
+            in [Application.StatusChoices.APPROVED, Application.StatusChoices.REJECTED]
+            and new_status != old_status
+        ):
+            raise serializers.ValidationError(
+                "Status of a processed application cannot be changed."
+            )
+
+        # Claim the status change conditionally: if another request decided
+        # this application since it was loaded, nothing matches.
+        if new_status != old_status:
+            claimed = Application.objects.filter(
+                pk=instance.pk, status=old_status
+            ).update(status=new_status)
+            if not claimed:
+                raise serializers.ValidationError(
+                    "Application was processed by another request."
+                )
+
         # If moving PENDING -> APPROVED, deduct balance atomically
         if (
             old_status == Application.StatusChoices.PENDING
@@ -291,7 +388,7 @@ class ApplicationSerializer(serializers.ModelSerializer):
         ):
             start = validated_data.get("start_date", instance.start_date)
             end = validated_data.get("end_date", instance.end_date)
-            days = (end - start).days + 1
+            days = count_workdays(start, end)
 
             # Consider other pending apps, excluding this one
             pending_others = self._pending_days_other_than(
@@ -303,22 +400,206 @@ class ApplicationSerializer(serializers.ModelSerializer):
                     "Insufficient leave balance to approve this application."
                 )
 
-            # Deduct and save
-            instance.employee.leave_balance -= days
-            if instance.employee.leave_balance < 0:
+            # Deduct with a conditional UPDATE so concurrent approvals for the
+            # same employee cannot both read the old balance.
+            deducted = EmployeeProfile.objects.filter(
+                pk=instance.employee_id, leave_balance__gte=days
+            ).update(leave_balance=F("leave_balance") - days, updated_at=timezone.now())
+            if not deducted:
                 raise serializers.ValidationError("Leave balance would go negative.")
-            instance.employee.save()
+            instance.employee.refresh_from_db(fields=["leave_balance", "updated_at"])
             # clear any old rejection reason
             validated_data.setdefault("rejection_reason", None)
 
-        # Prevent changing away from APPROVED/REJECTED once processed
-        if (
-            old_status
-            in [Application.StatusChoices.APPROVED, Application.StatusChoices.REJECTED]
-            and new_status != old_status
-        ):
+        with overlap_as_validation_error():
+            application = super().update(instance, validated_data)
+        sync_ledger(before, ledger_state(application))
+        # Dates or type edits move the rollup within the old status first;
+        # the status change below then moves it to the new one.
+        record_edit(application, rollup_before, old_status)
+        if new_status != old_status:
+            status_changed([(application, old_status, new_status)])
+        return application
+
+
+class ApplyLeaveSerializer(serializers.ModelSerializer):
+    """
+    Input of a new application. Only the checks that need no query run
+    here; the employee-dependent ones run in services.submit_application.
+    """
+
+    class Meta:
+        model = Application
+        fields = ["leave_type", "start_date", "end_date", "reason_description"]
+        extra_kwargs = {"leave_type": {"required": True, "allow_null": False}}
+
+    def validate(self, data):
+        if data["start_date"] > data["end_date"]:
+            raise serializers.ValidationError("Start date cannot be after end date.")
+        validate_leave_span(data["start_date"], data["end_date"])
+        return data
+
+
+# -----------------------
+# Holidays
+# -----------------------
+class HolidaySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Holiday
+        fields = ["id", "date", "name"]
+
+
+# -----------------------
+# Leave balances
+# -----------------------
+class LeaveLedgerSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = LeaveLedger
+        fields = ["leave_type", "year", "pending_days", "approved_days"]
+
+
+# -----------------------
+# Application listing filters
+# -----------------------
+class ApplicationFilterSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(
+        choices=Application.StatusChoices.choices, required=False
+    )
+    leave_type = serializers.ChoiceField(
+        choices=Application.LeaveType.choices, required=False
+    )
+    department = serializers.CharField(max_length=30, required=False)
+    # Date range: applications overlapping [date_from, date_to]
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        date_from = data.get("date_from")
+        date_to = data.get("date_to")
+        if date_from and date_to and date_from > date_to:
             raise serializers.ValidationError(
-                "Status of a processed application cannot be changed."
+                {"date_from": "date_from cannot be after date_to."}
             )
+        return data
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        if "status" in data:
+            queryset = queryset.filter(status=data["status"])
+        if "leave_type" in data:
+            queryset = queryset.filter(leave_type=data["leave_type"])
+        if "department" in data:
+            queryset = queryset.filter(employee__department=data["department"])
+        if "date_from" in data:
+            queryset = queryset.filter(end_date__gte=data["date_from"])
+        if "date_to" in data:
+            queryset = queryset.filter(start_date__lte=data["date_to"])
+        return queryset
+
+
+class ExportFilterSerializer(ApplicationFilterSerializer):
+    # "format" is taken by DRF's format suffix override
+    output = serializers.ChoiceField(choices=["csv", "ndjson"], default="csv")
+    # Shorthand for date_from/date_to covering one calendar year
+    year = serializers.IntegerField(min_value=1900, max_value=9999, required=False)
+
+    def validate(self, data):
+        year = data.pop("year", None)
+        if year is not None:
+            data.setdefault("date_from", date(year, 1, 1))
+            data.setdefault("date_to", date(year, 12, 31))
+        return super().validate(data)
+
+
+class BalanceFilterSerializer(serializers.Serializer):
+    year = serializers.IntegerField(min_value=1900, max_value=9999, required=False)
+    department = serializers.CharField(max_length=30, required=False)
+
+    def validate(self, data):
+        data.setdefault("year", date.today().year)
+        return data
+
+
+class CalendarFilterSerializer(serializers.Serializer):
+    # Defaults to the week starting today
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    department = serializers.CharField(max_length=30, required=False)
+    # Only one of the statuses that hold days; both by default
+    status = serializers.ChoiceField(
+        choices=[
+            Application.StatusChoices.PENDING,
+            Application.StatusChoices.APPROVED,
+        ],
+        required=False,
+    )
+
+    def validate(self, data):
+        date_from = data.setdefault("date_from", date.today())
+        date_to = data.setdefault("date_to", date_from + timedelta(days=6))
+        if date_from > date_to:
+            raise serializers.ValidationError(
+                {"date_from": "date_from cannot be after date_to."}
+            )
+        if (date_to - date_from).days + 1 > MAX_CALENDAR_DAYS:
+            raise serializers.ValidationError(
+                {"date_to": f"The range cannot exceed {MAX_CALENDAR_DAYS} days."}
+            )
+        return data
+
+
+class HolidayFilterSerializer(serializers.Serializer):
+    year = serializers.IntegerField(min_value=1900, max_value=9999, required=False)
+
+    def validate(self, data):
+        data.setdefault("year", date.today().year)
+        return data
+
+
+class AnalyticsFilterSerializer(serializers.Serializer):
+    # Months (of the start date) from date_from's through date_to's
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    department = serializers.CharField(max_length=30, required=False)
+    leave_type = serializers.ChoiceField(
+        choices=Application.LeaveType.choices, required=False
+    )
+    # Comma separated subset of department,leave_type,month; empty for totals
+    group_by = serializers.CharField(
+        required=False, allow_blank=True, default=",".join(GROUPS)
+    )
+    # "live" aggregates the applications instead of the rollup table
+    source = serializers.ChoiceField(choices=["rollup", "live"], default="rollup")
+
+    def validate_group_by(self, value):
+        groups = [group.strip() for group in value.split(",") if group.strip()]
+        unknown = sorted(set(groups) - set(GROUPS))
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown grouping: {', '.join(unknown)}. "
+                f"Choose from {', '.join(GROUPS)}."
+            )
+        # Keep the canonical order and drop duplicates
+        return [group for group in GROUPS if group in groups]
+
+    def validate(self, data):
+        date_from = data.get("date_from")
+        date_to = data.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise serializers.ValidationError(
+                {"date_from": "date_from cannot be after date_to."}
+            )
+        return data
+
+
+# -----------------------
+# Bulk decisions
+# -----------------------
+class LeaveDecisionSerializer(serializers.Serializer):
+    application_id = serializers.IntegerField(min_value=1)
+    decision = serializers.ChoiceField(choices=["approve", "reject"])
+    rejection_reason = serializers.CharField(required=False, allow_blank=True)
+
 
-        return super().update(instance, validated_data)
+class BulkDecisionSerializer(serializers.Serializer):
+    decisions = LeaveDecisionSerializer(many=True, allow_empty=False, max_length=5000)
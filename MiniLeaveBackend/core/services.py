@@ -0,0 +1,423 @@
+"""
+Leave workflow operations that touch more than one row.
+
+Views and serializers call these instead of saving Application rows
+directly so that employee balances and the LeaveLedger stay consistent.
+"""
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Application, EmployeeProfile, LeaveLedger
+from .signals import application_status_changed
+from .workdays import count_workdays
+
+# Databases with INSERT ... ON CONFLICT (column list) DO UPDATE.
+UPSERT_VENDORS = ("postgresql", "sqlite")
+
+# Active applications of one employee never overlap. On these databases
+# the rule is enforced by the database itself (migration 0009), and a
+# violating write raises IntegrityError naming OVERLAP_CONSTRAINT; on
+# others it is only checked with a query before the write.
+OVERLAP_CONSTRAINT = "app_no_active_overlap"
+OVERLAP_VENDORS = ("postgresql", "sqlite")
+OVERLAP_MESSAGE = "Overlapping leave request exists for this employee."
+
+
+def is_overlap_violation(exc):
+    return OVERLAP_CONSTRAINT in str(exc)
+
+
+class LeaveDecisionError(Exception):
+    """Raised when an approval or rejection cannot be applied."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class LeaveApplicationError(Exception):
+    """Raised when a leave application is not accepted."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+# ---------------------- LEDGER ----------------------
+
+
+def ledger_state(application, status=None):
+    """
+    Snapshot of what an application contributes to the ledger, either in
+    its current status or as if it were in `status`.
+    """
+    return (
+        application.employee_id,
+        application.start_date.year,
+        application.leave_type,
+        status or application.status,
+        application.days,
+    )
+
+
+def _contributions(state):
+    employee_id, year, leave_type, app_status, days = state
+    key = (employee_id, year, leave_type)
+    if app_status == Application.StatusChoices.PENDING:
+        return {key: (days, 0)}
+    if app_status == Application.StatusChoices.APPROVED:
+        return {key: (0, days)}
+    return {}
+
+
+def _upsert_ledger(employee_id, year, leave_type, pending, approved, now):
+    """adjust_ledger() as one INSERT ... ON CONFLICT DO UPDATE statement."""
+    table = connection.ops.quote_name(LeaveLedger._meta.db_table)
+    stamp = connection.ops.adapt_datetimefield_value(now)
+    # The inserted row is clamped at zero: the CHECK constraints of the
+    # positive columns apply to it even when the UPDATE branch is taken.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table}
+                (employee_id, year, leave_type, pending_days, approved_days,
+                 created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (employee_id, year, leave_type) DO UPDATE SET
+                pending_days = {table}.pending_days + %s,
+                approved_days = {table}.approved_days + %s,
+                updated_at = excluded.updated_at
+            """,
+            [
+                employee_id,
+                year,
+                leave_type,
+                max(pending, 0),
+                max(approved, 0),
+                stamp,
+                stamp,
+                pending,
+                approved,
+            ],
+        )
+
+
+def adjust_ledger(employee_id, year, leave_type, pending=0, approved=0):
+    """Add (possibly negative) day deltas to one ledger row, creating it."""
+    if connection.vendor in UPSERT_VENDORS:
+        _upsert_ledger(employee_id, year, leave_type, pending, approved, timezone.now())
+        return
+    lookup = {"employee_id": employee_id, "year": year, "leave_type": leave_type}
+    changes = {
+        "pending_days": F("pending_days") + pending,
+        "approved_days": F("approved_days") + approved,
+        "updated_at": timezone.now(),
+    }
+    if LeaveLedger.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            LeaveLedger.objects.create(
+                **lookup, pending_days=pending, approved_days=approved
+            )
+    except IntegrityError:
+        # Another request created the row first; apply our delta on top.
+        LeaveLedger.objects.filter(**lookup).update(**changes)
+
+
+def accumulate_ledger_deltas(deltas, before, after):
+    """Add the ledger change from `before` to `after` into `deltas`."""
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        for key, (pending, approved) in _contributions(state).items():
+            current = deltas.get(key, (0, 0))
+            deltas[key] = (current[0] + sign * pending, current[1] + sign * approved)
+    return deltas
+
+
+def sync_ledger(before, after):
+    """
+    Move ledger totals from the `before` state to the `after` state of an
+    application. Either may be None (created / deleted application).
+    """
+    deltas = accumulate_ledger_deltas({}, before, after)
+    for (employee_id, year, leave_type), (pending, approved) in deltas.items():
+        if pending or approved:
+            adjust_ledger(employee_id, year, leave_type, pending, approved)
+
+
+def bulk_adjust_ledger(deltas):
+    """
+    Apply many ledger deltas with one read and one update. The rare rows
+    that do not exist yet go through adjust_ledger(), whose upsert clamps
+    them at zero and survives a concurrent insert of the same row.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    employee_ids = {employee_id for employee_id, _, _ in deltas}
+    years = {year for _, year, _ in deltas}
+    rows = {
+        (row.employee_id, row.year, row.leave_type): row
+        for row in LeaveLedger.objects.select_for_update().filter(
+            employee_id__in=employee_ids, year__in=years
+        )
+    }
+    now = timezone.now()
+    changed, missing = [], []
+    for key, (pending, approved) in deltas.items():
+        row = rows.get(key)
+        if row is None:
+            missing.append((key, pending, approved))
+            continue
+        row.pending_days += pending
+        row.approved_days += approved
+        row.updated_at = now
+        changed.append(row)
+    LeaveLedger.objects.bulk_update(
+        changed, ["pending_days", "approved_days", "updated_at"], batch_size=500
+    )
+    for (employee_id, year, leave_type), pending, approved in missing:
+        adjust_ledger(employee_id, year, leave_type, pending, approved)
+
+
+# ---------------------- APPLY ----------------------
+
+
+def _applicant_query(application, check_overlap):
+    """
+    The application's employee annotated with `pending_days` (of its other
+    pending applications) and, if `check_overlap`, `has_overlap` (another
+    active application overlapping its dates): everything the apply checks
+    need, in one query.
+    """
+    others = Application.objects.filter(employee=OuterRef("pk")).exclude(
+        pk=application.pk
+    )
+    pending = (
+        others.pending()
+        .order_by()
+        .values("employee")
+        .annotate(total=Sum("days"))
+        .values("total")
+    )
+    checks = {"pending_days": Coalesce(Subquery(pending), 0)}
+    if check_overlap:
+        checks["has_overlap"] = Exists(
+            others.active().filter(
+                start_date__lte=application.end_date,
+                end_date__gte=application.start_date,
+            )
+        )
+    return EmployeeProfile.objects.annotate(**checks).filter(pk=application.employee_id)
+
+
+def _applicant(application, check_overlap):
+    return _applicant_query(application, check_overlap).get()
+
+
+@transaction.atomic
+def submit_application(employee_id, data):
+    """
+    Create a pending application from validated `data` (leave_type,
+    start_date, end_date, reason_description) for an employee.
+
+    Runs a fixed three queries: the INSERT, one read of the employee with
+    the balance checks, and the ledger upsert; on PostgreSQL a lock of the
+    employee row comes in between. Overlaps are rejected by the database
+    at the INSERT (see OVERLAP_VENDORS), even between concurrent requests;
+    elsewhere the employee read checks for them.
+
+    Concurrent applications of one employee are checked one at a time, so
+    they cannot both pass the balance check. On SQLite the INSERT, coming
+    first, takes the database write lock for the whole transaction. On
+    PostgreSQL the employee row lock queues them, and the checks, run by a
+    later statement, see what the previous holder committed (READ
+    COMMITTED). A failed check rolls the INSERT back.
+    Raises EmployeeProfile.DoesNotExist or LeaveApplicationError.
+    """
+    start, end = data["start_date"], data["end_date"]
+    if not count_workdays(start, end):
+        raise LeaveApplicationError("The selected dates contain no working days.")
+
+    application = Application(
+        employee_id=employee_id, status=Application.StatusChoices.PENDING, **data
+    )
+    try:
+        application.save(force_insert=True)
+    except IntegrityError as exc:
+        if is_overlap_violation(exc):
+            raise LeaveApplicationError(OVERLAP_MESSAGE) from exc
+        raise
+
+    if connection.vendor == "postgresql":
+        # NO KEY UPDATE: the INSERT's foreign key check holds KEY SHARE on
+        # the row, which a plain FOR UPDATE would deadlock against.
+        EmployeeProfile.objects.select_for_update(no_key=True).filter(
+            pk=employee_id
+        ).exists()
+    check_overlap = connection.vendor not in OVERLAP_VENDORS
+    employee = _applicant(application, check_overlap)
+    if start < employee.joining_date:
+        raise LeaveApplicationError("Cannot apply for leave before the joining date.")
+    if check_overlap and employee.has_overlap:
+        raise LeaveApplicationError(OVERLAP_MESSAGE)
+    if application.days + employee.pending_days > employee.leave_balance:
+        raise LeaveApplicationError(
+            "Requested days exceed available leave balance when considering other pending leaves."
+        )
+
+    # The fresh employee row serves the rollup department and the response.
+    application.employee = employee
+    sync_ledger(None, ledger_state(application))
+    status_changed([(application, None, application.status)])
+    return application
+
+
+# ---------------------- DECISIONS ----------------------
+
+
+def status_changed(changes):
+    """Send application_status_changed for (application, old, new) tuples."""
+    if changes:
+        application_status_changed.send(sender=Application, changes=changes)
+
+
+def _claim_pending(application, **changes):
+    """
+    Move a pending application to a new status with a conditional UPDATE.
+
+    Only one of several concurrent callers can match status='pending', so
+    the loser gets LeaveDecisionError instead of deciding twice. The row is
+    re-read afterwards (it is now locked by our UPDATE) so the caller works
+    with the committed dates rather than a possibly stale instance.
+    """
+    claimed = Application.objects.filter(
+        pk=application.pk, status=Application.StatusChoices.PENDING
+    ).update(updated_at=timezone.now(), **changes)
+    if not claimed:
+        raise LeaveDecisionError("Leave already processed")
+    application.refresh_from_db()
+
+
+@transaction.atomic
+def approve_application(application):
+    """Approve a pending application and deduct its days from the balance."""
+    _claim_pending(
+        application,
+        status=Application.StatusChoices.APPROVED,
+        rejection_reason=None,
+    )
+    # Balance check and deduction in one statement: no read-modify-write.
+    # Failing it rolls back the status change above.
+    days = application.days
+    deducted = EmployeeProfile.objects.filter(
+        pk=application.employee_id, leave_balance__gte=days
+    ).update(leave_balance=F("leave_balance") - days, updated_at=timezone.now())
+    if not deducted:
+        raise LeaveDecisionError(
+            "Insufficient leave balance to approve this application."
+        )
+
+    was_pending = ledger_state(application, Application.StatusChoices.PENDING)
+    sync_ledger(was_pending, ledger_state(application))
+    status_changed(
+        [(application, Application.StatusChoices.PENDING, application.status)]
+    )
+    return application
+
+
+@transaction.atomic
+def reject_application(application, reason):
+    """Reject a pending application, releasing its pending days."""
+    _claim_pending(
+        application,
+        status=Application.StatusChoices.REJECTED,
+        rejection_reason=reason,
+    )
+    was_pending = ledger_state(application, Application.StatusChoices.PENDING)
+    sync_ledger(was_pending, ledger_state(application))
+    status_changed(
+        [(application, Application.StatusChoices.PENDING, application.status)]
+    )
+    return application
+
+
+@transaction.atomic
+def decide_applications(decisions):
+    """
+    Approve or reject many applications in one transaction.
+
+    `decisions` is a list of dicts with `application_id`, `decision`
+    ("approve" / "reject") and an optional `rejection_reason`. Items are
+    processed in order, so earlier approvals consume balance first. Items
+    that cannot be applied are reported and skipped; the rest are written
+    with bulk updates. Returns one result dict per input item.
+    """
+    ids = {item["application_id"] for item in decisions}
+    applications = Application.objects.select_for_update().in_bulk(ids)
+    employees = EmployeeProfile.objects.select_for_update().in_bulk(
+        {app.employee_id for app in applications.values()}
+    )
+
+    now = timezone.now()
+    results, seen = [], set()
+    decided, touched_employees, deltas, changes = [], set(), {}, []
+    for item in decisions:
+        app_id = item["application_id"]
+        result = {"application_id": app_id}
+        results.append(result)
+        application = applications.get(app_id)
+        if application is None:
+            result.update(status="failed", message="Application not found")
+            continue
+        if app_id in seen:
+            result.update(status="failed", message="Duplicate decision")
+            continue
+        seen.add(app_id)
+        if application.status != Application.StatusChoices.PENDING:
+            result.update(status="failed", message="Leave already processed")
+            continue
+
+        before = ledger_state(application)
+        if item["decision"] == "approve":
+            employee = employees[application.employee_id]
+            if application.days > employee.leave_balance:
+                result.update(
+                    status="failed",
+                    message="Insufficient leave balance to approve this application.",
+                )
+                continue
+            employee.leave_balance -= application.days
+            employee.updated_at = now
+            touched_employees.add(employee.pk)
+            application.status = Application.StatusChoices.APPROVED
+            application.rejection_reason = None
+        else:
+            application.status = Application.StatusChoices.REJECTED
+            application.rejection_reason = (
+                item.get("rejection_reason") or "No reason provided"
+            )
+        application.updated_at = now
+        decided.append(application)
+        changes.append(
+            (application, Application.StatusChoices.PENDING, application.status)
+        )
+        accumulate_ledger_deltas(deltas, before, ledger_state(application))
+        result.update(status=application.status, message="Leave " + application.status)
+
+    Application.objects.bulk_update(
+        decided, ["status", "rejection_reason", "updated_at"], batch_size=500
+    )
+    EmployeeProfile.objects.bulk_update(
+        [employees[pk] for pk in touched_employees],
+        ["leave_balance", "updated_at"],
+        batch_size=500,
+    )
+    bulk_adjust_ledger(deltas)
+    status_changed(changes)
+    return results
@@ -0,0 +1,119 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from rest_framework.authtoken.models import Token
+
+from . import analytics
+from .authentication import get_token_cache
+from .events import application_event, get_broker
+from .metrics import application_transitions
+from .models import EmployeeProfile, Holiday, User
+from .workdays import get_calendar
+
+# Sent with sender=Application by core.services and ApplicationSerializer
+# inside the transaction that changes application statuses. `changes` is a
+# list of (application, old_status, new_status) tuples; old_status is None
+# for newly created applications. Receivers that act on committed state
+# should defer with transaction.on_commit().
+application_status_changed = Signal()
+
+
+# ---------------------- AUTH TOKEN CACHE ----------------------
+
+
+@receiver([post_save, post_delete], sender=Token)
+def drop_cached_token(sender, instance, **kwargs):
+    # logout deletes the token; delete_employee cascades to it.
+    get_token_cache().delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def drop_cached_user_tokens(sender, instance, created, **kwargs):
+    # Role / is_active / password changes must not be served from the cache.
+    if created:
+        return
+    drop_tokens_of(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=EmployeeProfile)
+def drop_cached_profile_tokens(sender, instance, **kwargs):
+    # Cached tokens carry the user's employee profile (see
+    # core.authentication.TOKEN_RELATED).
+    drop_tokens_of(instance.user_id)
+
+
+def drop_tokens_of(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+        get_token_cache().delete(key)
+
+
+# ---------------------- WORKING DAYS ----------------------
+
+
+@receiver([post_save, post_delete], sender=Holiday)
+def clear_workday_cache(sender, instance, **kwargs):
+    # Applications saved from now on are charged with the new calendar;
+    # days already charged are not recomputed.
+    get_calendar().clear()
+
+
+# ---------------------- METRICS ----------------------
+
+
+@receiver(application_status_changed)
+def count_status_changes(sender, changes, **kwargs):
+    counts = Counter((old or "none", new) for _, old, new in changes)
+
+    def record():
+        for (old, new), count in counts.items():
+            application_transitions.inc(count, from_status=old, to_status=new)
+
+    transaction.on_commit(record)
+
+
+# ---------------------- EVENT STREAM ----------------------
+
+
+@receiver(application_status_changed)
+def publish_status_changes(sender, changes, **kwargs):
+    events = [application_event(app, old, new) for app, old, new in changes]
+
+    def publish():
+        broker = get_broker()
+        for event in events:
+            broker.publish(event)
+
+    transaction.on_commit(publish)
+
+
+# ---------------------- ANALYTICS ROLLUPS ----------------------
+
+
+@receiver(application_status_changed)
+def update_rollups(sender, changes, **kwargs):
+    # Queued in the writing transaction, applied by the worker after it
+    # commits; a rolled back change queues nothing.
+    analytics.record_status_changes(changes)
+
+
+@receiver(pre_save, sender=EmployeeProfile)
+def move_rollups_to_department(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (
+        update_fields is not None and "department" not in update_fields
+    ):
+        return
+    old = (
+        EmployeeProfile.objects.filter(pk=instance.pk)
+        .values_list("department", flat=True)
+        .first()
+    )
+    if old is not None and old != instance.department:
+        analytics.move_employee(instance.pk, old, instance.department)
+
+
+@receiver(pre_delete, sender=EmployeeProfile)
+def drop_employee_rollups(sender, instance, **kwargs):
+    # One aggregate here instead of a delta per cascaded application.
+    analytics.move_employee(instance.pk, instance.department, None)
@@ -0,0 +1,257 @@
+"""
+Database-backed background jobs for side effects of leave workflow
+changes.
+
+Functions decorated with @task are registered by name. enqueue() inserts
+a BackgroundJob row in the caller's transaction, so a job exists only if
+the change that queued it commits, and the request pays for one INSERT.
+`manage.py run_worker` claims due jobs and runs them on a thread pool.
+A handler runs in a transaction together with marking its job
+succeeded, so a failed attempt leaves nothing behind and is retried
+with exponential backoff, up to the job's max_attempts.
+
+With BACKGROUND_TASKS["EAGER"] set, enqueue() calls the handler
+immediately instead (tests, or deployments without a worker).
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "EAGER": False,
+    "MAX_ATTEMPTS": 5,
+    # Seconds before the first retry; doubled for every further attempt.
+    "RETRY_BACKOFF": 5,
+    "MAX_BACKOFF": 3600,
+    # A job still running after this many seconds is assumed to belong to
+    # a dead worker and is queued again.
+    "STALE_AFTER": 600,
+    # Succeeded jobs are deleted after this many seconds (checked hourly).
+    "KEEP_SUCCEEDED": 7 * 24 * 3600,
+}
+
+PURGE_INTERVAL = 3600
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "BACKGROUND_TASKS", {})}
+
+
+class JobCancelled(Exception):
+    """The job was cancelled (see cancel()) while its handler ran."""
+
+
+_registry = {}
+
+
+def task(name, max_attempts=None):
+    """Register the decorated function as the handler of task `name`."""
+
+    def register(func):
+        if name in _registry:
+            raise ValueError(f"Task {name!r} is already registered")
+        _registry[name] = (func, max_attempts)
+        return func
+
+    return register
+
+
+def enqueue(name, payload=None, delay=None):
+    """Queue task `name` with a JSON payload of keyword arguments."""
+    func, max_attempts = _registry[name]
+    payload = payload or {}
+    options = get_options()
+    if options["EAGER"]:
+        func(**payload)
+        return None
+    return BackgroundJob.objects.create(
+        task=name,
+        payload=payload,
+        max_attempts=max_attempts or options["MAX_ATTEMPTS"],
+        run_after=timezone.now() + timedelta(seconds=delay or 0),
+    )
+
+
+# ---------------------- WORKER ----------------------
+
+
+def backoff(attempts, options=None):
+    """Seconds to wait before retrying after `attempts` failed attempts."""
+    options = options or get_options()
+    return min(options["RETRY_BACKOFF"] * 2 ** (attempts - 1), options["MAX_BACKOFF"])
+
+
+def claim(worker, limit):
+    """
+    Mark up to `limit` due jobs as running for `worker` and return them.
+    SKIP LOCKED lets several workers poll without waiting on each other;
+    the conditional UPDATE keeps a job from being claimed twice where row
+    locks are not available (SQLite).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            BackgroundJob.objects.select_for_update(skip_locked=True)
+            .filter(status=BackgroundJob.StatusChoices.QUEUED, run_after__lte=now)
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        BackgroundJob.objects.filter(
+            pk__in=ids, status=BackgroundJob.StatusChoices.QUEUED
+        ).update(
+            status=BackgroundJob.StatusChoices.RUNNING,
+            locked_by=worker,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+    return list(
+        BackgroundJob.objects.filter(
+            pk__in=ids, locked_by=worker, locked_at=now
+        ).order_by("run_after", "id")
+    )
+
+
+def execute(job):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    options = get_options()
+    entry = _registry.get(job.task)
+    try:
+        if entry is None:
+            raise LookupError(f"Unknown task {job.task!r}")
+        with transaction.atomic():
+            entry[0](**job.payload)
+            now = timezone.now()
+            finished = BackgroundJob.objects.filter(
+                pk=job.pk,
+                status=BackgroundJob.StatusChoices.RUNNING,
+                locked_by=job.locked_by,
+            ).update(
+                status=BackgroundJob.StatusChoices.SUCCEEDED,
+                last_error="",
+                finished_at=now,
+                updated_at=now,
+            )
+            if not finished:
+                # Roll the handler's writes back.
+                raise JobCancelled
+        return True
+    except JobCancelled:
+        logger.info("Background job %s (%s) was cancelled", job.pk, job.task)
+        return False
+    except Exception as exc:
+        logger.exception("Background job %s (%s) failed", job.pk, job.task)
+        now = timezone.now()
+        changes = {"last_error": f"{type(exc).__name__}: {exc}", "updated_at": now}
+        if entry is not None and job.attempts < job.max_attempts:
+            changes.update(
+                status=BackgroundJob.StatusChoices.QUEUED,
+                run_after=now + timedelta(seconds=backoff(job.attempts, options)),
+            )
+        else:
+            changes.update(status=BackgroundJob.StatusChoices.FAILED, finished_at=now)
+        BackgroundJob.objects.filter(pk=job.pk).update(**changes)
+        return False
+
+
+def cancel(name, reason):
+    """
+    Mark the queued and running jobs of task `name` as done without
+    running them; a handler still running is rolled back when it ends.
+    """
+    now = timezone.now()
+    return BackgroundJob.objects.filter(
+        task=name,
+        status__in=[
+            BackgroundJob.StatusChoices.QUEUED,
+            BackgroundJob.StatusChoices.RUNNING,
+        ],
+    ).update(
+        status=BackgroundJob.StatusChoices.SUCCEEDED,
+        last_error=reason,
+        finished_at=now,
+        updated_at=now,
+    )
+
+
+def requeue_stale(options=None):
+    """Queue again the jobs of workers that died mid-job."""
+    options = options or get_options()
+    cutoff = timezone.now() - timedelta(seconds=options["STALE_AFTER"])
+    return BackgroundJob.objects.filter(
+        status=BackgroundJob.StatusChoices.RUNNING, locked_at__lt=cutoff
+    ).update(status=BackgroundJob.StatusChoices.QUEUED, updated_at=timezone.now())
+
+
+def purge_succeeded(options=None):
+    options = options or get_options()
+    cutoff = timezone.now() - timedelta(seconds=options["KEEP_SUCCEEDED"])
+    deleted, _ = BackgroundJob.objects.filter(
+        status=BackgroundJob.StatusChoices.SUCCEEDED, finished_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _run_in_thread(job):
+    try:
+        return execute(job)
+    finally:
+        # Pool threads keep their own connections; drop broken or expired ones.
+        close_old_connections()
+
+
+class Worker:
+    """Poll for due jobs and run them on `concurrency` threads."""
+
+    def __init__(self, concurrency=4, poll_interval=1.0, name=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = name or worker_name()
+        self.stopping = threading.Event()
+        self.succeeded = 0
+        self.failed = 0
+
+    def run(self, once=False):
+        """Work until stop() is called, or until no job is due if `once`."""
+        options = get_options()
+        purged_at = None
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            while not self.stopping.is_set():
+                if purged_at is None or time.monotonic() - purged_at > PURGE_INTERVAL:
+                    purge_succeeded(options)
+                    purged_at = time.monotonic()
+                requeue_stale(options)
+                jobs = claim(self.name, self.concurrency * 4)
+                if not jobs:
+                    if once:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                for ok in pool.map(_run_in_thread, jobs):
+                    if ok:
+                        self.succeeded += 1
+                    else:
+                        self.failed += 1
+
+    def stop(self):
+        self.stopping.set()
@@ -1,3 +1,2023 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from importlib import import_module
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import (
+    IntegrityError,
+    OperationalError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.http import StreamingHttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from MiniLeaveBackend.databases import default_database, replica_databases
+
+from . import async_views, availability, exports, importers
+from .accrual import AccrualPolicyError, run_accrual
+from .analytics import (
+    GROUPS,
+    live_report,
+    rebuild_rollups,
+    rollup_report,
+    totals,
+)
+from .authentication import (
+    CachedTokenAuthentication,
+    get_token_cache,
+    reset_token_cache,
+)
+from .benchmarking import leave_api_async, seed
+from .events import get_broker, reset_broker
+from .importers import EmployeeImporter, iter_csv, iter_json
+from .instrumentation import endpoint_stats
+from .metrics import Registry
+from .models import (
+    AccrualPolicy,
+    AccrualRun,
+    Application,
+    BackgroundJob,
+    EmployeeProfile,
+    Holiday,
+    LeaveLedger,
+    LeaveRollup,
+    User,
+)
+from .routers import ReplicaRouter, read_from_replica, replica_allowed, use_replica
+from .serializers import ApplicationSerializer
+from .services import (
+    OVERLAP_CONSTRAINT,
+    LeaveDecisionError,
+    approve_application,
+    bulk_adjust_ledger,
+    ledger_state,
+    reject_application,
+    submit_application,
+    sync_ledger,
+)
+from .tasks import backoff, cancel, claim, enqueue, execute, requeue_stale, task
+from .workdays import count_workdays, reset_calendar
+
+
+def make_employee(email, leave_balance=10):
+    user = User.objects.create_user(
+        username=email, email=email, password="password", role="employee"
+    )
+    return EmployeeProfile.objects.create(
+        user=user,
+        phone_number="0300000000",
+        department="engineering",
+        joining_date=date(2020, 1, 1),
+        leave_balance=leave_balance,
+    )
+
+
+def make_application(employee, start, days=2, **fields):
+    application = Application.objects.create(
+        employee=employee,
+        start_date=start,
+        end_date=start + timedelta(days=days - 1),
+        **fields,
+    )
+    sync_ledger(None, ledger_state(application))
+    return application
+
+
+def token_client(user):
+    client = APIClient()
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+def make_hr(email="hr@example.com"):
+    return User.objects.create_user(
+        username=email, email=email, password="password", role="hr"
+    )
+
+
+# ---------------------- AUTH TOKEN CACHE ----------------------
+
+
+class TokenCacheTests(TestCase):
+    backend = "local"
+
+    def setUp(self):
+        self.enterContext(override_settings(TOKEN_AUTH_CACHE={"BACKEND": self.backend}))
+        reset_token_cache()
+        self.addCleanup(reset_token_cache)
+        caches["default"].clear()
+        self.employee = make_employee("cached@example.com")
+        self.client = token_client(self.employee.user)
+        self.key = self.employee.user.auth_token.key
+
+    def balance(self):
+        return self.client.get(f"/api/leave/balance/{self.employee.pk}/")
+
+    def test_token_is_read_once(self):
+        self.assertEqual(self.balance().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.balance().status_code, 200)
+
+        self.assertFalse([q for q in queries if "authtoken_token" in q["sql"]])
+        self.assertEqual(get_token_cache().stats()["hits"], 1)
+
+    def test_logout_drops_the_cached_token(self):
+        self.assertEqual(self.balance().status_code, 200)
+
+        self.assertEqual(self.client.post("/api/logout/").status_code, 200)
+
+        self.assertEqual(self.balance().status_code, 401)
+
+    def test_employee_delete_drops_the_cached_token(self):
+        self.assertEqual(self.balance().status_code, 200)
+
+        response = token_client(make_hr()).delete(
+            "/api/employee/delete/", {"employee_id": self.employee.pk}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.balance().status_code, 401)
+
+    def test_user_and_profile_saves_drop_the_cached_token(self):
+        self.assertEqual(self.balance().status_code, 200)
+        self.employee.department = "sales"
+        self.employee.save()
+        self.assertIsNone(get_token_cache().get(self.key))
+
+        self.assertEqual(self.balance().status_code, 200)
+        user = self.employee.user
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.balance().status_code, 401)
+
+    def authenticate(self, key=None):
+        return CachedTokenAuthentication().authenticate_credentials(key or self.key)
+
+    def test_each_request_gets_its_own_instances(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            first_user, first_token = self.authenticate()
+            second_user, second_token = self.authenticate()
+        self.assertIsNot(first_user, second_user)
+        self.assertIsNot(first_token, second_token)
+        self.assertIsNot(first_user.employee_profile, second_user.employee_profile)
+
+        first_user.role = "hr"
+        first_user.employee_profile.leave_balance = 0
+        user, token = self.authenticate()
+        self.assertEqual(user.role, "employee")
+        self.assertEqual(user.employee_profile.leave_balance, 10)
+        self.assertIs(token.user, user)
+        self.assertIs(user.employee_profile.user, user)
+
+    def test_password_hashes_are_not_cached(self):
+        self.authenticate()
+        entry = get_token_cache().get(self.key)
+        self.assertNotIn("password", entry["user"])
+        self.assertNotIn(self.employee.user.password, repr(entry))
+
+        user, _ = self.authenticate()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password("password"))
+
+    def test_users_without_a_profile(self):
+        hr = make_hr()
+        key = Token.objects.create(user=hr).key
+        self.authenticate(key)
+        user, _ = self.authenticate(key)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.role, "hr")
+            with self.assertRaises(EmployeeProfile.DoesNotExist):
+                user.employee_profile
+
+
+class SharedTokenCacheTests(TokenCacheTests):
+    backend = "django"
+
+
+# ---------------------- EMPLOYEE IMPORT ----------------------
+
+
+def employee_record(number, **fields):
+    return {
+        "email": f"imported{number}@example.com",
+        "phone_number": "0300000000",
+        "department": "sales",
+        "joining_date": "2024-01-15",
+        **fields,
+    }
+
+
+class EmployeeImportTests(TestCase):
+    def import_json(self, text, batch_size=500):
+        importer = EmployeeImporter(batch_size=batch_size, workers=0)
+        return importer.run(iter_json(io.BytesIO(text.encode())))
+
+    def test_invalid_and_duplicate_rows_are_reported(self):
+        make_employee("taken@example.com")
+        csv_text = (
+            "email,phone_number,department,joining_date,leave_balance\n"
+            "a@example.com,0300000000,sales,2024-01-15,12\n"
+            "b@example.com,0300000000,sales,not-a-date,\n"
+            "a@example.com,0300000000,sales,2024-01-15,\n"
+            "taken@example.com,0300000000,sales,2024-01-15,\n"
+            "c@example.com,0300000000,sales,2024-01-15,\n"
+        )
+        report = EmployeeImporter(workers=0).run(
+            iter_csv(io.BytesIO(csv_text.encode()))
+        )
+
+        self.assertEqual(report["created"], 2)
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 3, 4])
+        self.assertIn("joining_date", report["errors"][0]["errors"])
+        profile = EmployeeProfile.objects.get(user__email="a@example.com")
+        self.assertEqual(profile.leave_balance, 12)
+        self.assertFalse(profile.user.has_usable_password())
+
+    def test_json_array_and_lines_are_both_read(self):
+        records = [employee_record(1), employee_record(2)]
+        report = self.import_json(json.dumps(records, indent=2))
+        self.assertEqual(report["created"], 2)
+        report = self.import_json(
+            "\n".join(json.dumps(employee_record(n)) for n in (3, 4))
+        )
+        self.assertEqual(report["created"], 2)
+
+    def test_unreadable_row_stops_the_import_with_a_partial_report(self):
+        lines = [json.dumps(employee_record(n)) for n in range(1, 4)]
+        lines += ['{"email": "broken@example.com" "department": "sales"}']
+        lines += [json.dumps(employee_record(n)) for n in range(5, 8)]
+
+        report = self.import_json("\n".join(lines), batch_size=2)
+
+        # Rows 1-3 were committed in earlier batches; nothing after row 4
+        self.assertEqual(report["created"], 3)
+        self.assertEqual(User.objects.filter(role="employee").count(), 3)
+        self.assertEqual(len(report["errors"]), 1)
+        self.assertEqual(report["errors"][0]["row"], 4)
+        message = report["errors"][0]["errors"]["non_field_errors"][0]
+        self.assertIn("line 4 column 32", message)
+
+    def test_malformed_record_does_not_read_the_rest_of_the_file(self):
+        body = b'{"email": "a@example.com"}\n{"email" 1}\n' + b"{}\n" * 500_000
+        stream = io.BytesIO(body)
+        text = io.TextIOWrapper(stream, encoding="utf-8")
+        with self.assertRaisesMessage(ValueError, "line 2 column 10"):
+            list(iter_json(text))
+        self.assertLess(stream.tell(), 256 * 1024)
+
+    def test_existing_emails_conflict_whatever_their_case(self):
+        make_employee("Taken@Example.com")
+        report = self.import_json(
+            json.dumps([employee_record(1, email="taken@EXAMPLE.com")])
+        )
+        self.assertEqual(report["created"], 0)
+        self.assertIn("already exists", report["errors"][0]["errors"]["email"][0])
+
+    def test_emails_too_long_for_a_username_are_row_errors(self):
+        email = "a" * 150 + "@example.com"
+        report = self.import_json(
+            json.dumps(
+                [
+                    employee_record(1, email=email),
+                    employee_record(2, email=email.upper(), username="long-email"),
+                    employee_record(3),
+                ]
+            )
+        )
+        self.assertEqual(report["created"], 2)
+        self.assertEqual([error["row"] for error in report["errors"]], [1])
+        self.assertIn("separate username", report["errors"][0]["errors"]["email"][0])
+        self.assertTrue(User.objects.filter(username="long-email").exists())
+
+    @override_settings(
+        PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]
+    )
+    def test_a_shared_pool_is_kept_and_small_batches_skip_it(self):
+        self.assertIs(importers.shared_pool(), importers.shared_pool())
+
+        records = [
+            employee_record(n, password="secret-password")
+            for n in range(importers.MIN_POOL_PASSWORDS)
+        ]
+        with ThreadPoolExecutor(2) as pool:
+            report = EmployeeImporter(pool=pool).run(iter(records))
+            self.assertEqual(report["created"], len(records))
+            # Still open for the next import
+            self.assertEqual(pool.submit(len, "ok").result(), 2)
+        user = User.objects.get(email=records[0]["email"])
+        self.assertTrue(user.check_password("secret-password"))
+
+        # The pool is shut down: a small batch must not need it
+        report = EmployeeImporter(pool=pool).run(
+            iter([employee_record(100, password="secret-password")])
+        )
+        self.assertEqual(report["created"], 1)
+
+    def test_endpoint_returns_the_partial_report(self):
+        lines = [json.dumps(employee_record(1)), "{not json"]
+        upload = SimpleUploadedFile(
+            "employees.jsonl", "\n".join(lines).encode(), "application/json"
+        )
+        response = token_client(make_hr()).post(
+            "/api/employee/import/", {"file": upload}, format="multipart"
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["data"]["created"], 1)
+        self.assertEqual(response.data["data"]["errors"][0]["row"], 2)
+
+
+# ---------------------- LEDGER ----------------------
+
+
+class LeaveLedgerTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee("ledger@example.com", leave_balance=10)
+        self.hr = token_client(make_hr())
+
+    def balance(self, year=2025):
+        response = self.hr.get(
+            f"/api/leave/balance/{self.employee.pk}/", {"year": year}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_backfill_deducts_leave_approved_before_the_ledger(self):
+        backfill_ledger = import_module(
+            "core.migrations.0003_leave_ledger"
+        ).backfill_ledger
+        overdrawn = make_employee("overdrawn@example.com", leave_balance=2)
+        for employee, start, days, app_status in [
+            (self.employee, date(2025, 3, 3), 3, "approved"),
+            (self.employee, date(2025, 3, 10), 2, "pending"),
+            (self.employee, date(2025, 3, 17), 2, "rejected"),
+            (self.employee, date(2024, 12, 2), 1, "approved"),
+            (overdrawn, date(2025, 3, 3), 3, "approved"),
+        ]:
+            Application.objects.create(
+                employee=employee,
+                start_date=start,
+                end_date=start + timedelta(days=days - 1),
+                status=app_status,
+            )
+
+        backfill_ledger(django_apps, None)
+
+        self.employee.refresh_from_db()
+        overdrawn.refresh_from_db()
+        self.assertEqual(self.employee.leave_balance, 6)
+        self.assertEqual(overdrawn.leave_balance, 0)
+        self.assertEqual(
+            set(
+                LeaveLedger.objects.filter(employee=self.employee).values_list(
+                    "year", "pending_days", "approved_days"
+                )
+            ),
+            {(2025, 2, 3), (2024, 0, 1)},
+        )
+
+    def test_bulk_adjust_upserts_missing_rows(self):
+        make_application(self.employee, date(2025, 3, 3), days=3)
+        key = (self.employee.id, 2025, "annual")
+        bulk_adjust_ledger(
+            {
+                key: (-1, 1),
+                # Missing rows start at zero, even for a negative delta
+                (self.employee.id, 2025, "sick"): (-2, 0),
+                (self.employee.id, 2026, "annual"): (2, 0),
+            }
+        )
+        self.assertEqual(
+            set(
+                LeaveLedger.objects.filter(employee=self.employee).values_list(
+                    "year", "leave_type", "pending_days", "approved_days"
+                )
+            ),
+            {(2025, "annual", 2, 1), (2025, "sick", 0, 0), (2026, "annual", 2, 0)},
+        )
+
+        # A row inserted by another request after the read is added to
+        manager = type(LeaveLedger.objects)
+        with mock.patch.object(manager, "select_for_update", lambda self: self.none()):
+            bulk_adjust_ledger({key: (1, 0)})
+        self.assertEqual(
+            LeaveLedger.objects.get(
+                employee=self.employee, year=2025, leave_type="annual"
+            ).pending_days,
+            3,
+        )
+
+    def test_decisions_move_ledger_totals_and_deduct_on_approval(self):
+        approved = make_application(self.employee, date(2025, 3, 3), days=3)
+        rejected = make_application(
+            self.employee, date(2025, 3, 10), days=2, leave_type="sick"
+        )
+        make_application(self.employee, date(2025, 3, 17), days=1)
+        data = self.balance()
+        self.assertEqual(data["leave_balance"], 10)
+        self.assertEqual((data["pending_days"], data["approved_days"]), (6, 0))
+
+        response = self.hr.patch(f"/api/leave/approve/{approved.pk}/")
+        self.assertEqual(response.status_code, 200, response.data)
+        response = self.hr.patch(
+            f"/api/leave/reject/{rejected.pk}/", {"rejection_reason": "Busy"}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        data = self.balance()
+        self.assertEqual(data["leave_balance"], 7)
+        self.assertEqual((data["pending_days"], data["approved_days"]), (1, 3))
+        self.assertEqual(
+            {
+                entry["leave_type"]: (entry["pending_days"], entry["approved_days"])
+                for entry in data["by_leave_type"]
+            },
+            {"annual": (1, 3), "sick": (0, 0)},
+        )
+        self.assertEqual(self.balance(2024)["by_leave_type"], [])
+
+    def test_balances_list_totals_one_year_per_employee(self):
+        other = make_employee("other@example.com", leave_balance=4)
+        other.department = "sales"
+        other.save()
+        make_application(self.employee, date(2025, 3, 3), days=2)
+        make_application(self.employee, date(2024, 3, 4), days=1)
+        approve_application(make_application(other, date(2025, 3, 3), days=3))
+
+        response = self.hr.get("/api/leave/balances/", {"year": 2025})
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            {
+                row["id"]: (
+                    row["leave_balance"],
+                    row["pending_days"],
+                    row["approved_days"],
+                )
+                for row in response.data["data"]
+            },
+            {self.employee.pk: (10, 2, 0), other.pk: (1, 0, 3)},
+        )
+        response = self.hr.get(
+            "/api/leave/balances/", {"year": 2025, "department": "sales"}
+        )
+        self.assertEqual([row["id"] for row in response.data["data"]], [other.pk])
+        response = token_client(self.employee.user).get("/api/leave/balances/")
+        self.assertEqual(response.status_code, 403)
+
+
+# ---------------------- ANALYTICS ----------------------
+
+
+@override_settings(BACKGROUND_TASKS={"EAGER": True})
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        self.alice = make_employee("alice@example.com", leave_balance=20)
+        self.bob = make_employee("bob@example.com", leave_balance=20)
+        self.bob.department = "sales"
+        self.bob.save()
+
+    def apply(self, employee, start, days=2, leave_type="sick"):
+        return submit_application(
+            employee.pk,
+            {
+                "leave_type": leave_type,
+                "start_date": start,
+                "end_date": start + timedelta(days=days - 1),
+            },
+        )
+
+    maxDiff = None
+
+    def assertRollupsMatchLive(self):
+        for group_by in (GROUPS, ("department",), ()):
+            self.assertEqual(rollup_report(group_by), live_report(group_by))
+
+    def test_rollups_follow_status_changes_edits_moves_and_deletes(self):
+        first = self.apply(self.alice, date(2025, 1, 6))
+        second = self.apply(self.alice, date(2025, 1, 29), days=3)
+        third = self.apply(self.bob, date(2025, 2, 3), leave_type="annual")
+        self.assertRollupsMatchLive()
+
+        approve_application(first)
+        reject_application(third, "Team is at capacity")
+        self.assertRollupsMatchLive()
+
+        # Into another month and leave type, then approved in the same save
+        editor = ApplicationSerializer(
+            second,
+            data={
+                "start_date": date(2025, 3, 3),
+                "end_date": date(2025, 3, 7),
+                "leave_type": "annual",
+                "status": "approved",
+            },
+            partial=True,
+        )
+        editor.is_valid(raise_exception=True)
+        editor.save()
+        self.assertRollupsMatchLive()
+
+        self.alice.department = "sales"
+        self.alice.save()
+        self.assertRollupsMatchLive()
+        sales = rollup_report(("department",), department="sales")
+        self.assertEqual(sales[0]["approved"], {"applications": 2, "days": 7})
+
+        self.bob.delete()
+        self.assertRollupsMatchLive()
+        self.assertEqual(
+            totals(rollup_report(()))["rejected"], {"applications": 0, "days": 0}
+        )
+
+    def test_rebuild_matches_live_and_cancels_queued_deltas(self):
+        self.apply(self.alice, date(2025, 1, 6))
+        LeaveRollup.objects.all().delete()
+        with override_settings(BACKGROUND_TASKS={"EAGER": False}):
+            self.apply(self.bob, date(2025, 1, 13))
+
+        self.assertEqual(rebuild_rollups(), 2)
+        self.assertRollupsMatchLive()
+        job = BackgroundJob.objects.get(task="analytics.adjust_rollups")
+        self.assertEqual(job.status, BackgroundJob.StatusChoices.SUCCEEDED)
+
+
+# ---------------------- BACKGROUND JOBS ----------------------
+
+
+@task("tests.add_holiday")
+def add_holiday_task(day, fail=False):
+    Holiday.objects.create(date=date.fromisoformat(day), name="Test")
+    if fail:
+        raise RuntimeError("Boom")
+
+
+@override_settings(
+    BACKGROUND_TASKS={"EAGER": False, "RETRY_BACKOFF": 5, "MAX_BACKOFF": 60}
+)
+class BackgroundJobTests(TestCase):
+    def queue(self, day="2025-12-25", delay=None, **payload):
+        return enqueue("tests.add_holiday", {"day": day, **payload}, delay=delay)
+
+    def run_one(self, worker="worker-1"):
+        jobs = claim(worker, 10)
+        self.assertEqual(len(jobs), 1)
+        return execute(jobs[0]), BackgroundJob.objects.get(pk=jobs[0].pk)
+
+    def test_claim_takes_due_jobs_once_in_order(self):
+        later = self.queue("2025-12-26", delay=1)
+        first = self.queue("2025-12-25")
+        BackgroundJob.objects.filter(pk=later.pk).update(
+            run_after=first.run_after - timedelta(seconds=1)
+        )
+        future = self.queue("2025-12-27", delay=3600)
+
+        jobs = claim("worker-1", 10)
+
+        self.assertEqual([job.pk for job in jobs], [later.pk, first.pk])
+        self.assertEqual({job.attempts for job in jobs}, {1})
+        self.assertEqual({job.locked_by for job in jobs}, {"worker-1"})
+        self.assertEqual(claim("worker-2", 10), [])
+        future.refresh_from_db()
+        self.assertEqual(future.status, BackgroundJob.StatusChoices.QUEUED)
+
+    def test_execute_commits_the_handler_with_the_job(self):
+        self.queue()
+
+        ok, job = self.run_one()
+
+        self.assertTrue(ok)
+        self.assertEqual(job.status, BackgroundJob.StatusChoices.SUCCEEDED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertTrue(Holiday.objects.filter(date=date(2025, 12, 25)).exists())
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        self.assertEqual([backoff(n) for n in (1, 2, 3, 5)], [5, 10, 20, 60])
+        queued = self.queue(fail=True)
+        BackgroundJob.objects.filter(pk=queued.pk).update(max_attempts=2)
+
+        before = timezone.now()
+        with self.assertLogs("core.tasks", "ERROR"):
+            ok, job = self.run_one()
+        self.assertFalse(ok)
+        self.assertEqual(job.status, BackgroundJob.StatusChoices.QUEUED)
+        self.assertEqual(job.last_error, "RuntimeError: Boom")
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=5))
+        self.assertFalse(Holiday.objects.exists())  # rolled back
+
+        BackgroundJob.objects.filter(pk=job.pk).update(run_after=before)
+        with self.assertLogs("core.tasks", "ERROR"):
+            ok, job = self.run_one()
+        self.assertFalse(ok)
+        self.assertEqual(job.status, BackgroundJob.StatusChoices.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(claim("worker-1", 10), [])
+
+    def test_unknown_task_fails_without_retry(self):
+        BackgroundJob.objects.create(task="tests.missing", max_attempts=5)
+
+        with self.assertLogs("core.tasks", "ERROR"):
+            ok, job = self.run_one()
+
+        self.assertFalse(ok)
+        self.assertEqual(job.status, BackgroundJob.StatusChoices.FAILED)
+        self.assertIn("LookupError", job.last_error)
+
+    def test_requeue_stale_only_touches_old_running_jobs(self):
+        stale, fresh = self.queue("2025-12-25"), self.queue("2025-12-26")
+        claim("dead-worker", 10)
+        BackgroundJob.objects.filter(pk=stale.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=601)
+        )
+
+        self.assertEqual(requeue_stale(), 1)
+
+        statuses = dict(BackgroundJob.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[stale.pk], BackgroundJob.StatusChoices.QUEUED)
+        self.assertEqual(statuses[fresh.pk], BackgroundJob.StatusChoices.RUNNING)
+        ok, _ = self.run_one("worker-2")
+        self.assertTrue(ok)
+
+    def test_cancel_skips_queued_jobs_and_rolls_back_running_ones(self):
+        self.queue()
+        (running,) = claim("worker-1", 10)
+        queued = self.queue("2025-12-26")
+
+        self.assertEqual(cancel("tests.add_holiday", "Not needed"), 2)
+
+        # The running handler finishes after the cancel: its writes are undone
+        self.assertFalse(execute(running))
+        self.assertFalse(Holiday.objects.exists())
+        for job in (running, queued):
+            job.refresh_from_db()
+            self.assertEqual(job.status, BackgroundJob.StatusChoices.SUCCEEDED)
+            self.assertEqual(job.last_error, "Not needed")
+        self.assertEqual(claim("worker-1", 10), [])
+
+
+# ---------------------- CONCURRENCY ----------------------
+
+
+class ConcurrentDecisionTests(TransactionTestCase):
+    """
+    Several threads, each with its own database connection, race to decide
+    the same applications. Run against PostgreSQL for real row locking; on
+    SQLite the writers serialize and "database is locked" is retried.
+    """
+
+    threads = 8
+
+    def _race(self, jobs):
+        """Run (decide, application_id) jobs concurrently; return outcomes."""
+        barrier = threading.Barrier(len(jobs))
+        outcomes = []
+        lock = threading.Lock()
+
+        def worker(decide, application_id):
+            try:
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        decide(Application.objects.get(pk=application_id))
+                        outcome = "ok"
+                        break
+                    except LeaveDecisionError as exc:
+                        outcome = exc.message
+                        break
+                    except OperationalError:
+                        # SQLite: another writer holds the database lock.
+                        time.sleep(0.01 * (attempt + 1))
+                else:
+                    outcome = "gave up"
+                with lock:
+                    outcomes.append(outcome)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=job) for job in jobs]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return outcomes
+
+    def test_same_application_is_approved_once(self):
+        employee = make_employee("race@example.com", leave_balance=10)
+        application = make_application(employee, date(2025, 3, 3), days=3)
+
+        outcomes = self._race([(approve_application, application.pk)] * self.threads)
+
+        self.assertEqual(outcomes.count("ok"), 1, outcomes)
+        self.assertEqual(
+            outcomes.count("Leave already processed"), self.threads - 1, outcomes
+        )
+        employee.refresh_from_db()
+        self.assertEqual(employee.leave_balance, 7)
+        ledger = LeaveLedger.objects.get(employee=employee)
+        self.assertEqual((ledger.pending_days, ledger.approved_days), (0, 3))
+
+    def test_approvals_never_overdraw_balance(self):
+        employee = make_employee("overdraw@example.com", leave_balance=10)
+        jobs = [
+            (
+                approve_application,
+                make_application(employee, date(2025, 1, 1) + timedelta(days=7 * n)).pk,
+            )
+            for n in range(self.threads)
+        ]
+
+        outcomes = self._race(jobs)
+
+        self.assertEqual(outcomes.count("ok"), 5, outcomes)
+        employee.refresh_from_db()
+        self.assertEqual(employee.leave_balance, 0)
+        self.assertEqual(
+            Application.objects.filter(employee=employee, status="approved").count(), 5
+        )
+        ledger = LeaveLedger.objects.get(employee=employee)
+        self.assertEqual((ledger.pending_days, ledger.approved_days), (6, 10))
+
+    def test_approve_and_reject_race_has_one_winner(self):
+        employee = make_employee("mixed@example.com", leave_balance=10)
+        application = make_application(employee, date(2025, 5, 5), days=2)
+
+        def reject(app):
+            reject_application(app, "Team is at capacity")
+
+        jobs = [(approve_application, application.pk), (reject, application.pk)]
+        outcomes = self._race(jobs * (self.threads // 2))
+
+        self.assertEqual(outcomes.count("ok"), 1, outcomes)
+        application.refresh_from_db()
+        employee.refresh_from_db()
+        expected_balance = 8 if application.status == "approved" else 10
+        self.assertEqual(employee.leave_balance, expected_balance)
+
+
+class DecisionServiceTests(TestCase):
+    def test_stale_instance_cannot_be_decided_twice(self):
+        employee = make_employee("stale@example.com", leave_balance=10)
+        application = make_application(employee, date(2025, 3, 3), days=2)
+        stale = Application.objects.get(pk=application.pk)
+
+        approve_application(application)
+        with self.assertRaises(LeaveDecisionError):
+            reject_application(stale, "Too late")
+
+        employee.refresh_from_db()
+        self.assertEqual(employee.leave_balance, 8)
+
+
+class BulkDecisionTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee("bulk@example.com", leave_balance=5)
+        self.first = make_application(self.employee, date(2025, 3, 3), days=3)
+        self.second = make_application(self.employee, date(2025, 3, 10), days=3)
+        self.third = make_application(self.employee, date(2025, 3, 17), days=2)
+        self.client = token_client(make_hr())
+
+    def decide(self, *decisions):
+        items = []
+        for app_id, decision, *reason in decisions:
+            item = {"application_id": app_id, "decision": decision}
+            if reason:
+                item["rejection_reason"] = reason[0]
+            items.append(item)
+        response = self.client.patch(
+            "/api/leave/decisions/", {"decisions": items}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def outcomes(self, data):
+        return [(result["status"], result["message"]) for result in data["data"]]
+
+    def test_balance_is_consumed_in_request_order(self):
+        data = self.decide(
+            (self.second.pk, "approve"),
+            (self.first.pk, "approve"),
+            (self.third.pk, "approve"),
+        )
+
+        self.assertEqual(
+            self.outcomes(data),
+            [
+                ("approved", "Leave approved"),
+                (
+                    "failed",
+                    "Insufficient leave balance to approve this application.",
+                ),
+                ("approved", "Leave approved"),
+            ],
+        )
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.leave_balance, 0)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, "pending")
+        ledger = LeaveLedger.objects.get(employee=self.employee)
+        self.assertEqual((ledger.pending_days, ledger.approved_days), (3, 5))
+
+    def test_mixed_results_with_duplicates_and_processed_applications(self):
+        other = make_employee("other@example.com")
+        processed = approve_application(
+            make_application(other, date(2025, 3, 3), days=1)
+        )
+
+        data = self.decide(
+            (self.first.pk, "approve"),
+            (self.second.pk, "reject", "Team is at capacity"),
+            (self.first.pk, "reject"),
+            (processed.pk, "reject"),
+            (999999, "approve"),
+            (self.third.pk, "reject"),
+        )
+
+        self.assertEqual(data["message"], "3 of 6 applications processed")
+        self.assertEqual(
+            [result["application_id"] for result in data["data"]],
+            [
+                self.first.pk,
+                self.second.pk,
+                self.first.pk,
+                processed.pk,
+                999999,
+                self.third.pk,
+            ],
+        )
+        self.assertEqual(
+            self.outcomes(data),
+            [
+                ("approved", "Leave approved"),
+                ("rejected", "Leave rejected"),
+                ("failed", "Duplicate decision"),
+                ("failed", "Leave already processed"),
+                ("failed", "Application not found"),
+                ("rejected", "Leave rejected"),
+            ],
+        )
+        self.assertEqual(
+            dict(
+                Application.objects.filter(employee=self.employee).values_list(
+                    "pk", "rejection_reason"
+                )
+            ),
+            {
+                self.first.pk: None,
+                self.second.pk: "Team is at capacity",
+                self.third.pk: "No reason provided",
+            },
+        )
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.leave_balance, 2)
+        processed.refresh_from_db()
+        self.assertEqual(processed.status, "approved")
+
+
+# ---------------------- APPLY ----------------------
+
+
+@override_settings(BACKGROUND_TASKS={"EAGER": False})
+class ApplyQueryTests(TestCase):
+    """An apply costs the same few queries however much history there is."""
+
+    def setUp(self):
+        self.employee = make_employee("apply@example.com", leave_balance=20)
+        token = Token.objects.create(user=self.employee.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        # Warm the token and working-day caches.
+        self.apply(date(2025, 1, 6), date(2025, 1, 7))
+
+    def apply(self, start, end, leave_type="sick"):
+        return self.client.post(
+            "/api/leave/apply/",
+            {"leave_type": leave_type, "start_date": start, "end_date": end},
+            format="json",
+        )
+
+    row_lock = int(connection.vendor == "postgresql")
+
+    def statements(self, start, end, leave_type="sick"):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.apply(start, end, leave_type)
+        # Transaction control (BEGIN / SAVEPOINT / COMMIT ...) is not counted.
+        sql = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].split()[0].upper() in ("SELECT", "INSERT", "UPDATE")
+        ]
+        return response, sql
+
+    def test_apply_runs_a_fixed_number_of_queries(self):
+        for start, end, leave_type in [
+            (date(2025, 2, 3), date(2025, 2, 4), "sick"),  # existing ledger row
+            (date(2025, 3, 3), date(2025, 3, 4), "annual"),  # new ledger row
+        ]:
+            response, sql = self.statements(start, end, leave_type)
+            self.assertEqual(response.status_code, 201, response.data)
+            # The application, one employee read with the overlap and
+            # pending checks, the ledger upsert and the queued rollup job;
+            # on PostgreSQL the employee row lock before the read.
+            self.assertEqual(len(sql), 4 + self.row_lock, sql)
+
+        ledger = LeaveLedger.objects.filter(employee=self.employee, year=2025)
+        self.assertEqual(
+            dict(ledger.values_list("leave_type", "pending_days")),
+            {"sick": 4, "annual": 2},
+        )
+
+    def test_overlap_is_rejected_by_the_insert(self):
+        response, sql = self.statements(date(2025, 1, 7), date(2025, 1, 8))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["message"],
+            {
+                "non_field_errors": [
+                    "Overlapping leave request exists for this employee."
+                ]
+            },
+        )
+        self.assertEqual(len(sql), 1, sql)
+
+    def test_leave_span_is_bounded_before_counting_days(self):
+        response, sql = self.statements(date(2020, 1, 6), date(9998, 12, 31))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["message"],
+            {"non_field_errors": ["Leave cannot span more than 366 days."]},
+        )
+        self.assertEqual(sql, [])
+
+    def test_apply_in_the_last_representable_year(self):
+        response = self.apply(date(9999, 12, 27), date(9999, 12, 28))
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["data"]["days"], 2)
+
+    def test_rejected_apply_is_rolled_back(self):
+        # 40 working days against a balance of 20
+        response, sql = self.statements(date(2025, 2, 3), date(2025, 3, 28))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(sql), 2 + self.row_lock, sql)
+        self.assertEqual(Application.objects.filter(employee=self.employee).count(), 1)
+
+
+class OverlapConstraintTests(TestCase):
+    def test_database_rejects_overlapping_active_applications(self):
+        employee = make_employee("overlap@example.com")
+        make_application(employee, date(2025, 3, 3), days=3)
+        rejected = make_application(
+            employee, date(2025, 3, 10), days=2, status="rejected"
+        )
+
+        with self.assertRaisesMessage(IntegrityError, OVERLAP_CONSTRAINT):
+            with transaction.atomic():
+                make_application(employee, date(2025, 3, 5), days=2)
+        with self.assertRaisesMessage(IntegrityError, OVERLAP_CONSTRAINT):
+            with transaction.atomic():
+                rejected.status = "pending"
+                rejected.start_date = date(2025, 3, 4)
+                rejected.save()
+
+        # Inactive applications and other employees may overlap.
+        make_application(employee, date(2025, 3, 4), days=2, status="rejected")
+        make_application(make_employee("other@example.com"), date(2025, 3, 4))
+
+
+class OverlapMigrationTests(TestCase):
+    """Migration 0009 resolves overlaps left by earlier versions."""
+
+    def setUp(self):
+        migration = import_module("core.migrations.0009_application_no_overlap")
+        self.resolve_overlaps = migration.resolve_overlaps
+        # Rows as an earlier version could leave them; rolled back with the test
+        with connection.cursor() as cursor:
+            for sql in migration.DROP_SQLITE_TRIGGERS:
+                cursor.execute(sql)
+        self.employee = make_employee("legacy@example.com", leave_balance=20)
+
+    def test_later_pending_duplicates_are_rejected(self):
+        approved = make_application(
+            self.employee, date(2025, 3, 3), days=3, status="approved"
+        )
+        inside = make_application(self.employee, date(2025, 3, 4))
+        first = make_application(self.employee, date(2025, 3, 10))
+        second = make_application(self.employee, date(2025, 3, 11))
+        apart = make_application(self.employee, date(2025, 3, 17))
+        rebuild_rollups()
+
+        self.resolve_overlaps(django_apps, None)
+
+        statuses = dict(
+            Application.objects.filter(employee=self.employee).values_list(
+                "pk", "status"
+            )
+        )
+        self.assertEqual(
+            statuses,
+            {
+                approved.pk: "approved",
+                inside.pk: "rejected",
+                first.pk: "pending",
+                second.pk: "rejected",
+                apart.pk: "pending",
+            },
+        )
+        second.refresh_from_db()
+        self.assertEqual(
+            second.rejection_reason,
+            f"Overlapped application #{first.pk} (resolved by migration 0009).",
+        )
+        ledger = LeaveLedger.objects.get(employee=self.employee)
+        self.assertEqual(ledger.pending_days, 4)
+        self.assertEqual(rollup_report(), live_report())
+
+    def test_overlapping_approved_leave_stops_the_migration(self):
+        first = make_application(self.employee, date(2025, 3, 3), status="approved")
+        second = make_application(self.employee, date(2025, 3, 4), status="approved")
+
+        with self.assertRaisesMessage(
+            RuntimeError, f"#{first.pk} (2025-03-03 - 2025-03-04) and #{second.pk}"
+        ):
+            self.resolve_overlaps(django_apps, None)
+
+
+# ---------------------- APPLICATION LIST ----------------------
+
+
+class ApplicationListTests(TestCase):
+    def setUp(self):
+        self.engineer = make_employee("engineer@example.com", leave_balance=30)
+        self.seller = make_employee("seller@example.com", leave_balance=30)
+        self.seller.department = "sales"
+        self.seller.save()
+        self.applications = [
+            make_application(
+                self.engineer, date(2025, 1, 6) + timedelta(weeks=n), leave_type="sick"
+            )
+            for n in range(6)
+        ]
+        self.applications += [
+            make_application(
+                self.seller, date(2025, 2, 3), leave_type="annual", status="approved"
+            ),
+            make_application(self.seller, date(2025, 4, 7), leave_type="annual"),
+        ]
+        self.client = token_client(make_hr())
+
+    def ids(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row["id"] for row in response.data["data"]], response.data
+
+    def test_filters(self):
+        newest_first = [app.pk for app in reversed(self.applications)]
+        url = "/api/leave/applications/"
+        for params, expected in [
+            ({"status": "approved"}, [self.applications[6].pk]),
+            ({"leave_type": "annual", "status": "pending"}, [self.applications[7].pk]),
+            ({"department": "sales"}, newest_first[:2]),
+            # Overlapping the range, not only inside it
+            (
+                {"date_from": "2025-01-14", "date_to": "2025-01-20"},
+                [self.applications[2].pk, self.applications[1].pk],
+            ),
+            ({"date_from": "2025-02-04", "date_to": "2025-02-10"}, newest_first[1:4]),
+        ]:
+            with self.subTest(params):
+                self.assertEqual(self.ids(url, params)[0], expected)
+
+        response = self.client.get(
+            url, {"date_from": "2025-02-01", "date_to": "2025-01-01"}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = token_client(self.engineer.user).get(url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_cursor_links_walk_every_page_once(self):
+        ids, data = self.ids(
+            "/api/leave/applications/", {"page_size": 3, "department": "engineering"}
+        )
+        self.assertIsNone(data["previous"])
+        pages = [ids]
+        while data["next"]:
+            self.assertIn("department=engineering", data["next"])
+            ids, data = self.ids(data["next"])
+            pages.append(ids)
+
+        self.assertEqual(
+            pages,
+            [
+                [app.pk for app in reversed(self.applications[3:6])],
+                [app.pk for app in reversed(self.applications[:3])],
+            ],
+        )
+        self.assertEqual(self.ids(data["previous"])[0], pages[0])
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        url = "/api/leave/applications/"
+        self.client.get(url)  # caches the token
+
+        counts = []
+        for page_size in (1, 8):
+            with CaptureQueriesContext(connection) as queries:
+                ids, _ = self.ids(url, {"page_size": page_size})
+            self.assertEqual(len(ids), page_size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        # The page's validator columns, then its rows with the employees
+        self.assertEqual(counts[0], 2)
+
+
+# ---------------------- CONDITIONAL GET ----------------------
+
+
+@override_settings(BACKGROUND_TASKS={"EAGER": False})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.employee = make_employee("polled@example.com")
+        self.older = make_application(self.employee, date(2025, 3, 3))
+        self.newer = make_application(self.employee, date(2025, 3, 10))
+        self.client = token_client(make_hr())
+
+    def test_list_revalidates_with_the_etag_only(self):
+        url = "/api/leave/applications/?status=pending"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # The newest pending application leaves the filtered page: the
+        # page's newest timestamp goes back, but the poll must see it.
+        self.client.patch(f"/api/leave/reject/{self.newer.pk}/", {}, format="json")
+        response = self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=etag,
+            HTTP_IF_MODIFIED_SINCE="Fri, 31 Dec 9999 23:59:59 GMT",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.data["data"]], [self.older.pk])
+
+    def test_balance_revalidates_with_last_modified(self):
+        url = f"/api/leave/balance/{self.employee.pk}/?year=2025"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        since = response["Last-Modified"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 304
+        )
+
+
+# ---------------------- ASYNC LEAVE API ----------------------
+
+
+class AsyncLeaveApiTests(TestCase):
+    """With LEAVE_API_ASYNC the leave endpoints answer like the DRF views."""
+
+    def setUp(self):
+        self.employee = make_employee("async@example.com", leave_balance=10)
+        make_application(self.employee, date(2025, 3, 3), days=3)
+        self.pending = make_application(self.employee, date(2025, 3, 10))
+        self.hr = make_hr()
+        self.hr_auth = f"Token {Token.objects.create(user=self.hr).key}"
+        self.employee_auth = (
+            f"Token {Token.objects.create(user=self.employee.user).key}"
+        )
+
+    def request(self, method, path, auth=None, data=None, asynchronous=True, etag=None):
+        headers = {"Authorization": auth} if auth else {}
+        if etag:
+            headers["If-None-Match"] = etag
+        body = {"data": json.dumps(data), "content_type": "application/json"}
+        with leave_api_async(asynchronous):
+            if asynchronous:
+                call = async_to_sync(getattr(self.async_client, method))
+            else:
+                call = getattr(self.client, method)
+            if data is None:
+                return call(path, headers=headers)
+            return call(path, headers=headers, **body)
+
+    def assertSameResponse(self, method, path, auth=None, data=None):
+        sync = self.request(method, path, auth, data, asynchronous=False)
+        response = self.request(method, path, auth, data)
+        self.assertEqual(response.status_code, sync.status_code, response.content)
+        self.assertEqual(response.json(), sync.json())
+        for header in ("ETag", "Last-Modified", "WWW-Authenticate"):
+            self.assertEqual(response.get(header), sync.get(header), header)
+        return response
+
+    def test_setting_routes_to_the_async_views(self):
+        for path, name in [
+            ("/api/leave/apply/", "apply_for_leave"),
+            ("/api/leave/applications/", "view_all_applications"),
+            ("/api/leave/approve/1/", "approve_leave"),
+            ("/api/leave/balance/1/", "get_leave_balance"),
+        ]:
+            with leave_api_async(True):
+                self.assertIs(resolve(path).func, getattr(async_views, name))
+            with leave_api_async(False):
+                self.assertIsNot(resolve(path).func, getattr(async_views, name))
+
+    def test_reads_match_the_sync_views(self):
+        for path in [
+            "/api/leave/applications/?page_size=1",
+            "/api/leave/applications/?status=pending&department=engineering",
+            f"/api/leave/balance/{self.employee.pk}/?year=2025",
+        ]:
+            with self.subTest(path):
+                response = self.assertSameResponse("get", path, self.hr_auth)
+                self.assertEqual(response.status_code, 200)
+                revalidated = self.request(
+                    "get", path, self.hr_auth, etag=response["ETag"]
+                )
+                self.assertEqual(revalidated.status_code, 304)
+
+    def test_errors_match_the_sync_views(self):
+        for method, path, auth in [
+            ("get", "/api/leave/applications/", None),
+            ("get", "/api/leave/applications/", "Token wrong"),
+            ("get", "/api/leave/applications/", self.employee_auth),
+            ("get", "/api/leave/applications/?date_from=x", self.hr_auth),
+            ("get", "/api/leave/balance/999999/", self.hr_auth),
+            ("patch", "/api/leave/approve/999999/", self.hr_auth),
+            ("patch", f"/api/leave/approve/{self.pending.pk}/", self.employee_auth),
+            ("post", "/api/leave/apply/", self.hr_auth),
+        ]:
+            with self.subTest(method=method, path=path, auth=auth):
+                data = {} if method != "get" else None
+                response = self.assertSameResponse(method, path, auth, data)
+                self.assertIn(response.status_code, (400, 401, 403, 404))
+
+    def test_apply_and_approve(self):
+        data = {
+            "leave_type": "sick",
+            "start_date": "2025-03-17",
+            "end_date": "2025-03-18",
+        }
+        response = self.request("post", "/api/leave/apply/", self.employee_auth, data)
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual(body["message"], "Leave applied successfully")
+        self.assertEqual(body["data"]["days"], 2)
+        self.assertEqual(body["data"]["status"], "pending")
+
+        # Overlapping the one just created
+        data["end_date"] = "2025-03-19"
+        self.assertSameResponse("post", "/api/leave/apply/", self.employee_auth, data)
+
+        path = f"/api/leave/approve/{body['data']['id']}/"
+        response = self.request("patch", path, self.hr_auth, {})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["message"], "Leave approved")
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.leave_balance, 8)
+
+        response = self.request("patch", path, self.hr_auth, {})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "Leave already processed")
+
+
+# ---------------------- EVENT STREAM ----------------------
+
+
+@override_settings(BACKGROUND_TASKS={"EAGER": False})
+class LeaveEventTests(TestCase):
+    def setUp(self):
+        # A fresh broker: no history or subscribers from other tests.
+        reset_broker()
+        self.addCleanup(reset_broker)
+        self.employee = make_employee("streamed@example.com")
+        self.token = Token.objects.create(user=make_hr())
+
+    def test_stream_needs_asgi(self):
+        response = self.client.get(
+            "/api/leave/events/", headers={"Authorization": f"Token {self.token.key}"}
+        )
+        self.assertEqual(response.status_code, 501)
+
+    async def test_status_changes_are_streamed(self):
+        response = await self.async_client.get(
+            "/api/leave/events/", headers={"Authorization": f"Token {self.token.key}"}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertIn(b": connected", await anext(stream))
+
+        event = get_broker().publish(
+            {"type": "application.approved", "employee_id": self.employee.pk}
+        )
+        chunk = await anext(stream)
+        self.assertTrue(chunk.startswith(f"id: {event['id']}\n".encode()), chunk)
+        await stream.aclose()
+
+
+# ---------------------- EXPORT ----------------------
+
+
+class ExportTests(TestCase):
+    path = "/api/leave/export/"
+
+    def setUp(self):
+        self.hr = token_client(make_hr())
+        self.alice = make_employee("alice@example.com")
+        self.bob = make_employee("bob@example.com")
+        EmployeeProfile.objects.filter(id=self.bob.id).update(department="sales")
+        self.first = make_application(
+            self.alice, date(2030, 12, 30), days=3, reason_description="New year"
+        )
+        self.second = make_application(
+            self.bob,
+            date(2031, 3, 3),
+            status="rejected",
+            leave_type="sick",
+            rejection_reason='Team "offsite", sorry',
+        )
+        self.third = make_application(self.alice, date(2031, 6, 2), status="approved")
+
+    def export(self, client=None, **params):
+        response = (client or self.hr).get(self.path, params)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return response, b"".join(response.streaming_content).decode()
+
+    def exported_ids(self, **params):
+        return [
+            row["id"]
+            for row in map(
+                json.loads, self.export(output="ndjson", **params)[1].splitlines()
+            )
+        ]
+
+    def test_csv_header_and_rows(self):
+        response, content = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="leave-applications.csv"',
+        )
+        header, *rows = csv.reader(io.StringIO(content))
+        self.assertEqual(header, [name for name, _ in exports.COLUMNS])
+        self.assertEqual(
+            [row[0] for row in rows],
+            [str(a.id) for a in [self.first, self.second, self.third]],
+        )
+
+        second = self.second
+        second.refresh_from_db()
+        self.assertEqual(
+            rows[1],
+            [
+                str(second.id),
+                str(self.bob.id),
+                "bob@example.com",
+                "sales",
+                "sick",
+                "rejected",
+                "2031-03-03",
+                "2031-03-04",
+                str(second.days),
+                "",
+                'Team "offsite", sorry',
+                second.created_at.isoformat(),
+                second.updated_at.isoformat(),
+            ],
+        )
+
+    def test_ndjson_lines(self):
+        response, content = self.export(output="ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(lines), 3)
+        first = lines[0]
+        self.assertEqual(list(first), [name for name, _ in exports.COLUMNS])
+        self.first.refresh_from_db()
+        self.assertEqual(first["employee_email"], "alice@example.com")
+        self.assertEqual(first["start_date"], "2030-12-30")
+        self.assertEqual(first["end_date"], "2031-01-01")
+        self.assertEqual(first["days"], self.first.days)
+        self.assertEqual(first["reason_description"], "New year")
+        self.assertIsNone(first["rejection_reason"])
+
+    def test_filters(self):
+        first, second, third = self.first.id, self.second.id, self.third.id
+        for params, expected in [
+            ({"status": "pending"}, [first]),
+            ({"leave_type": "sick"}, [second]),
+            ({"department": "engineering"}, [first, third]),
+            ({"date_from": "2031-01-01", "date_to": "2031-03-03"}, [first, second]),
+            ({"date_from": "2031-03-05"}, [third]),
+            ({"year": 2030}, [first]),
+            ({"year": 2031, "department": "sales"}, [second]),
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.exported_ids(**params), expected)
+
+    def test_invalid_filters_are_rejected(self):
+        for params in [
+            {"output": "xml"},
+            {"status": "archived"},
+            {"date_from": "2031-03-05", "date_to": "2031-03-01"},
+        ]:
+            with self.subTest(params=params):
+                response = self.hr.get(self.path, params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_only_hr_can_export(self):
+        response = token_client(self.alice.user).get(self.path)
+        self.assertEqual(response.status_code, 403)
+
+    def test_blocks_group_lines(self):
+        lines = ["a" * 40 + "\n"] * 5
+        self.assertEqual(
+            [len(block) for block in exports.blocks(lines, size=100)], [123, 82]
+        )
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/export.ndjson"
+            call_command(
+                "export_applications",
+                path,
+                "--format=ndjson",
+                "--department=engineering",
+                "--status=approved",
+                stderr=io.StringIO(),
+            )
+            with open(path) as fh:
+                lines = [json.loads(line) for line in fh]
+        self.assertEqual([line["id"] for line in lines], [self.third.id])
+
+        with self.assertRaises(CommandError):
+            call_command("export_applications", "--date-from=tomorrow")
+
+
+# ---------------------- TEAM CALENDAR ----------------------
+
+
+class LeaveCalendarTests(TestCase):
+    path = "/api/leave/calendar/"
+
+    def setUp(self):
+        self.hr = token_client(make_hr())
+        self.alice = make_employee("alice@example.com")
+        self.bob = make_employee("bob@example.com")
+        EmployeeProfile.objects.filter(id=self.bob.id).update(department="sales")
+        # Alice: 3-5 March pending, 5-6 March approved; Bob: 4 March approved
+        make_application(self.alice, date(2031, 3, 3), days=2)
+        make_application(self.alice, date(2031, 3, 5), days=2, status="approved")
+        make_application(self.bob, date(2031, 3, 4), days=1, status="approved")
+        # Neither rejected leave nor leave outside the range is shown
+        make_application(self.bob, date(2031, 3, 5), days=1, status="rejected")
+        make_application(self.bob, date(2031, 3, 10), days=1)
+
+    def get(self, client=None, **params):
+        return (client or self.hr).get(
+            self.path, {"date_from": "2031-03-02", "date_to": "2031-03-07", **params}
+        )
+
+    def on_leave(self, response):
+        return {day["date"]: day["employee_ids"] for day in response.json()["data"]}
+
+    def test_per_day_counts(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(
+            self.on_leave(response),
+            {
+                "2031-03-02": [],
+                "2031-03-03": [self.alice.id],
+                "2031-03-04": [self.alice.id, self.bob.id],
+                "2031-03-05": [self.alice.id],
+                "2031-03-06": [self.alice.id],
+                "2031-03-07": [],
+            },
+        )
+        self.assertEqual([day["on_leave"] for day in body["data"]], [0, 1, 2, 1, 1, 0])
+        self.assertEqual(len(body["applications"]), 3)
+        self.assertEqual(
+            body["employees"],
+            {
+                str(self.alice.id): {
+                    "username": "alice@example.com",
+                    "department": "engineering",
+                },
+                str(self.bob.id): {
+                    "username": "bob@example.com",
+                    "department": "sales",
+                },
+            },
+        )
+
+    def test_department_and_status_filters(self):
+        self.assertEqual(
+            self.on_leave(self.get(department="sales")),
+            {
+                "2031-03-02": [],
+                "2031-03-03": [],
+                "2031-03-04": [self.bob.id],
+                "2031-03-05": [],
+                "2031-03-06": [],
+                "2031-03-07": [],
+            },
+        )
+        body = self.get(status="pending").json()
+        self.assertEqual([day["on_leave"] for day in body["data"]], [0, 1, 1, 0, 0, 0])
+        self.assertEqual(list(body["employees"]), [str(self.alice.id)])
+
+    def test_range_is_limited_to_max_days(self):
+        start = date(2031, 1, 1)
+        last = start + timedelta(days=availability.MAX_DAYS - 1)
+        response = self.get(date_from=start, date_to=last)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["data"]), 92)
+
+        response = self.get(date_from=start, date_to=last + timedelta(days=1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("date_to", response.json()["message"])
+
+    def test_invalid_ranges_are_rejected(self):
+        for params in [
+            {"date_from": "2031-03-07", "date_to": "2031-03-02"},
+            {"date_from": "next monday"},
+            {"status": "rejected"},
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+    def test_only_hr_can_view_the_calendar(self):
+        response = self.get(token_client(self.alice.user))
+        self.assertEqual(response.status_code, 403)
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite query plan")
+    def test_org_wide_ranges_are_read_from_the_dates_index(self):
+        # Years of history, and statistics that show it
+        seed(50, 2000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        plan = availability.overlapping(date(2031, 3, 2), date(2031, 3, 7)).explain()
+        self.assertIn("app_dates_idx", plan)
+
+
+# ---------------------- WORKING DAYS ----------------------
+
+
+class WorkdayTests(TestCase):
+    def setUp(self):
+        # The calendar is cached per process and rolled-back holidays send
+        # no signal, so never leave a calendar behind for other tests.
+        reset_calendar()
+        self.addCleanup(reset_calendar)
+
+    def test_weekends_and_holidays_are_not_counted(self):
+        # Monday 6 to Sunday 19 January 2025: two working weeks
+        self.assertEqual(count_workdays(date(2025, 1, 6), date(2025, 1, 19)), 10)
+        self.assertEqual(count_workdays(date(2025, 1, 11), date(2025, 1, 12)), 0)
+
+        Holiday.objects.create(date=date(2025, 1, 8), name="Midweek")
+        Holiday.objects.create(date=date(2025, 1, 11), name="Saturday")
+        self.assertEqual(count_workdays(date(2025, 1, 6), date(2025, 1, 19)), 9)
+        self.assertEqual(count_workdays(date(2025, 1, 8), date(2025, 1, 8)), 0)
+
+    def test_ranges_across_year_boundaries(self):
+        # Monday 30 December 2024 to Friday 3 January 2025
+        self.assertEqual(count_workdays(date(2024, 12, 30), date(2025, 1, 3)), 5)
+        Holiday.objects.create(date=date(2025, 1, 1), name="New Year")
+        self.assertEqual(count_workdays(date(2024, 12, 30), date(2025, 1, 3)), 4)
+        # 2024 is a leap year starting on a Monday: 52 weeks and Mon-Tue
+        self.assertEqual(count_workdays(date(2024, 1, 1), date(2024, 12, 31)), 262)
+        self.assertEqual(count_workdays(date(2024, 2, 28), date(2024, 3, 1)), 3)
+        # The last representable year has no following 1 January
+        self.assertEqual(count_workdays(date(9999, 12, 27), date(9999, 12, 31)), 5)
+
+    @override_settings(LEAVE_CALENDAR={"WORK_WEEK": [0, 1, 2, 3, 4, 5]})
+    def test_work_week_comes_from_settings(self):
+        reset_calendar()
+        self.assertEqual(count_workdays(date(2025, 1, 6), date(2025, 1, 19)), 12)
+
+
+class ApplicationDaysTests(TestCase):
+    def setUp(self):
+        reset_calendar()
+        self.addCleanup(reset_calendar)
+        self.employee = make_employee("days@example.com")
+
+    def stored_days(self, application):
+        return Application.objects.values_list("days", flat=True).get(pk=application.pk)
+
+    def test_days_are_counted_and_stored_on_save(self):
+        # Friday 10 to Tuesday 14 January 2025: three working days
+        application = make_application(self.employee, date(2025, 1, 10), days=5)
+        self.assertEqual(application.days, 3)
+        self.assertEqual(self.stored_days(application), 3)
+
+        application.end_date = date(2025, 1, 17)
+        application.save()
+        self.assertEqual(self.stored_days(application), 6)
+
+        # update_fields naming only the dates still stores the new count
+        Holiday.objects.create(date=date(2025, 1, 13), name="Holiday")
+        reset_calendar()
+        application.end_date = date(2025, 1, 14)
+        application.save(update_fields=["end_date"])
+        self.assertEqual(self.stored_days(application), 2)
+
+    def test_total_days_sums_the_stored_days(self):
+        self.assertEqual(Application.objects.total_days(), 0)
+        make_application(self.employee, date(2025, 1, 6), days=5)
+        make_application(self.employee, date(2025, 2, 3), days=2)
+        make_application(self.employee, date(2025, 3, 3), days=3, status="rejected")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Application.objects.pending().total_days(), 7)
+        self.assertEqual(Application.objects.total_days(), 10)
+
+
+# ---------------------- ACCRUAL ----------------------
+
+
+class AccrualTests(TestCase):
+    def setUp(self):
+        AccrualPolicy.objects.create(
+            leave_type="sick", min_tenure_months=0, days_per_year=3
+        )
+        AccrualPolicy.objects.create(
+            leave_type="sick", min_tenure_months=12, days_per_year=8
+        )
+        self.senior = make_employee("senior@example.com", leave_balance=0)
+        self.junior = make_employee("junior@example.com", leave_balance=0)
+        self.junior.joining_date = date(2025, 1, 1)
+        self.junior.save()
+
+    def balances(self):
+        return dict(
+            EmployeeProfile.objects.filter(
+                pk__in=[self.senior.pk, self.junior.pk]
+            ).values_list("user__username", "leave_balance")
+        )
+
+    def test_year_of_accrual_follows_each_employees_band(self):
+        for month in range(1, 13):
+            run_accrual(date(2025, month, 1))
+
+        # In months where the 12-month band credits 0 days, seniors must
+        # get nothing rather than the junior band's day.
+        self.assertEqual(
+            self.balances(), {"senior@example.com": 8, "junior@example.com": 3}
+        )
+
+    def test_rerunning_a_month_credits_nothing(self):
+        # April: the 12-month band credits 0 days, the 0-month band 1
+        first = run_accrual(date(2025, 4, 1))
+        again = run_accrual(date(2025, 4, 1))
+
+        self.assertEqual(first.status, AccrualRun.StatusChoices.COMPLETED)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(again.employees_credited, 1)
+        self.assertEqual(
+            self.balances(), {"senior@example.com": 0, "junior@example.com": 1}
+        )
+
+    def test_policies_must_share_one_leave_type(self):
+        annual = AccrualPolicy(leave_type="annual", days_per_year=20)
+        with self.assertRaises(ValidationError) as raised:
+            annual.full_clean()
+        self.assertIn("leave_type", raised.exception.message_dict)
+        AccrualPolicy(
+            leave_type="sick", min_tenure_months=24, days_per_year=10
+        ).full_clean()
+
+        # Both would credit the one leave_balance: refuse to run
+        annual.save()
+        with self.assertRaisesMessage(AccrualPolicyError, "annual, sick"):
+            run_accrual(date(2025, 12, 1))
+        with self.assertRaises(CommandError):
+            call_command("accrue_leave", "--period=2025-12", stdout=io.StringIO())
+        self.assertFalse(AccrualRun.objects.exists())
+        self.assertEqual(
+            self.balances(), {"senior@example.com": 0, "junior@example.com": 0}
+        )
+
+    def test_interrupted_run_resumes_after_the_last_committed_chunk(self):
+        third = make_employee("third@example.com", leave_balance=0)
+
+        def stop(run):
+            raise KeyboardInterrupt
+
+        # The first chunk commits, then the run stops.
+        with self.assertRaises(KeyboardInterrupt):
+            run_accrual(date(2025, 12, 1), chunk_size=1, progress=stop)
+        run = AccrualRun.objects.get(period=date(2025, 12, 1))
+        self.assertEqual(run.status, AccrualRun.StatusChoices.RUNNING)
+        self.assertEqual(run.last_employee_id, self.senior.pk)
+
+        run = run_accrual(date(2025, 12, 1), chunk_size=1)
+        self.assertEqual(run.status, AccrualRun.StatusChoices.COMPLETED)
+        self.assertEqual(run.employees_credited, 3)
+        third.refresh_from_db()
+        self.assertEqual(third.leave_balance, 1)
+        self.assertEqual(
+            self.balances(), {"senior@example.com": 1, "junior@example.com": 1}
+        )
+
+
+# ---------------------- DATABASE PROFILES ----------------------
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    base_dir = Path("/srv/leave")
+
+    def database(self, **env):
+        # Only the variables given here: none from the environment running the tests
+        environ = {k: v for k, v in os.environ.items() if not k.startswith("DB_")}
+        with mock.patch.dict(os.environ, {**environ, **env}, clear=True):
+            return default_database(self.base_dir)
+
+    def test_sqlite_is_the_default(self):
+        self.assertEqual(
+            self.database(),
+            {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": "/srv/leave/db.sqlite3",
+            },
+        )
+        self.assertEqual(self.database(DB_PROFILE="sqlite"), self.database())
+        self.assertEqual(
+            self.database(DB_NAME="/tmp/leave.sqlite3")["NAME"], "/tmp/leave.sqlite3"
+        )
+
+    def test_sqlite_wal(self):
+        database = self.database(DB_PROFILE="sqlite-wal", DB_TIMEOUT="5")
+        self.assertEqual(database["NAME"], "/srv/leave/db.sqlite3")
+        self.assertEqual(
+            database["OPTIONS"],
+            {
+                "timeout": 5,
+                "transaction_mode": "IMMEDIATE",
+                "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+            },
+        )
+
+    def test_postgres(self):
+        database = self.database(
+            DB_PROFILE="postgres", DB_HOST="db.internal", DB_CONN_MAX_AGE="120"
+        )
+        self.assertEqual(
+            database,
+            {
+                "ENGINE": "django.db.backends.postgresql",
+                "NAME": "mini_leave",
+                "USER": "postgres",
+                "PASSWORD": "",
+                "HOST": "db.internal",
+                "PORT": "5432",
+                "CONN_MAX_AGE": 120,
+                "CONN_HEALTH_CHECKS": True,
+                "OPTIONS": {"connect_timeout": 5},
+            },
+        )
+
+    def test_postgres_pool_replaces_persistent_connections(self):
+        database = self.database(
+            DB_PROFILE="postgres", DB_POOL="True", DB_POOL_MAX_SIZE="20"
+        )
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+        self.assertEqual(
+            database["OPTIONS"],
+            {
+                "connect_timeout": 5,
+                "pool": {"min_size": 2, "max_size": 20, "timeout": 10},
+            },
+        )
+
+    def test_replicas_copy_the_primary_settings(self):
+        with mock.patch.dict(os.environ, {"DB_REPLICAS": "db2, db3:6432"}):
+            replicas = replica_databases(self.database(DB_PROFILE="postgres"))
+        self.assertEqual(list(replicas), ["replica1", "replica2"])
+        self.assertEqual(
+            [(r["HOST"], r["PORT"]) for r in replicas.values()],
+            [("db2", "5432"), ("db3", "6432")],
+        )
+        self.assertEqual(replicas["replica1"]["TEST"], {"MIRROR": "default"})
+        self.assertEqual(replicas["replica1"]["NAME"], "mini_leave")
+
+    def test_unknown_profiles_are_rejected(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "'mysql'"):
+            self.database(DB_PROFILE="mysql")
+
+
+# ---------------------- READ REPLICAS ----------------------
+
+
+@override_settings(
+    READ_REPLICAS={"ALIASES": ["replica1"], "STICKY_SECONDS": 5},
+    BACKGROUND_TASKS={"EAGER": False},
+)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.employee = make_employee("replica@example.com")
+        self.client = APIClient()
+        token = Token.objects.create(user=self.employee.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        def view(request):
+            return Application.objects.all().db
+
+        self.view = use_replica(view)
+        self.request = RequestFactory().get("/")
+        self.request.user = self.employee.user
+
+    def test_only_reads_in_replica_views_go_to_a_replica(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Application))
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(Application), "replica1")
+            # Cached per process, so never read from a lagging copy
+            self.assertIsNone(router.db_for_read(Holiday))
+            self.assertEqual(router.db_for_write(Application), "default")
+        self.assertEqual(self.view(self.request), "replica1")
+        self.assertFalse(router.allow_migrate("replica1", "core"))
+
+    def test_writer_is_pinned_to_the_primary(self):
+        response = self.client.post(
+            "/api/leave/apply/",
+            {
+                "leave_type": "sick",
+                "start_date": "2025-01-06",
+                "end_date": "2025-01-30",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)  # over the balance
+        self.assertTrue(replica_allowed(self.employee.user))
+
+        response = self.client.post(
+            "/api/leave/apply/",
+            {
+                "leave_type": "sick",
+                "start_date": "2025-01-06",
+                "end_date": "2025-01-07",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertFalse(replica_allowed(self.employee.user))
+        self.assertEqual(self.view(self.request), "default")
+
+        other = make_employee("reader@example.com")
+        self.assertTrue(replica_allowed(other.user))
+
+
+# ---------------------- METRICS ----------------------
+
+
+class MetricsFlushTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(
+            override_settings(METRICS={"DIR": directory.name, "FLUSH_INTERVAL": 0.2})
+        )
+        self.registry = Registry()
+        self.requests = self.registry.counter("requests_total", "Requests.")
+
+    def published(self):
+        other = Registry()
+        other.counter("requests_total", "Requests.")
+        return other.collect()["requests_total"].get((), 0)
+
+    def test_trailing_changes_are_flushed_when_the_worker_goes_idle(self):
+        self.requests.inc()
+        self.requests.inc()
+        self.requests.inc()
+        self.assertEqual(self.published(), 1)  # the first one flushed at once
+
+        deadline = time.monotonic() + 5
+        while self.published() != 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.published(), 3)
+
+    def test_one_timer_at_a_time(self):
+        self.requests.inc()
+        for _ in range(50):
+            self.requests.inc()
+        timers = [t for t in threading.enumerate() if isinstance(t, threading.Timer)]
+        self.assertEqual(len(timers), 1)
+        timers[0].join()
+        self.assertEqual(self.published(), 51)
+
+
+# ---------------------- REQUEST METRICS ----------------------
+
+
+SERVER_TIMING = re.compile(
+    r'db;dur=[\d.]+;desc="(\d+) queries", serialize;dur=[\d.]+, total;dur=[\d.]+'
+)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        endpoint_stats.reset()
+        self.addCleanup(endpoint_stats.reset)
+        self.employee = make_employee("metrics@example.com")
+        make_application(self.employee, date(2031, 3, 3))
+        self.path = f"/api/leave/balance/{self.employee.id}/"
+        self.client = token_client(self.employee.user)
+
+    def test_server_timing_counts_the_request_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+
+        timing = SERVER_TIMING.fullmatch(response["Server-Timing"])
+        self.assertIsNotNone(timing, response["Server-Timing"])
+        self.assertEqual(int(timing.group(1)), len(queries))
+        self.assertNotIn("X-Query-Budget-Exceeded", response)
+
+    def test_requests_over_the_query_budget_are_flagged(self):
+        with override_settings(REQUEST_METRICS={"QUERY_BUDGET": 0}):
+            # A new client loads the middleware, and its options, again
+            client = token_client(make_hr())
+            with self.assertLogs("core.middleware", "WARNING") as logs:
+                response = client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+
+        queries = SERVER_TIMING.fullmatch(response["Server-Timing"]).group(1)
+        self.assertEqual(response["X-Query-Budget-Exceeded"], f"{queries}/0")
+        self.assertIn(f"ran {queries} queries, over the budget of 0", logs.output[0])
+        self.assertEqual(endpoint_stats.snapshot()["leave_balance"]["over_budget"], 1)
+
+    def test_endpoint_stats_aggregate_per_route(self):
+        responses = [self.client.get(self.path) for _ in range(3)]
+        self.client.get("/api/leave/applications/")
+        queries = [
+            int(SERVER_TIMING.fullmatch(r["Server-Timing"]).group(1)) for r in responses
+        ]
+
+        stats = endpoint_stats.snapshot()
+        self.assertEqual(list(stats), ["leave_balance", "view_all_applications"])
+        balance = stats["leave_balance"]
+        self.assertEqual(balance["requests"], 3)
+        self.assertEqual(balance["queries_max"], max(queries))
+        self.assertEqual(balance["queries_mean"], round(sum(queries) / 3, 2))
+        self.assertEqual(
+            balance["response_bytes_mean"],
+            round(sum(len(r.content) for r in responses) / 3),
+        )
+        self.assertEqual(balance["over_budget"], 0)
+        self.assertGreaterEqual(balance["duration_ms_max"], balance["duration_ms_mean"])
+        self.assertEqual(stats["view_all_applications"]["requests"], 1)
+
+    def test_only_hr_can_view_or_reset_the_totals(self):
+        self.client.get(self.path)
+        for method in ("get", "delete"):
+            response = getattr(self.client, method)("/api/metrics/requests/")
+            self.assertEqual(response.status_code, 403)
+
+        hr = token_client(make_hr())
+        response = hr.get("/api/metrics/requests/")
+        self.assertEqual(response.status_code, 200)
+        endpoints = response.json()["data"]["endpoints"]
+        self.assertEqual(endpoints["leave_balance"]["requests"], 1)
+        self.assertEqual(endpoints["request_metrics"]["requests"], 2)
+
+        self.assertEqual(hr.delete("/api/metrics/requests/").status_code, 200)
+        # Only the reset request itself is left
+        self.assertEqual(list(endpoint_stats.snapshot()), ["request_metrics"])
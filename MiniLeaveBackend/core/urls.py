@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Endpoints with an async implementation, switched by LEAVE_API_ASYNC
+leave_views = async_views if settings.LEAVE_API_ASYNC else views
 
 urlpatterns = [
     # Auth
@@ -12,11 +16,24 @@ urlpatterns = [
     # Employee Management
     path("employee/add/", views.add_employee, name="add_employee"),
     path("employee/delete/", views.delete_employee, name="delete_employee"),
+    path("employee/import/", views.import_employees, name="import_employees"),
 
     # Leave Applications
-    path("leave/apply/", views.apply_for_leave, name="apply_leave"),
-    path("leave/applications/", views.view_all_applications, name="view_all_applications"),
-    path("leave/approve/<int:application_id>/", views.approve_leave, name="approve_leave"),
+    path("leave/apply/", leave_views.apply_for_leave, name="apply_leave"),
+    path("leave/applications/", leave_views.view_all_applications, name="view_all_applications"),
+    path("leave/approve/<int:application_id>/", leave_views.approve_leave, name="approve_leave"),
     path("leave/reject/<int:application_id>/", views.reject_leave, name="reject_leave"),
-    path("leave/balance/<int:employee_id>/", views.get_leave_balance, name="leave_balance"),
+    path("leave/decisions/", views.bulk_decide_leaves, name="bulk_decide_leaves"),
+    path("leave/balance/<int:employee_id>/", leave_views.get_leave_balance, name="leave_balance"),
+    path("leave/balances/", views.view_leave_balances, name="leave_balances"),
+    path("leave/export/", views.export_applications, name="export_applications"),
+    path("leave/analytics/", views.leave_analytics, name="leave_analytics"),
+    path("leave/calendar/", views.leave_calendar, name="leave_calendar"),
+    path("leave/holidays/", views.holidays, name="holidays"),
+    # Server-sent events; async only (serve with ASGI)
+    path("leave/events/", async_views.leave_events, name="leave_events"),
+
+    # Metrics
+    path("metrics/", views.prometheus_metrics, name="prometheus_metrics"),
+    path("metrics/requests/", views.request_metrics, name="request_metrics"),
 ]
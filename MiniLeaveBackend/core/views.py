@@ -1,16 +1,39 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import (
-    api_view, authentication_classes, permission_classes
+    api_view, authentication_classes, permission_classes, renderer_classes
 )
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 
-from .models import User, EmployeeProfile, Application
-from .serializers import UserSerializer, EmployeeSerializer, ApplicationSerializer,HrSerializer
+from . import analytics, availability, conditional, exports, reads
+from .authentication import CachedTokenAuthentication, get_token_cache
+from .fast_serializers import BALANCE_ROW, application_rows
+from .importers import EmployeeImporter, detect_format, iter_records, shared_pool
+from .instrumentation import endpoint_stats
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry as metrics_registry
+from .models import User, EmployeeProfile, Application, Holiday
+from .pagination import ApplicationCursorPagination, EmployeeCursorPagination
+from .renderers import FastJSONRenderer
+from .routers import bind, use_replica
+from .serializers import (
+    UserSerializer, EmployeeSerializer, ApplicationSerializer, HrSerializer,
+    ApplicationFilterSerializer, ApplyLeaveSerializer, BalanceFilterSerializer,
+    BulkDecisionSerializer, ExportFilterSerializer,
+    AnalyticsFilterSerializer, CalendarFilterSerializer, HolidayFilterSerializer,
+    HolidaySerializer,
+)
+from .services import (
+    LeaveApplicationError, LeaveDecisionError, approve_application, decide_applications,
+    reject_application, submit_application,
+)
 
 
 # ---------------------- AUTH ----------------------
@@ -66,7 +89,7 @@ def login_user(request):
 
 
 @api_view(["POST"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def logout(request):
     try:
@@ -81,7 +104,7 @@ def logout(request):
 # ---------------------- EMPLOYEE ----------------------
 
 @api_view(["POST"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def add_employee(request):
     if request.user.role != "hr":
@@ -113,7 +136,7 @@ def add_employee(request):
                     status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(["DELETE"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def delete_employee(request):
     if request.user.role != "hr":
@@ -135,50 +158,103 @@ def delete_employee(request):
                     status=status.HTTP_200_OK)
 
 
+@api_view(["POST"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def import_employees(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can import employees"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    upload = request.FILES.get("file")
+    if upload is None:
+        return Response({"status": "failed", "message": "Upload a CSV or JSON file as 'file'"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    file_format = request.data.get("file_format") or detect_format(upload.name)
+    try:
+        records = iter_records(upload.file, file_format)
+        report = EmployeeImporter(pool=shared_pool()).run(records)
+    except (ValueError, UnicodeDecodeError) as exc:
+        return Response({"status": "failed", "message": str(exc)},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(
+        {
+            "status": "success",
+            "message": f"{report['created']} employees imported, {report['failed']} rows failed",
+            "data": report,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
 # ---------------------- LEAVE ----------------------
 
 @api_view(["POST"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def apply_for_leave(request):
     if request.user.role != "employee":
         return Response({"status": "failed", "message": "Only employees can apply for leave"},
                         status=status.HTTP_403_FORBIDDEN)
 
-    data = request.data.copy()
+    serializer = ApplyLeaveSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"status": "failed", "message": serializer.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # The profile comes with the (cached) token user; submit_application
+    # reads the current balance itself, in its transaction.
     try:
-        employee = EmployeeProfile.objects.get(user=request.user)
+        application = submit_application(
+            request.user.employee_profile.pk, serializer.validated_data
+        )
     except EmployeeProfile.DoesNotExist:
         return Response({"status": "failed", "message": "Employee profile not found"},
                     status=status.HTTP_404_NOT_FOUND)
+    except LeaveApplicationError as exc:
+        return Response({"status": "failed", "message": {"non_field_errors": [exc.message]}},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    data["employee"] = employee.id
-    serializer = ApplicationSerializer(data=data)
-    if serializer.is_valid():
-        serializer.save()
-        return Response(
-            {"status": "success", "message": "Leave applied successfully", "data": serializer.data},
-            status=status.HTTP_201_CREATED,
-        )
-    return Response({"status": "failed", "message": serializer.errors},
-                    status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        {"status": "success", "message": "Leave applied successfully",
+         "data": ApplicationSerializer(application).data},
+        status=status.HTTP_201_CREATED,
+    )
 
 
 @api_view(["GET"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@use_replica
 def view_all_applications(request):
     if request.user.role != "hr":
         return Response({"status": "failed", "message": "Only HR can view applications"},
                         status=status.HTTP_403_FORBIDDEN)
 
-    applications = Application.objects.all()
-    serializer = ApplicationSerializer(applications, many=True)
-    return Response({"status": "success", "data": serializer.data}, status=status.HTTP_200_OK)
+    filters = ApplicationFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"status": "failed", "message": filters.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = ApplicationCursorPagination()
+    rows = paginator.paginate_queryset(reads.application_page_columns(filters), request)
+    etag, last_modified = conditional.application_page_validators(rows, paginator)
+    unchanged = conditional.not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
+    # One JOINed values() query for the page, rendered by the compiled
+    # row serializer (same output as ApplicationSerializer).
+    page = application_rows(Application.objects.all(), reads.application_page_ids(rows))
+    response = Response(reads.application_page_body(paginator, page),
+                        status=status.HTTP_200_OK)
+    return conditional.add_validators(response, etag, last_modified)
 
 
 @api_view(["PATCH"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def approve_leave(request, application_id):
     if request.user.role != "hr":
@@ -186,16 +262,15 @@ def approve_leave(request, application_id):
                         status=status.HTTP_403_FORBIDDEN)
 
     application = get_object_or_404(Application, id=application_id)
-    if application.status != "pending":
-        return Response({"status": "failed", "message": "Leave already processed"},
+    try:
+        approve_application(application)
+    except LeaveDecisionError as exc:
+        return Response({"status": "failed", "message": exc.message},
                         status=status.HTTP_400_BAD_REQUEST)
-
-    application.status = "approved"
-    application.save()
     return Response({"status": "success", "message": "Leave approved"}, status=status.HTTP_200_OK)
 
 @api_view(["PATCH"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def reject_leave(request, application_id):
     if request.user.role != "hr":
@@ -203,30 +278,256 @@ def reject_leave(request, application_id):
                         status=status.HTTP_403_FORBIDDEN)
 
     application = get_object_or_404(Application, id=application_id)
-    if application.status != "pending":
-        return Response({"status": "failed", "message": "Leave already processed"},
-                        status=status.HTTP_400_BAD_REQUEST)
     reason = request.data.get("rejection_reason", "No reason provided")
-    
-    application.rejection_reason = reason
-    application.status = "rejected"
-    application.save()
+    try:
+        reject_application(application, reason)
+    except LeaveDecisionError as exc:
+        return Response({"status": "failed", "message": exc.message},
+                        status=status.HTTP_400_BAD_REQUEST)
     return Response({"status": "success", "message": "Leave rejected"},
                     status=status.HTTP_200_OK)
 
 
+@api_view(["PATCH"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def bulk_decide_leaves(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can approve or reject leaves"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    serializer = BulkDecisionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"status": "failed", "message": serializer.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    results = decide_applications(serializer.validated_data["decisions"])
+    processed = sum(1 for result in results if result["status"] != "failed")
+    return Response(
+        {
+            "status": "success",
+            "message": f"{processed} of {len(results)} applications processed",
+            "data": results,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
 @api_view(["GET"])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@use_replica
 def get_leave_balance(request, employee_id):
     if request.user.role not in ["hr", "employee"]:
         return Response({"status": "failed", "message": "Unauthorized"},
                         status=status.HTTP_403_FORBIDDEN)
 
-    employee = get_object_or_404(EmployeeProfile, id=employee_id)
-    approved_leaves = Application.objects.filter(employee=employee, status="approved").count()
-    total_allowed = employee.leave_balance
-    approved_leaves = Application.objects.filter(employee=employee, status="approved").count()
-    balance = total_allowed - approved_leaves
-  # or pull from settings/model field
-    return Response({"status": "success", "leave_balance": balance}, status=status.HTTP_200_OK)
+    filters = BalanceFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"status": "failed", "message": filters.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+    year = filters.validated_data["year"]
+
+    employee = get_object_or_404(reads.balance_employees(), id=employee_id)
+    entries = list(reads.balance_entries(employee, year))
+    etag, last_modified = conditional.balance_validators(employee, year, entries)
+    unchanged = conditional.not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
+    response = Response(reads.balance_body(employee, year, entries),
+                        status=status.HTTP_200_OK)
+    return conditional.add_validators(response, etag, last_modified)
+
+
+@api_view(["GET"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@use_replica
+def view_leave_balances(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can view balances"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    filters = BalanceFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"status": "failed", "message": filters.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+    year = filters.validated_data["year"]
+
+    # One grouped query per page: balances plus the year's ledger totals.
+    in_year = Q(ledger_entries__year=year)
+    employees = EmployeeProfile.objects.annotate(
+        pending_days=Coalesce(Sum("ledger_entries__pending_days", filter=in_year), 0),
+        approved_days=Coalesce(Sum("ledger_entries__approved_days", filter=in_year), 0),
+    )
+    if "department" in filters.validated_data:
+        employees = employees.filter(department=filters.validated_data["department"])
+
+    paginator = EmployeeCursorPagination()
+    page = paginator.paginate_queryset(employees.values(*BALANCE_ROW.lookups), request)
+    return Response(
+        {
+            "status": "success",
+            "year": year,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "data": BALANCE_ROW.many(page),
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@use_replica
+def export_applications(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can export applications"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    filters = ExportFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"status": "failed", "message": filters.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    output = filters.validated_data["output"]
+    # The export streams after the view returns: keep it on this database.
+    rows = exports.export_rows(bind(filters.filter_queryset(Application.objects.all())))
+    content = exports.blocks(exports.render(rows, output))
+    if isinstance(request._request, ASGIRequest):
+        content = exports.aiterate(content)
+    response = StreamingHttpResponse(content, content_type=exports.FORMATS[output])
+    response["Content-Disposition"] = f'attachment; filename="leave-applications.{output}"'
+    return response
+
+
+
+@api_view(["GET"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@use_replica
+def leave_analytics(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can view analytics"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    filters = AnalyticsFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"status": "failed", "message": filters.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    params = dict(filters.validated_data)
+    group_by = params.pop("group_by")
+    source = params.pop("source")
+    report = analytics.rollup_report if source == "rollup" else analytics.live_report
+    results = report(group_by, **params)
+    return Response(
+        {
+            "status": "success",
+            "source": source,
+            "group_by": group_by,
+            "totals": analytics.totals(results),
+            "data": results,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@use_replica
+def leave_calendar(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can view the calendar"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    filters = CalendarFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"status": "failed", "message": filters.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    params = filters.validated_data
+    statuses = [params["status"]] if "status" in params else None
+    result = availability.calendar(
+        params["date_from"], params["date_to"], params.get("department"), statuses
+    )
+    return Response(
+        {
+            "status": "success",
+            "date_from": params["date_from"],
+            "date_to": params["date_to"],
+            "employees": result["employees"],
+            "applications": result["applications"],
+            "data": result["days"],
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET", "POST"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def holidays(request):
+    # Everyone can see the holidays of a year; only HR can add them
+    if request.method == "POST":
+        if request.user.role != "hr":
+            return Response({"status": "failed", "message": "Only HR can add holidays"},
+                            status=status.HTTP_403_FORBIDDEN)
+        serializer = HolidaySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"status": "failed", "message": serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response({"status": "success", "data": serializer.data},
+                        status=status.HTTP_201_CREATED)
+
+    filters = HolidayFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"status": "failed", "message": filters.errors},
+                        status=status.HTTP_400_BAD_REQUEST)
+    year = filters.validated_data["year"]
+    serializer = HolidaySerializer(Holiday.objects.filter(date__year=year), many=True)
+    return Response({"status": "success", "year": year, "data": serializer.data},
+                    status=status.HTTP_200_OK)
+
+# ---------------------- METRICS ----------------------
+
+@api_view(["GET", "DELETE"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def request_metrics(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can view metrics"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    # Totals are per worker process, since it started or was last reset
+    if request.method == "DELETE":
+        endpoint_stats.reset()
+        return Response({"status": "success", "message": "Request metrics reset"},
+                        status=status.HTTP_200_OK)
+    return Response(
+        {
+            "status": "success",
+            "data": {
+                "endpoints": endpoint_stats.snapshot(),
+                "token_cache": get_token_cache().stats(),
+            },
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def prometheus_metrics(request):
+    if request.user.role != "hr":
+        return Response({"status": "failed", "message": "Only HR can view metrics"},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    # Plain HttpResponse: Prometheus expects its text format, not JSON
+    return HttpResponse(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
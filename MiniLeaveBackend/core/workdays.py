@@ -0,0 +1,125 @@
+"""
+Working-day arithmetic for leave lengths.
+
+Leave is charged for the days of LEAVE_CALENDAR["WORK_WEEK"] (0 = Monday)
+that are not Holiday rows. For every year in use the calendar keeps a
+prefix sum of working days (entry i = working days before day i of the
+year), built with one holiday query per year, so counting the working
+days of any range is two lookups per year it spans.
+
+The prefix sums are cached per process. Holiday changes clear this
+process's cache through core.signals. Other processes pick them up when
+their cache expires after CACHE_TIMEOUT seconds.
+"""
+
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+
+from django.conf import settings
+
+from .models import Holiday
+
+DEFAULTS = {
+    "WORK_WEEK": (0, 1, 2, 3, 4),
+    "CACHE_TIMEOUT": 300,
+}
+
+
+# The longest range one application may cover, so that a request cannot
+# make the calendar load (and cache) holidays for thousands of years.
+MAX_LEAVE_DAYS = 366
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "LEAVE_CALENDAR", {})}
+
+
+def _year_days(year):
+    # Not date(year + 1, 1, 1): it does not exist for date.max.year.
+    return (date(year, 12, 31) - date(year, 1, 1)).days + 1
+
+
+class WorkCalendar:
+    def __init__(self, work_week, timeout=None):
+        self.work_week = frozenset(work_week)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._years = {}
+        self._loaded_at = time.monotonic()
+
+    def holidays(self, year):
+        return set(
+            Holiday.objects.filter(date__year=year).values_list("date", flat=True)
+        )
+
+    def _prefix(self, year):
+        prefix = self._years.get(year)
+        if prefix is not None:
+            return prefix
+        holidays = self.holidays(year)
+        first = date(year, 1, 1)
+        prefix = array("H", [0])
+        for offset in range(_year_days(year)):
+            day = first + timedelta(days=offset)
+            working = day.weekday() in self.work_week and day not in holidays
+            prefix.append(prefix[-1] + working)
+        with self._lock:
+            self._years[year] = prefix
+        return prefix
+
+    def _expire(self):
+        if (
+            self.timeout is not None
+            and time.monotonic() - self._loaded_at > self.timeout
+        ):
+            self.clear()
+
+    def count(self, start, end):
+        """Working days from start to end, both included."""
+        if start > end:
+            return 0
+        self._expire()
+        total = 0
+        for year in range(start.year, end.year + 1):
+            prefix = self._prefix(year)
+            first = start.timetuple().tm_yday - 1 if year == start.year else 0
+            last = end.timetuple().tm_yday if year == end.year else len(prefix) - 1
+            total += prefix[last] - prefix[first]
+        return total
+
+    def clear(self):
+        with self._lock:
+            self._years = {}
+            self._loaded_at = time.monotonic()
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar():
+    global _calendar
+    if _calendar is None:
+        with _calendar_lock:
+            if _calendar is None:
+                options = get_options()
+                _calendar = WorkCalendar(
+                    options["WORK_WEEK"], timeout=options["CACHE_TIMEOUT"]
+                )
+    return _calendar
+
+
+def reset_calendar():
+    """
+    Drop the calendar and its loaded holidays; the next get_calendar()
+    reads WORK_WEEK and CACHE_TIMEOUT again.
+    """
+    global _calendar
+    with _calendar_lock:
+        _calendar = None
+
+
+def count_workdays(start, end):
+    return get_calendar().count(start, end)